@@ -0,0 +1,105 @@
+import os, re, math, logging, threading
+from typing import Callable, List
+
+
+# Окно MiniLM — 256 wordpiece-токенов вместе с [CLS] и [SEP]; текст длиннее модель
+# молча обрезает, поэтому окна считаются токенизатором модели и берутся с запасом
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Токенизатор модели эмбеддингов (tokenizer.json репозитория HuggingFace);
+# по умолчанию — репозиторий EMBEDDING_MODEL
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "") or (
+    EMBEDDING_MODEL if "/" in EMBEDDING_MODEL else f"sentence-transformers/{EMBEDDING_MODEL}")
+
+_PIECE = re.compile(r"[A-Za-z]+|[^\W\d_A-Za-z]+|\S")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценка числа wordpiece-токенов сверху, когда токенизатора нет: знак, цифра
+    и «_» — отдельные токены (как у BERT), латинское слово — токен на каждые
+    3 буквы, прочие буквы (кириллица вне словаря MiniLM) — токен на букву
+    """
+    total = 0
+    for piece in _PIECE.findall(text):
+        if piece[0].isascii() and piece[0].isalpha():
+            total += math.ceil(len(piece) / 3)
+        else:
+            total += len(piece)
+    return total
+
+
+def get_chunk_token_counter() -> Callable[[str], int]:
+    """
+    Подсчёт токенов токенизатором модели эмбеддингов CHUNK_TOKENIZER
+    (загружается один раз на процесс); если он недоступен — estimate_tokens.
+    """
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_pretrained(CHUNK_TOKENIZER)
+                _tokenizer = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+            except Exception as e:
+                logging.error(f"Токенизатор {CHUNK_TOKENIZER} недоступен, окна считаем по оценке: {e}")
+                _tokenizer = estimate_tokens
+    return _tokenizer
+
+
+def iter_chunk_symbols(symbols: List[dict]):
+    """
+    Определения для чанкинга: (индекс, символ, квалифицированное имя родителя).
+    Методы и вложенные классы отдаются отдельно от класса, а вложенные функции
+    остаются внутри тела своей функции и отдельно не эмбеддятся.
+    """
+    for index, symbol in enumerate(symbols):
+        if symbol["nested"]:
+            continue
+        parent = symbol["parent"]
+        yield index, symbol, symbols[parent]["qualname"] if parent is not None else None
+
+
+def class_header(lines: List[str], node: dict, children: List[dict]):
+    """
+    Собственная шапка класса до первого вложенного определения: строка class,
+    докстринг и атрибуты; методы идут отдельными фрагментами. Возвращает
+    (текст, последняя строка шапки) — текст совпадает с диапазоном строк,
+    который RAG читает из исходников.
+    """
+    header_end = node["end_lineno"]
+    for child in children:
+        header_end = min(header_end, child["first_lineno"] - 1)
+    header_end = max(header_end, node["lineno"])
+    return "\n".join(lines[node["lineno"] - 1:header_end]), header_end
+
+
+def split_windows(lines: List[str], start_line: int, max_tokens: int = CHUNK_MAX_TOKENS,
+                  overlap: int = CHUNK_OVERLAP_TOKENS,
+                  count_tokens: Callable[[str], int] = estimate_tokens) -> List[tuple]:
+    """
+    Делим строки на окна не длиннее max_tokens с перекрытием ~overlap токенов.
+    Возвращает [(первая строка, последняя строка, текст)] с номерами строк файла.
+    """
+    costs = [count_tokens(line) + 1 for line in lines]
+    windows = []
+    begin = 0
+    while begin < len(lines):
+        end, total = begin, 0
+        while end < len(lines) and (end == begin or total + costs[end] <= max_tokens):
+            total += costs[end]
+            end += 1
+        windows.append((start_line + begin, start_line + end - 1, "\n".join(lines[begin:end])))
+        if end >= len(lines):
+            break
+        # следующее окно начинается на несколько строк раньше конца текущего
+        back, carried = end, 0
+        while back > begin + 1 and carried + costs[back - 1] <= overlap:
+            back -= 1
+            carried += costs[back]
+        begin = back
+    return windows
@@ -0,0 +1,92 @@
+import re, uuid
+from typing import List
+
+from .chunking import iter_chunk_symbols, class_header, split_windows, get_chunk_token_counter, CHUNK_MAX_TOKENS
+
+
+# Пространство имён для детерминированных id точек Qdrant
+POINT_NAMESPACE = uuid.UUID("5b0f4c1e-3a52-4f4e-9a36-6f1d2c7e8b90")
+
+_NEWLINE = re.compile(rb"\r\n|\r|\n")
+
+
+def point_id(path: str, qualname: str, kind: str) -> str:
+    """Детерминированный id точки: один и тот же фрагмент всегда попадает в ту же точку"""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{path}:{qualname}:{kind}"))
+
+
+def line_offsets(data: bytes) -> List[int]:
+    """Таблица байтовых смещений начала каждой строки (offsets[i] — строка i + 1)"""
+    return [0] + [m.end() for m in _NEWLINE.finditer(data)]
+
+
+def source_segment(data: bytes, offsets: List[int], span: dict) -> str:
+    """
+    Аналог ast.get_source_segment за O(длина фрагмента): col_offset в AST
+    задан в байтах UTF-8, поэтому режем исходные байты по таблице строк.
+    """
+    start = offsets[span["lineno"] - 1] + span["col"]
+    end = offsets[span["end_lineno"] - 1] + span["end_col"]
+    return data[start:end].decode('utf-8')
+
+
+def extract_fragments(data: bytes, symbols: List[dict], context: str) -> list:
+    """Фрагменты для эмбеддингов по готовой таблице символов файла (см. symbols.parse_source)"""
+    offsets = line_offsets(data)  # Одна таблица строк на файл
+    lines = [
+        data[offsets[i]:offsets[i + 1] if i + 1 < len(offsets) else len(data)].decode('utf-8').rstrip("\r\n")
+        for i in range(len(offsets))
+    ]
+    children = {}
+    for symbol in symbols:
+        children.setdefault(symbol["parent"], []).append(symbol)
+
+    count_tokens = get_chunk_token_counter()
+    fragments = []  # Список для хранения фрагментов
+    seen = {}
+    ids = {}
+
+    for index, node, parent in iter_chunk_symbols(symbols):
+        qualname = node["qualname"]
+        kind = node["kind"]  # Тип определения (например, FunctionDef или ClassDef)
+        start = node["lineno"]
+        end = node["end_lineno"]
+
+        # одноимённые определения в файле (например, setter свойства) различаем по порядку
+        seen[(qualname, kind)] = seen.get((qualname, kind), -1) + 1
+        ordinal = seen[(qualname, kind)]
+        key = f"{qualname}#{ordinal}" if ordinal else qualname
+
+        if kind == "ClassDef":
+            # Класс: только шапка до первого метода, методы идут отдельными фрагментами
+            code_seg, end = class_header(lines, node, children.get(index, []))
+        else:
+            # Извлекаем фрагмент исходного кода для функции
+            code_seg = source_segment(data, offsets, node)
+        windows = [(start, end, code_seg)]
+        if count_tokens(code_seg) > CHUNK_MAX_TOKENS:
+            # Длинная функция или шапка класса не влезает в окно модели — режем на перекрывающиеся окна
+            windows = split_windows(lines[start - 1:end], start, count_tokens=count_tokens)
+
+        window_ids = [point_id(context, key, kind)] if len(windows) == 1 else [
+            point_id(context, f"{key}[{idx}]", kind) for idx in range(len(windows))]
+        # методы разрезанного класса ссылаются на его первое окно
+        ids[qualname] = window_ids[0]
+        for idx, (w_start, w_end, text) in enumerate(windows):
+            # Добавляем фрагмент в список
+            fragments.append({
+                "id": window_ids[idx],
+                "name": node["name"],
+                "qualname": qualname,
+                "kind": kind,
+                "path": context,
+                "start_line": w_start,
+                "end_line": w_end,
+                "parent": parent,
+                "parent_id": ids.get(parent),
+                "chunk": idx,
+                "chunks": len(windows),
+                "code": text  # Добавляем сам код
+            })
+
+    return fragments
@@ -0,0 +1,204 @@
+import re, gzip, json, math, bisect, logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.s3.base import get_s3_connection, MINIO_BUCKET
+from common.s3.upload import upload_bytes
+
+
+IDENTIFIERS_FORMAT = 1
+# Порог сходства по триграммам для нечёткого совпадения имён
+IDENTIFIER_FUZZY_THRESHOLD = 0.5
+
+_BACKTICKS = re.compile(r"`([^`]+)`")
+_TERM = re.compile(r"[A-Za-z_][\w]*(?:\.[A-Za-z_]\w*)*")
+
+
+def identifiers_key(project_id: str, commit: str) -> str:
+    return f"{project_id}/identifiers/{commit}.json.gz"
+
+
+def module_name(path: str) -> str:
+    """common/s3/pack.py → common.s3.pack, pkg/__init__.py → pkg"""
+    module = path[:-len(".py")] if path.endswith(".py") else path
+    if module.endswith("/__init__"):
+        module = module[:-len("/__init__")]
+    return module.replace("/", ".")
+
+
+def build_identifiers(snapshot: dict) -> dict:
+    """
+    Индекс идентификаторов проекта по снимку разбора: все определения с
+    путём и диапазоном строк. Для класса диапазон — его шапка до первого
+    вложенного определения, как во фрагменте класса при индексации.
+    """
+    entries = []
+    # обход снимка идёт по путям в порядке сортировки, шард за шардом
+    for path, file in snapshot["files"].items():
+        symbols = file.get("symbols", [])
+        children = defaultdict(list)
+        for symbol in symbols:
+            children[symbol["parent"]].append(symbol)
+        for index, symbol in enumerate(symbols):
+            end = symbol["end_lineno"]
+            if symbol["kind"] == "ClassDef":
+                end = max(min([end] + [c["first_lineno"] - 1 for c in children[index]]), symbol["lineno"])
+            entries.append({
+                "name": symbol["name"],
+                "qualname": symbol["qualname"],
+                "kind": symbol["kind"],
+                "path": path,
+                "start_line": symbol["lineno"],
+                "end_line": end,
+            })
+    return {"format": IDENTIFIERS_FORMAT, "commit": snapshot["commit"], "entries": entries}
+
+
+def save_identifiers(project_id: str, identifiers: dict):
+    data = gzip.compress(json.dumps(identifiers, separators=(",", ":")).encode("utf-8"), mtime=0)
+    upload_bytes(get_s3_connection(), MINIO_BUCKET, identifiers_key(project_id, identifiers["commit"]), data,
+                 content_type="application/gzip")
+
+
+def load_identifiers(project_id: str, commit: str) -> Optional[dict]:
+    """Индекс идентификаторов коммита; None, если его нет или формат устарел"""
+    minio_client = get_s3_connection()
+    try:
+        response = minio_client.get_object(MINIO_BUCKET, identifiers_key(project_id, commit))
+        try:
+            identifiers = json.loads(gzip.decompress(response.read()).decode("utf-8"))
+        finally:
+            response.close()
+            response.release_conn()
+    except Exception as e:
+        logging.info(f"Индекс идентификаторов проекта {project_id} не найден: {e}")
+        return None
+    if identifiers.get("format") != IDENTIFIERS_FORMAT:
+        return None
+    return identifiers
+
+
+def query_terms(query: str) -> List[str]:
+    """
+    Идентификаторы в запросе: содержимое `кавычек`, иначе слова, похожие на
+    имена из кода (с точкой, подчёркиванием или CamelCase). Запрос из одного
+    слова считается идентификатором целиком.
+    """
+    quoted = [term.strip().rstrip("()") for term in _BACKTICKS.findall(query)]
+    if quoted:
+        return [term for term in quoted if _TERM.fullmatch(term)]
+    words = _TERM.findall(query)
+    if len(words) == 1 and query.strip().rstrip("()?") == words[0]:
+        return words
+    return [w for w in words if code_like(w)]
+
+
+def code_like(term: str) -> bool:
+    """Имя, которое не спутать с обычным словом: с точкой, подчёркиванием или CamelCase"""
+    return "." in term or "_" in term.strip("_") or bool(re.search(r"[a-z][A-Z]", term))
+
+
+def _trigrams(text: str) -> set:
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class IdentifierIndex:
+    """
+    Поиск определений по имени: точное совпадение (name, qualname,
+    module.qualname и последний компонент модуля + qualname), префикс по
+    отсортированным ключам в нижнем регистре и нечёткий поиск по триграммам.
+    """
+    def __init__(self, identifiers: dict):
+        self.entries: List[dict] = identifiers["entries"]
+        self.exact: Dict[str, List[int]] = defaultdict(list)
+        for i, entry in enumerate(self.entries):
+            module = module_name(entry["path"])
+            for key in {entry["name"], entry["qualname"], f"{module}.{entry['qualname']}",
+                        f"{module.rsplit('.', 1)[-1]}.{entry['qualname']}"}:
+                self.exact[key].append(i)
+
+        self.lower: Dict[str, List[int]] = defaultdict(list)
+        for key, ids in self.exact.items():
+            self.lower[key.lower()].extend(ids)
+        self.keys = sorted(self.lower)
+
+        self.trigrams: Dict[str, List[int]] = defaultdict(list)
+        for k, key in enumerate(self.keys):
+            for gram in _trigrams(key):
+                self.trigrams[gram].append(k)
+
+    def _rank(self, ids: List[int], term: str) -> List[int]:
+        # сначала полное совпадение квалифицированного имени, затем короткие пути
+        unique = list(dict.fromkeys(ids))
+        return sorted(unique, key=lambda i: (self.entries[i]["qualname"] != term, len(self.entries[i]["path"]),
+                                             self.entries[i]["path"], self.entries[i]["start_line"]))
+
+    def lookup(self, term: str) -> List[int]:
+        """Точные совпадения (с учётом регистра, иначе без него)"""
+        ids = self.exact.get(term) or self.lower.get(term.lower(), [])
+        return self._rank(ids, term)
+
+    def prefix(self, term: str, limit: int) -> List[int]:
+        term = term.lower()
+        ids = []
+        start = bisect.bisect_left(self.keys, term)
+        for key in self.keys[start:]:
+            if not key.startswith(term) or len(ids) >= limit:
+                break
+            ids.extend(self.lower[key])
+        return self._rank(ids, term)[:limit]
+
+    def fuzzy(self, term: str, limit: int) -> List[int]:
+        """
+        Ключи с коэффициентом Жаккара по триграммам не ниже порога. Кандидаты
+        берутся из списков самых редких триграмм запроса: при пороге t у
+        подходящего ключа общих триграмм не меньше t * |триграммы запроса|.
+        """
+        grams = sorted(_trigrams(term.lower()), key=lambda gram: len(self.trigrams.get(gram, ())))
+        probe = len(grams) - math.ceil(IDENTIFIER_FUZZY_THRESHOLD * len(grams)) + 1
+        candidates = set()
+        for gram in grams[:probe]:
+            candidates.update(self.trigrams.get(gram, ()))
+        grams = set(grams)
+        scored = []
+        for k in candidates:
+            key_grams = _trigrams(self.keys[k])
+            common = len(grams & key_grams)
+            score = common / (len(grams) + len(key_grams) - common)
+            if score >= IDENTIFIER_FUZZY_THRESHOLD:
+                scored.append((-score, self.keys[k]))
+        ids = []
+        for _, key in sorted(scored)[:limit]:
+            ids.extend(self.lower[key])
+        return list(dict.fromkeys(ids))[:limit]
+
+    def _accepted(self, ids: List[int], accept: Optional[Callable[[dict], bool]]) -> List[int]:
+        return [i for i in ids if accept(self.entries[i])] if accept else ids
+
+    def search(self, query: str, limit: int,
+               accept: Optional[Callable[[dict], bool]] = None) -> Tuple[List[dict], bool]:
+        """
+        Определения для запроса и признак точного ответа: True — каждый
+        идентификатор запроса в `кавычках` или похож на имя из кода и найден
+        точно, векторный поиск не нужен; False — кандидаты (префиксные,
+        нечёткие или точные для одного обычного слова вроде «auth») для
+        слияния с векторным поиском. accept ограничивает область поиска.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+        quoted = bool(_BACKTICKS.search(query))
+        exact_ids, other_ids = [], []
+        matched = True
+        for term in terms:
+            ids = self._accepted(self.lookup(term), accept)
+            if ids:
+                exact_ids.extend(ids)
+                matched = matched and (quoted or code_like(term))
+                continue
+            matched = False
+            other_ids.extend(self._accepted(self.prefix(term, limit), accept)
+                             or self._accepted(self.fuzzy(term, limit), accept))
+        ids = list(dict.fromkeys(exact_ids + other_ids))[:limit]
+        return [self.entries[i] for i in ids], matched
@@ -5,9 +5,10 @@ import ast
 import git
 from pathlib import Path
 import networkx as nx
-from sentence_transformers import SentenceTransformer
 import faiss
 
+from common.embeddings.base import get_encoder
+
 class CacheManager:
     """
     Управление кэшированными AST и метаданными (Git-хеши файлов).
@@ -112,12 +113,12 @@ class CodeParser:
 class Indexer:
     """Построение FAISS-индекса эмбеддингов AST-фрагментов и узлов графа."""
     def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+        self.encoder = get_encoder(model_name)
         self.index = None
         self.metadata = []
 
     def build_index(self, texts):
-        embeddings = self.model.encode(texts, batch_size=32, convert_to_numpy=True)
+        embeddings = self.encoder.encode(texts)
         faiss.normalize_L2(embeddings)
         dim = embeddings.shape[1]
         self.index = faiss.IndexFlatIP(dim)
@@ -0,0 +1,340 @@
+import os, io, gzip, json, time, fcntl, hashlib, logging, posixpath, tempfile, threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from git import Repo
+
+from common.s3.base import get_s3_connection, MINIO_BUCKET
+from common.s3.upload import remove_keys
+from common.s3.projects import snapshot_prefix
+from common.vcs.clone import GIT_MIRROR_DIR, mirror_path, resolve_ref, checkout, release, extension_patterns
+from common.pipeline.stages import iter_processes
+from .symbols import read_source, parse_source, is_toplevel
+
+
+# Версия формата снимка: при несовместимом изменении таблиц снимки пересобираются
+SNAPSHOT_FORMAT = 2
+# Сколько последних снимков репозитория храним; более старые удаляются после сохранения нового
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+# Число процессов для параллельного разбора AST (0 — по числу ядер)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+# Таблицы файлов лежат шардами в среднем по N файлов. Границы шардов задаёт хеш
+# пути, поэтому правка файла меняет только его шард, остальные переиспользуются
+SNAPSHOT_SHARD_FILES = int(os.getenv("SNAPSHOT_SHARD_FILES", "256"))
+# Сколько шардов снимка держим в памяти процесса
+SNAPSHOT_SHARD_CACHE = int(os.getenv("SNAPSHOT_SHARD_CACHE", "4"))
+# Шард без ссылок из хранимых снимков удаляется не раньше, чем через N секунд:
+# его может записывать сборка снимка, ещё не сохранившая индекс
+SNAPSHOT_SHARD_GRACE = 3600
+
+
+def _snapshot_key(url: str, commit: str) -> str:
+    return f"{snapshot_prefix(url)}{commit}.json.gz"
+
+
+def _shard_key(url: str, digest: str) -> str:
+    return f"{snapshot_prefix(url)}shards/{digest}.json.gz"
+
+
+def _read_json_gz(key: str):
+    minio_client = get_s3_connection()
+    response = minio_client.get_object(MINIO_BUCKET, key)
+    try:
+        return json.loads(gzip.decompress(response.read()).decode("utf-8"))
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def _put_json_gz(key: str, value):
+    data = gzip.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), mtime=0)
+    get_s3_connection().put_object(MINIO_BUCKET, key, io.BytesIO(data), len(data), content_type="application/gzip")
+
+
+def parse_file(file_path: str) -> dict:
+    """Таблицы одного файла (см. symbols.parse_source) или {"error": ...}"""
+    try:
+        return parse_source(read_source(file_path))
+    except (OSError, SyntaxError, ValueError) as e:
+        return {"error": str(e)}
+
+
+def blob_hashes(repo_dir: str) -> dict:
+    """Git blob-хеши всех .py файлов в HEAD репозитория"""
+    repo = Repo(repo_dir)
+    return {
+        item.path: item.hexsha
+        for item in repo.head.commit.tree.traverse()
+        # символические ссылки (0o120000) не содержат кода
+        if item.type == "blob" and item.mode != 0o120000 and item.path.endswith('.py')
+    }
+
+
+def plan_shards(paths: List[str], shard_files: int = SNAPSHOT_SHARD_FILES) -> List[List[str]]:
+    """
+    Делим отсортированные пути на шарды: шард заканчивается на пути, хеш
+    которого делится на shard_files. Добавление или удаление файла сдвигает
+    границу только у соседнего шарда; слишком длинный шард режется принудительно.
+    """
+    shards, current = [], []
+    for path in sorted(paths):
+        current.append(path)
+        if int(hashlib.sha1(path.encode("utf-8")).hexdigest()[:8], 16) % shard_files == 0 \
+                or len(current) >= 4 * shard_files:
+            shards.append(current)
+            current = []
+    if current:
+        shards.append(current)
+    return shards
+
+
+def shard_digest(paths: List[str], hashes: Dict[str, str]) -> str:
+    """Адрес шарда: формат, пути и blob-хеши его файлов"""
+    content = json.dumps([SNAPSHOT_FORMAT, [[path, hashes[path]] for path in paths]])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class SnapshotFiles(Mapping):
+    """
+    Таблицы файлов снимка: путь → {"sha", "symbols", ...}. Шард читается из
+    Minio при первом обращении к его файлу, в памяти держатся последние
+    SNAPSHOT_SHARD_CACHE шардов. Обход идёт по путям в порядке сортировки,
+    то есть шард за шардом.
+    """
+    def __init__(self, url: str, index: dict):
+        self.url = url
+        self.shards: List[str] = index["shards"]
+        self.index: Dict[str, list] = index["files"]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, path: str) -> dict:
+        sha, shard = self.index[path]
+        return {"sha": sha, **self._shard(shard)[path]}
+
+    def __contains__(self, path) -> bool:
+        return path in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def sha(self, path: str) -> str:
+        return self.index[path][0]
+
+    def shas(self) -> Dict[str, str]:
+        """Blob-хеши всех файлов без чтения шардов"""
+        return {path: sha for path, (sha, _) in self.index.items()}
+
+    def _shard(self, shard: int) -> dict:
+        digest = self.shards[shard]
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+            tables = _read_json_gz(_shard_key(self.url, digest))
+            self._cache[digest] = tables
+            while len(self._cache) > SNAPSHOT_SHARD_CACHE:
+                self._cache.popitem(last=False)
+            return tables
+
+
+def build_snapshot(url: str, repo_dir: str, previous: Optional[SnapshotFiles] = None,
+                   workers: int = PARSE_WORKERS, shard_files: int = SNAPSHOT_SHARD_FILES) -> dict:
+    """
+    Собираем индекс снимка worktree repo_dir и записываем в Minio его новые
+    шарды. Шарды предыдущего снимка previous с тем же содержимым переиспользуются
+    как есть, а в изменённых шардах таблицы файлов с прежним blob-хешем копируются
+    из previous: пулом процессов разбираются только изменённые файлы. В памяти
+    одновременно находится один собираемый шард.
+    """
+    hashes = blob_hashes(repo_dir)
+    shards = plan_shards(list(hashes), shard_files)
+    digests = [shard_digest(paths, hashes) for paths in shards]
+    known = set(previous.shards) if previous is not None else set()
+    fresh = [n for n, digest in enumerate(digests) if digest not in known]
+
+    def unchanged(path: str) -> bool:
+        return previous is not None and path in previous and previous.sha(path) == hashes[path]
+
+    to_parse = [path for n in fresh for path in shards[n] if not unchanged(path)]
+    parsed = zip(to_parse, iter_processes(parse_file, (os.path.join(repo_dir, path) for path in to_parse),
+                                          workers=workers))
+    for n in fresh:
+        tables = {}
+        for path in shards[n]:
+            if unchanged(path):
+                tables[path] = {k: v for k, v in previous[path].items() if k != "sha"}
+                continue
+            _, tables[path] = next(parsed)
+            if "error" in tables[path]:
+                logging.error(f"Не удалось разобрать {path}: {tables[path]['error']}")
+        # шард записываем заново, даже если такой уже есть: свежая дата защищает его от prune_snapshots
+        _put_json_gz(_shard_key(url, digests[n]), tables)
+
+    logging.info(f"Снимок {repo_dir}: {len(hashes)} файлов, разобрано {len(to_parse)}, "
+                 f"новых шардов {len(fresh)} из {len(shards)}")
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "commit": Repo(repo_dir).head.commit.hexsha,
+        "created_at": time.time(),
+        "shards": digests,
+        "files": {path: [hashes[path], n] for n, paths in enumerate(shards) for path in paths},
+    }
+
+
+def _open(url: str, index: dict) -> dict:
+    return {
+        "format": index["format"],
+        "commit": index["commit"],
+        "created_at": index["created_at"],
+        "files": SnapshotFiles(url, index),
+    }
+
+
+def load_snapshot(url: str, commit: str) -> Optional[dict]:
+    """Снимок коммита из Minio; None, если его нет или формат устарел"""
+    try:
+        index = _read_json_gz(_snapshot_key(url, commit))
+    except Exception as e:
+        logging.info(f"Снимок {commit} для {url} не найден: {e}")
+        return None
+    if index.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return _open(url, index)
+
+
+def _snapshot_objects(url: str) -> list:
+    """Индексы снимков репозитория, от новых к старым"""
+    minio_client = get_s3_connection()
+    objects = minio_client.list_objects(MINIO_BUCKET, prefix=snapshot_prefix(url))
+    objects = [obj for obj in objects if not obj.is_dir and obj.object_name.endswith(".json.gz")]
+    return sorted(objects, key=lambda obj: obj.last_modified, reverse=True)
+
+
+def latest_snapshot(url: str) -> Optional[dict]:
+    """Последний сохранённый снимок репозитория (база для инкрементальной сборки)"""
+    try:
+        for obj in _snapshot_objects(url):
+            commit = posixpath.basename(obj.object_name)[:-len(".json.gz")]
+            snapshot = load_snapshot(url, commit)
+            if snapshot is not None:
+                return snapshot
+    except Exception as e:
+        logging.info(f"Снимки {url} недоступны: {e}")
+    return None
+
+
+def save_snapshot(url: str, index: dict):
+    """Сохраняем индекс снимка; его шарды уже записаны build_snapshot"""
+    _put_json_gz(_snapshot_key(url, index["commit"]), index)
+
+
+def prune_snapshots(url: str, keep: int = SNAPSHOT_KEEP) -> int:
+    """
+    Удаляем снимки репозитория, кроме keep последних по времени записи, и
+    шарды, на которые не ссылается ни один оставшийся снимок. Сервис, которому
+    понадобится удалённый снимок, соберёт его заново.
+    """
+    minio_client = get_s3_connection()
+    objects = _snapshot_objects(url)
+    stale = [obj.object_name for obj in objects[keep:]]
+    referenced = set()
+    for obj in objects[:keep]:
+        referenced.update(_read_json_gz(obj.object_name).get("shards", []))
+    now = time.time()
+    for obj in minio_client.list_objects(MINIO_BUCKET, prefix=f"{snapshot_prefix(url)}shards/",
+                                         recursive=True):
+        digest = posixpath.basename(obj.object_name)[:-len(".json.gz")]
+        if digest not in referenced and now - obj.last_modified.timestamp() > SNAPSHOT_SHARD_GRACE:
+            stale.append(obj.object_name)
+    return remove_keys(minio_client, MINIO_BUCKET, stale)
+
+
+@contextmanager
+def _snapshot_lock(url: str):
+    """Снимок одного коммита собирает только один сервис, остальные ждут и читают готовый"""
+    os.makedirs(GIT_MIRROR_DIR, exist_ok=True)
+    with open(mirror_path(url) + ".snapshot.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def get_snapshot(url: str, repo_dir: str = None) -> dict:
+    """
+    Снимок разбора репозитория для коммита: worktree repo_dir, если он уже
+    есть у вызывающего, иначе HEAD зеркала. Собирается один раз на коммит
+    (инкрементально от последнего снимка) и дальше читается из Minio всеми
+    сервисами; таблицы файлов подгружаются шардами по мере обращения.
+    """
+    commit = Repo(repo_dir).head.commit.hexsha if repo_dir else resolve_ref(url)
+    snapshot = load_snapshot(url, commit)
+    if snapshot is not None:
+        return snapshot
+
+    with _snapshot_lock(url):
+        snapshot = load_snapshot(url, commit)
+        if snapshot is not None:
+            return snapshot
+        previous = latest_snapshot(url)
+        previous_files = previous["files"] if previous else None
+        if repo_dir:
+            index = build_snapshot(url, repo_dir, previous_files)
+        else:
+            work_dir = tempfile.mkdtemp(prefix="snapshot-")
+            try:
+                checkout(url, work_dir, extension_patterns(['.py']), ref=commit)
+                index = build_snapshot(url, work_dir, previous_files)
+            finally:
+                release(url, work_dir)
+        save_snapshot(url, index)
+        try:
+            prune_snapshots(url)
+        except Exception as e:
+            logging.error(f"Не удалось удалить старые снимки {url}: {e}")
+    return _open(url, index)
+
+
+def import_targets(snapshot: dict, path: str) -> List[str]:
+    """Файлы репозитория, которые импортирует модуль (модуль a.b → a/b.py от корня)"""
+    targets = []
+    for imp in snapshot["files"][path].get("imports", []):
+        if not imp["module"]:
+            continue
+        target = posixpath.normpath(imp["module"].replace(".", "/") + ".py")
+        if target in snapshot["files"]:
+            targets.append(target)
+    return targets
+
+
+def call_edges(file: dict) -> List[tuple]:
+    """
+    Вызовы по простому имени (callee без точки) в виде (вызывающий, вызываемый).
+    Вызывающий — функция верхнего уровня или метод класса верхнего уровня,
+    внутри которых находится вызов, включая вложенные определения.
+    """
+    symbols = file.get("symbols", [])
+    edges = []
+    for call in file.get("calls", []):
+        if "." in call["name"] or call["scope"] is None:
+            continue
+        chain = []
+        index = call["scope"]
+        while index is not None:
+            chain.append(index)
+            index = symbols[index]["parent"]
+        outer = symbols[chain[-1]]
+        if not is_toplevel(outer):
+            continue
+        if outer["kind"] != "ClassDef":
+            edges.append((outer["name"], call["name"]))
+        elif len(chain) > 1 and symbols[chain[-2]]["kind"] != "ClassDef":
+            edges.append((symbols[chain[-2]]["name"], call["name"]))
+    return edges
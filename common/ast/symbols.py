@@ -0,0 +1,134 @@
+import ast, codecs
+from typing import List, Optional
+
+
+DEF_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def read_source(file_path: str) -> bytes:
+    """Читаем исходник байтами; BOM не входит в col_offset первой строки, поэтому срезаем его"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    return data
+
+
+def dotted_name(node: ast.AST) -> Optional[str]:
+    """Имя вида a.b.c для Name/Attribute, None для остальных выражений"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = dotted_name(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+
+class _Collector(ast.NodeVisitor):
+    """
+    Один проход по AST модуля: определения со спанами, импорты, вызовы и
+    присваивания. Связи задаются индексами в списке symbols (scope/parent —
+    ближайшее объемлющее определение), чтобы одноимённые определения не путались.
+    """
+    def __init__(self):
+        self.symbols: List[dict] = []
+        self.imports: List[dict] = []
+        self.calls: List[dict] = []
+        self.variables: List[dict] = []
+        self.stack: List[int] = []
+
+    def scope(self) -> Optional[int]:
+        return self.stack[-1] if self.stack else None
+
+    def visit_def(self, node):
+        parent = self.scope()
+        parent_symbol = self.symbols[parent] if parent is not None else None
+        symbol = {
+            "name": node.name,
+            "qualname": f"{parent_symbol['qualname']}.{node.name}" if parent_symbol else node.name,
+            "kind": type(node).__name__,
+            "lineno": node.lineno,
+            "col": node.col_offset,
+            "end_lineno": node.end_lineno,
+            "end_col": node.end_col_offset,
+            # первая строка с учётом декораторов и первая строка тела
+            "first_lineno": min([node.lineno] + [d.lineno for d in node.decorator_list]),
+            "body_lineno": node.body[0].lineno,
+            "parent": parent,
+            # определение внутри функции (в том числе через класс) — часть её тела
+            "nested": bool(parent_symbol and (parent_symbol["nested"] or parent_symbol["kind"] != "ClassDef")),
+            "docstring": ast.get_docstring(node),
+            "decorators": [dotted_name(d.func if isinstance(d, ast.Call) else d) for d in node.decorator_list],
+        }
+        if isinstance(node, ast.ClassDef):
+            symbol["bases"] = [dotted_name(b) for b in node.bases]
+        elif node.name.startswith("test_"):
+            symbol["asserts"] = [n.lineno for n in ast.walk(node) if isinstance(n, ast.Assert)]
+
+        self.symbols.append(symbol)
+        self.stack.append(len(self.symbols) - 1)
+        self.generic_visit(node)
+        self.stack.pop()
+
+    visit_FunctionDef = visit_def
+    visit_AsyncFunctionDef = visit_def
+    visit_ClassDef = visit_def
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append({"module": alias.name, "names": [], "level": 0,
+                                 "lineno": node.lineno, "scope": self.scope()})
+
+    def visit_ImportFrom(self, node):
+        self.imports.append({"module": node.module, "names": [alias.name for alias in node.names],
+                             "level": node.level, "lineno": node.lineno, "scope": self.scope()})
+
+    def visit_Call(self, node):
+        name = dotted_name(node.func)
+        if name:
+            self.calls.append({"name": name, "lineno": node.lineno, "scope": self.scope()})
+        self.generic_visit(node)
+
+    def _variables(self, targets, lineno: int):
+        for target in targets:
+            if isinstance(target, ast.Name):
+                self.variables.append({"name": target.id, "lineno": lineno, "scope": self.scope()})
+
+    def visit_Assign(self, node):
+        self._variables(node.targets, node.lineno)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        self._variables([node.target], node.lineno)
+        self.generic_visit(node)
+
+
+def parse_source(data: bytes) -> dict:
+    """
+    Разбор модуля в сериализуемые таблицы: docstring, symbols, imports,
+    calls, variables. Бросает SyntaxError/ValueError для некорректного кода.
+    """
+    tree = ast.parse(data)
+    collector = _Collector()
+    collector.visit(tree)
+    return {
+        "docstring": ast.get_docstring(tree),
+        "symbols": collector.symbols,
+        "imports": collector.imports,
+        "calls": collector.calls,
+        "variables": collector.variables,
+    }
+
+
+def is_toplevel(symbol: dict) -> bool:
+    """Определение непосредственно в теле модуля (не внутри if/try и т.п.)"""
+    return symbol["parent"] is None and symbol["col"] == 0
+
+
+def enclosing(symbols: List[dict], index: Optional[int], kinds: tuple) -> Optional[int]:
+    """Ближайшее объемлющее определение одного из видов kinds, начиная с index"""
+    while index is not None:
+        if symbols[index]["kind"] in kinds:
+            return index
+        index = symbols[index]["parent"]
+    return None
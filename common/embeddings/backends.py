@@ -0,0 +1,189 @@
+import os, json, logging
+from typing import List
+
+import numpy as np
+
+
+# torch — SentenceTransformer на PyTorch, onnx — ONNX Runtime с int8-квантованием
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Файл ONNX-модели в репозитории HuggingFace и нужно ли квантовать его при загрузке
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "1") == "1"
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+
+
+def _repo_id(model_name: str) -> str:
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+class TorchBackend:
+    """Исходный путь: SentenceTransformer на PyTorch"""
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class OnnxBackend:
+    """
+    Та же модель в ONNX Runtime без torch: токенизация через tokenizers,
+    затем пулинг и нормализация как в конфигурации sentence-transformers.
+    Веса динамически квантуются в int8 при первой загрузке.
+    """
+    name = "onnx"
+
+    def __init__(self, model_name: str, onnx_file: str = EMBEDDING_ONNX_FILE,
+                 quantize: bool = EMBEDDING_ONNX_QUANTIZE):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        repo_id = _repo_id(model_name)
+
+        def download(filename: str):
+            try:
+                return hf_hub_download(repo_id, filename)
+            except Exception:
+                return None
+
+        model_path = hf_hub_download(repo_id, onnx_file)
+        if quantize:
+            model_path = self._quantize(model_path)
+
+        # Параметры пулинга и длины последовательности из конфигурации sentence-transformers
+        st_config = self._read_json(download("sentence_bert_config.json"))
+        pooling = self._read_json(download("1_Pooling/config.json"))
+        modules = self._read_json(download("modules.json")) or []
+        self.max_length = st_config.get("max_seq_length", 256)
+        self.cls_pooling = bool(pooling.get("pooling_mode_cls_token"))
+        self.normalize = any(m.get("type", "").endswith("Normalize") for m in modules)
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repo_id, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        if EMBEDDING_ONNX_THREADS:
+            options.intra_op_num_threads = EMBEDDING_ONNX_THREADS
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _read_json(path) -> dict:
+        if not path:
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _quantize(model_path: str) -> str:
+        """Динамическое int8-квантование весов; результат кэшируется рядом с исходной моделью"""
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantized = model_path[:-len(".onnx")] + "_qint8.onnx"
+        if not os.path.exists(quantized):
+            logging.info(f"Квантуем {model_path} в int8")
+            quantize_dynamic(model_path, quantized, weight_type=QuantType.QInt8)
+        return quantized
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Сортируем по длине, чтобы в пачке было меньше паддинга
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            for i, vector in zip(idx, self._encode_batch([texts[i] for i in idx])):
+                result[i] = vector
+        return np.vstack(result).astype(np.float32)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        if self.cls_pooling:
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def backend_variant(backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    Вариант вычисления эмбеддингов: векторы одной модели в разных бэкендах
+    (fp32 и int8) близки, но не совпадают, поэтому вариант входит в ключ
+    кэша эмбеддингов и в имя версии коллекции
+    """
+    if backend == "onnx" and EMBEDDING_ONNX_QUANTIZE:
+        return "onnx-int8"
+    return backend
+
+
+def load_backend(model_name: str, backend: str = EMBEDDING_BACKEND):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return BACKENDS[backend](model_name)
+
+
+PARITY_TEXTS = [
+    "def add(a, b):\n    return a + b",
+    "class UserRepository:\n    def get(self, user_id):\n        return self.session.get(User, user_id)",
+    "async def fetch(url):\n    async with httpx.AsyncClient() as client:\n        return await client.get(url)",
+    "Где обрабатывается авторизация пользователя?",
+    "how is the qdrant collection created",
+]
+
+
+def check_parity(model_name: str, candidate: str = "onnx", reference: str = "torch",
+                 texts: List[str] = PARITY_TEXTS, threshold: float = 0.99) -> dict:
+    """Сравниваем эмбеддинги двух бэкендов: косинусная близость каждой пары не ниже threshold"""
+    expected = load_backend(model_name, reference).encode(texts)
+    actual = load_backend(model_name, candidate).encode(texts)
+    expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+    actual = actual / np.linalg.norm(actual, axis=1, keepdims=True)
+    cosines = (expected * actual).sum(axis=1)
+    return {
+        "reference": reference,
+        "candidate": candidate,
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "passed": bool(cosines.min() >= threshold),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .base import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Проверка паритета эмбеддингов между бэкендами")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--candidate", default="onnx", choices=sorted(BACKENDS))
+    parser.add_argument("--reference", default="torch", choices=sorted(BACKENDS))
+    parser.add_argument("--threshold", type=float, default=0.99)
+    args = parser.parse_args()
+
+    report = check_parity(args.model, args.candidate, args.reference, threshold=args.threshold)
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if report["passed"] else 1)
@@ -0,0 +1,83 @@
+import os
+from typing import List
+
+import numpy as np
+import requests
+
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_URL = os.getenv("EMBEDDING_URL", "").rstrip("/")
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "60"))
+
+
+def _same_model(a: str, b: str) -> bool:
+    # "sentence-transformers/all-MiniLM-L6-v2" и "all-MiniLM-L6-v2" — одна модель
+    return a.split("/")[-1] == b.split("/")[-1]
+
+
+class RemoteEncoder:
+    """Клиент общего сервиса эмбеддингов (embedding/embedding_service.py)"""
+    def __init__(self, url: str, model_name: str):
+        self.url = url
+        self.model_name = model_name
+        self.session = requests.Session()
+        self._variant = None
+
+    @property
+    def variant(self) -> str:
+        """Вариант бэкенда сервиса (torch, onnx-int8, ...), запрашивается один раз"""
+        if self._variant is None:
+            response = self.session.get(f"{self.url}/info", timeout=EMBEDDING_TIMEOUT)
+            response.raise_for_status()
+            self._variant = response.json()["variant"]
+        return self._variant
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        response = self.session.post(
+            f"{self.url}/encode",
+            json={"texts": list(texts)},
+            timeout=EMBEDDING_TIMEOUT,
+        )
+        response.raise_for_status()
+        data = response.json()
+        # векторы другой модели попали бы в кэш и коллекцию под чужим именем модели
+        if not _same_model(data["model"], self.model_name):
+            raise RuntimeError(f"Сервис эмбеддингов {self.url} использует модель {data['model']}, "
+                               f"а клиент ожидает {self.model_name}: проверьте EMBEDDING_MODEL")
+        if self._variant is not None and data["variant"] != self._variant:
+            # сервис перезапущен с другим бэкендом: векторы легли бы в кэш под прежним вариантом
+            raise RuntimeError(f"Сервис эмбеддингов {self.url} сменил бэкенд: {self._variant} → {data['variant']}")
+        return np.asarray(data["embeddings"], dtype=np.float32)
+
+
+_encoders = {}
+
+
+def get_encoder(model_name: str = EMBEDDING_MODEL):
+    """
+    Единая точка получения энкодера: при заданном EMBEDDING_URL — общий сервис
+    эмбеддингов, иначе одна на процесс локальная модель с динамическим батчингом.
+    """
+    if model_name not in _encoders:
+        if EMBEDDING_URL and _same_model(model_name, EMBEDDING_MODEL):
+            _encoders[model_name] = RemoteEncoder(EMBEDDING_URL, model_name)
+        else:
+            from .engine import BatchingEncoder
+            _encoders[model_name] = BatchingEncoder(
+                model_name,
+                max_batch=EMBEDDING_MAX_BATCH,
+                max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+            )
+    return _encoders[model_name]
+
+
+_dims = {}
+
+
+def embedding_dim(model_name: str = EMBEDDING_MODEL) -> int:
+    """Размерность векторов модели (одно пробное кодирование на процесс)"""
+    if model_name not in _dims:
+        _dims[model_name] = int(np.asarray(get_encoder(model_name).encode(["dim"])).shape[1])
+    return _dims[model_name]
@@ -0,0 +1,144 @@
+import os, time, hashlib, sqlite3, logging, threading
+from typing import List, Optional
+
+import numpy as np
+
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/var/cache/embeddings/cache.sqlite")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048"))
+
+
+def normalize_code(text: str) -> str:
+    """Нормализация перед хешированием: переводы строк и хвостовые пробелы не влияют на ключ"""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def cache_key(model_name: str, variant: str, text: str) -> str:
+    """Ключ — модель, вариант бэкенда (torch, onnx-int8) и хеш нормализованного текста"""
+    digest = hashlib.sha256(normalize_code(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{variant}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Контентно-адресуемый кэш эмбеддингов на диске (SQLite), общий для всех проектов.
+    Ключ — (модель, вариант бэкенда, sha256 нормализованного кода); при превышении лимита
+    вытесняются давно не использованные записи (LRU).
+    """
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET used = ? WHERE key = ?", [(now, k) for k in found])
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        now = time.time()
+        rows = []
+        for key, vector in zip(keys, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            for key, blob, size, used in rows:
+                cur = self._db.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, used) VALUES (?, ?, ?, ?)",
+                    (key, blob, size, used),
+                )
+                self._size += size * cur.rowcount
+            self._db.commit()
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Вытесняем самые старые записи, пока кэш не займёт 90% лимита"""
+        target = int(self.max_bytes * 0.9)
+        while self._size > target:
+            rows = self._db.execute("SELECT key, size FROM embeddings ORDER BY used LIMIT 1000").fetchall()
+            if not rows:
+                self._size = 0
+                break
+            freed = []
+            for key, size in rows:
+                freed.append((key,))
+                self._size -= size
+                if self._size <= target:
+                    break
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", freed)
+            self.evictions += len(freed)
+        self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def cached_encode(cache: Optional[EmbeddingCache], model_name: str, texts: List[str], encoder) -> np.ndarray:
+    """Эмбеддинги текстов: из кэша, а недостающие — через encoder.encode с последующим сохранением"""
+    if cache is None:
+        return np.asarray(encoder.encode(texts), dtype=np.float32)
+
+    keys = [cache_key(model_name, encoder.variant, text) for text in texts]
+    cached = cache.get_many(keys)
+
+    # одинаковые тексты внутри пачки кодируем один раз
+    missing = {}
+    for idx, vector in enumerate(cached):
+        if vector is None:
+            missing.setdefault(keys[idx], idx)
+    if missing:
+        fresh = np.asarray(encoder.encode([texts[idx] for idx in missing.values()]), dtype=np.float32)
+        cache.put_many(list(missing), fresh)
+        by_key = dict(zip(missing, fresh))
+        cached = [vector if vector is not None else by_key[key] for key, vector in zip(keys, cached)]
+
+    return np.vstack(cached).astype(np.float32)
+
+
+_caches = {}
+
+
+def get_embedding_cache(path: str = EMBEDDING_CACHE_PATH) -> Optional[EmbeddingCache]:
+    """Кэш на процесс; если хранилище недоступно, работаем без кэша"""
+    if path not in _caches:
+        try:
+            _caches[path] = EmbeddingCache(path)
+        except Exception as e:
+            logging.error(f"Кэш эмбеддингов {path} недоступен: {e}")
+            _caches[path] = None
+    return _caches[path]
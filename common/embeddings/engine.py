@@ -0,0 +1,95 @@
+import time, queue, logging, threading
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+
+from .backends import EMBEDDING_BACKEND, load_backend, backend_variant
+
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future = Future()
+
+
+class BatchingEncoder:
+    """
+    Энкодер с динамическим батчингом: запросы из разных потоков копятся в очереди
+    и кодируются одним проходом модели, пока пачка не наберёт max_batch текстов
+    или не истечёт окно max_wait_ms с момента первого запроса.
+    """
+    def __init__(self, model_name: str, max_batch: int = 64, max_wait_ms: float = 5.0,
+                 backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self.variant = backend_variant(backend)
+        self.model = load_backend(model_name, backend)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """Ставим тексты в очередь; Future вернёт матрицу эмбеддингов (len(texts), dim)"""
+        request = _Request(list(texts))
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self.model.encode(texts, batch_size=self.max_batch)
+            except Exception as e:
+                logging.error(f"Ошибка кодирования пачки из {len(texts)} текстов: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+            self.requests += len(batch)
+            self.batches += 1
+            self.texts += len(texts)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "variant": self.variant,
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,195 @@
+import os, time, codecs, logging, argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+from qdrant_client.models import Filter, FilterSelector, PointStruct
+
+from common.ast.fragments import extract_fragments
+from common.ast.symbols import parse_source
+from common.qdrant.base import get_qdrant_connection
+from common.qdrant.collections import ensure_collection_exists
+from common.qdrant.tenancy import QDRANT_TENANCY, QDRANT_COLLECTION, collection_for, tenant_filter, list_projects
+from common.qdrant.upload import PointUploader
+from common.qdrant.versions import QDRANT_ALIAS_TTL, collection_model, resolve, switch_alias, version_name
+from common.s3.download import get_file
+from common.s3.locks import reembed_lock
+from common.s3.manifest import load_manifest
+from common.s3.pack import read_file
+from .backends import BACKENDS
+from .base import get_encoder
+from .cache import get_embedding_cache, cached_encode
+
+
+# Перекодировка идёт рядом с рабочей нагрузкой, поэтому ограничена по скорости
+REEMBED_POINTS_PER_SECOND = float(os.getenv("REEMBED_POINTS_PER_SECOND", "200"))
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "64"))
+
+
+class RateLimiter:
+    """Равномерный темп: не больше rate точек в секунду (0 — без ограничения)"""
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.next = time.monotonic()
+
+    def wait(self, count: int):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        if self.next > now:
+            time.sleep(self.next - now)
+        self.next = max(self.next, now) + count / self.rate
+
+
+def fragment_texts(project_id: str, manifest: dict) -> Dict[str, str]:
+    """
+    Тексты, которыми точки проекта кодировались при ингесте: фрагменты заново
+    нарезаются из исходников архива проекта. Ключ — id точки вне общей коллекции.
+    """
+    texts = {}
+    for path, info in manifest.get("files", {}).items():
+        if not info.get("points"):
+            continue
+        data = read_file(project_id, path)
+        if data is None:
+            data = get_file(project_id, path).encode("utf-8")
+        if data.startswith(codecs.BOM_UTF8):
+            data = data[len(codecs.BOM_UTF8):]
+        try:
+            symbols = parse_source(data)["symbols"]
+        except (SyntaxError, ValueError) as e:
+            logging.error(f"Не удалось разобрать {path}: {e}")
+            continue
+        for fragment in extract_fragments(data, symbols, path):
+            texts[fragment["id"]] = fragment["code"]
+    return texts
+
+
+def reembed_project(project_id: str, source: str, target: str, encoder, limiter: RateLimiter,
+                    tenancy: str = QDRANT_TENANCY, batch_size: int = REEMBED_BATCH_SIZE) -> dict:
+    """
+    Копируем точки проекта из версии source в target с векторами энкодера
+    encoder: id и payload сохраняются, меняется только вектор. Возвращает
+    манифест, по которому шла перекодировка, и счётчики.
+    """
+    qdrant_client = get_qdrant_connection()
+    embedding_cache = get_embedding_cache()
+    manifest = load_manifest(project_id)
+    texts = fragment_texts(project_id, manifest)
+    stats = {"manifest": manifest, "points": 0, "missing": 0}
+
+    with PointUploader(qdrant_client, target, batch_size=batch_size) as uploader:
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=source,
+                scroll_filter=tenant_filter(project_id, tenancy=tenancy),
+                limit=batch_size, offset=offset, with_payload=True, with_vectors=False,
+            )
+            batch = []
+            for point in points:
+                text = texts.get((point.payload or {}).get("local_id") or str(point.id))
+                if text is None:
+                    # фрагмента уже нет в исходниках (точка устарела) — в новую версию не переносим
+                    stats["missing"] += 1
+                    continue
+                batch.append((point, text))
+            if batch:
+                vectors = cached_encode(embedding_cache, encoder.model_name, [text for _, text in batch], encoder)
+                uploader.add([
+                    PointStruct(id=point.id, vector=vector.tolist(), payload=point.payload)
+                    for (point, _), vector in zip(batch, vectors)
+                ])
+                stats["points"] += len(batch)
+                limiter.wait(len(batch))
+            if offset is None:
+                break
+        uploader.flush()
+    return stats
+
+
+def _clear_project(collection: str, project_id: str, tenancy: str):
+    qdrant_client = get_qdrant_connection()
+    qdrant_client.delete(
+        collection_name=collection,
+        points_selector=FilterSelector(filter=tenant_filter(project_id, tenancy=tenancy) or Filter()),
+    )
+
+
+def reembed(base: str, projects: List[str], model: str, tenancy: str = QDRANT_TENANCY,
+            rate: float = REEMBED_POINTS_PER_SECOND, keep_old: bool = False, encoder=None) -> Optional[str]:
+    """
+    Перекодировка коллекции base (UUID проекта или общая коллекция) моделью
+    model (энкодером encoder, по умолчанию get_encoder(model)) без остановки сервисов: новая версия заполняется в фоне с
+    ограничением скорости, пока поиск и ингест работают с текущей, затем
+    алиас base атомически переключается на неё. Перед переключением
+    манифесты всех проектов сверяются под блокировкой, в которой ингест не
+    сохраняет манифест: проект, переиндексированный во время перекодировки,
+    перекодируется заново (повтор почти целиком попадает в кэш эмбеддингов).
+    Возвращает новую версию.
+    """
+    qdrant_client = get_qdrant_connection()
+    source = resolve(base, refresh=True)
+    if not qdrant_client.collection_exists(source):
+        logging.warning(f"Коллекции {base} нет, перекодировать нечего")
+        return None
+    encoder = encoder or get_encoder(model)
+    dim = int(np.asarray(encoder.encode(["dim"])).shape[1])
+    target = version_name(base, model, encoder.variant, dim)
+    if target == source:
+        logging.info(f"{base} уже использует {model} ({encoder.variant}, {dim})")
+        return target
+    logging.info(f"Перекодировка {base}: {source} ({collection_model(source)[0]}) → {target}")
+    ensure_collection_exists(target, multitenant=tenancy == "shared", size=dim)
+
+    limiter = RateLimiter(rate)
+    manifests = {}
+    for project_id in projects:
+        stats = reembed_project(project_id, source, target, encoder, limiter, tenancy)
+        logging.info(f"Проект {project_id}: {stats['points']} точек, без исходного фрагмента {stats['missing']}")
+        manifests[project_id] = stats["manifest"]
+
+    with reembed_lock(projects):
+        # ингест, сохранивший манифест до блокировки, уже записал точки в source:
+        # такие проекты перекодируем заново; начатые позже ингесты увидят новую версию
+        for project_id in projects:
+            if load_manifest(project_id) == manifests[project_id]:
+                continue
+            logging.info(f"Проект {project_id} переиндексирован во время перекодировки, повторяем")
+            _clear_project(target, project_id, tenancy)
+            # под блокировкой без ограничения скорости: ингесты проекта ждут
+            reembed_project(project_id, source, target, encoder, RateLimiter(0), tenancy)
+        previous = switch_alias(base, target)
+    logging.info(f"Алиас {base} → {target}")
+    if previous and not keep_old:
+        # сервисы кэшируют алиасы: старую версию удаляем, когда её уже никто не читает
+        time.sleep(2 * QDRANT_ALIAS_TTL)
+        qdrant_client.delete_collection(previous)
+        logging.info(f"Коллекция {previous} удалена")
+    return target
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Перекодировать коллекции Qdrant новой моделью эмбеддингов без простоя")
+    parser.add_argument("--model", required=True, help="Модель эмбеддингов новой версии")
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        help="Бэкенд локальной модели (по умолчанию — энкодер сервисов, см. get_encoder)")
+    parser.add_argument("projects", nargs="*", help="UUID проектов (по умолчанию — все проекты)")
+    parser.add_argument("--rate", type=float, default=REEMBED_POINTS_PER_SECOND, help="Точек в секунду (0 — без ограничения)")
+    parser.add_argument("--keep-old", action="store_true", help="Не удалять прежнюю версию после переключения")
+    args = parser.parse_args()
+    encoder = None
+    if args.backend:
+        from .engine import BatchingEncoder
+        encoder = BatchingEncoder(args.model, backend=args.backend)
+
+    if QDRANT_TENANCY == "shared":
+        # общая коллекция переключается целиком, поэтому перекодируются все её проекты
+        if args.projects:
+            parser.error("в раскладке shared перекодируется вся общая коллекция, проекты не указываются")
+        reembed(QDRANT_COLLECTION, list_projects("shared"), args.model, "shared", args.rate, args.keep_old, encoder)
+    else:
+        for project_id in args.projects or list_projects("collection"):
+            reembed(collection_for(project_id), [project_id], args.model, "collection", args.rate, args.keep_old, encoder)
+    logging.info(f"Готово. Сервисы перейдут на {args.model} по алиасам; EMBEDDING_MODEL задаёт модель новых коллекций")
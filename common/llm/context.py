@@ -0,0 +1,130 @@
+import os, logging, threading
+from typing import Callable, Dict, List, Optional
+
+from common.ast.chunking import estimate_tokens
+
+
+# Бюджет промпта в токенах и токенизатор LLM (tokenizer.json репозитория HuggingFace)
+LLM_CONTEXT_MAX_TOKENS = int(os.getenv("LLM_CONTEXT_MAX_TOKENS", "3000"))
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "Xenova/gpt-4o")
+# Обрезанный фрагмент короче этого числа токенов в промпт не добавляем
+LLM_CONTEXT_MIN_SNIPPET_TOKENS = int(os.getenv("LLM_CONTEXT_MIN_SNIPPET_TOKENS", "48"))
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_token_counter() -> Callable[[str], int]:
+    """
+    Подсчёт токенов токенизатором LLM_TOKENIZER (загружается один раз на
+    процесс); если он недоступен, работаем по грубой оценке estimate_tokens.
+    """
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_pretrained(LLM_TOKENIZER)
+                _tokenizer = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+            except Exception as e:
+                logging.error(f"Токенизатор {LLM_TOKENIZER} недоступен, используем оценку: {e}")
+                _tokenizer = estimate_tokens
+    return _tokenizer
+
+
+def merge_snippets(structures: List[Dict]) -> List[Dict]:
+    """
+    Склеиваем фрагменты одного файла с пересекающимися или соседними
+    диапазонами строк (класс и его метод, функции подряд) и убираем
+    повторы. Порядок — по лучшему (меньшему) рангу входящих фрагментов:
+    structures уже отсортированы по релевантности. Фрагменты без пути или
+    с кодом, не совпадающим по числу строк с диапазоном, не склеиваются.
+    """
+    blocks, by_path, seen = [], {}, set()
+    for rank, s in enumerate(structures):
+        code = s.get("code") or ""
+        if not code.strip() or code in seen:
+            continue
+        seen.add(code)
+        lines = code.split("\n")
+        start, end = s.get("start_line"), s.get("end_line")
+        block = {"rank": rank, "names": [s["name"]], "types": [s["type"]], "path": s.get("path"),
+                 "start_line": start, "end_line": end, "lines": {}}
+        if not s.get("path") or start is None or end is None or len(lines) != end - start + 1:
+            block["code"] = code
+            blocks.append(block)
+            continue
+        block["lines"] = dict(enumerate(lines, start))
+        by_path.setdefault(s["path"], []).append(block)
+
+    for path_blocks in by_path.values():
+        path_blocks.sort(key=lambda b: b["start_line"])
+        merged = [path_blocks[0]]
+        for block in path_blocks[1:]:
+            last = merged[-1]
+            if block["start_line"] > last["end_line"] + 1:
+                merged.append(block)
+                continue
+            last["end_line"] = max(last["end_line"], block["end_line"])
+            last["lines"].update(block["lines"])
+            last["rank"] = min(last["rank"], block["rank"])
+            last["names"] += [n for n in block["names"] if n not in last["names"]]
+            last["types"] += [t for t in block["types"] if t not in last["types"]]
+        for block in merged:
+            block["code"] = "\n".join(block["lines"][i] for i in range(block["start_line"], block["end_line"] + 1))
+            blocks.append(block)
+
+    blocks.sort(key=lambda b: b["rank"])
+    return [
+        {
+            "name": ", ".join(b["names"]),
+            "type": ", ".join(b["types"]),
+            "path": b["path"],
+            "start_line": b["start_line"],
+            "end_line": b["end_line"],
+            "code": b["code"],
+        }
+        for b in blocks
+    ]
+
+
+def _truncate(code: str, budget: int, count_tokens: Callable[[str], int]) -> Optional[str]:
+    """Начало кода по целым строкам в пределах budget токенов; None, если влезает слишком мало"""
+    kept, used = [], count_tokens("...\n")
+    for line in code.split("\n"):
+        cost = count_tokens(line + "\n")
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    if used < LLM_CONTEXT_MIN_SNIPPET_TOKENS:
+        return None
+    return "\n".join(kept + ["..."])
+
+
+def assemble_context(header: str, footer: str, snippets: List[Dict],
+                     render: Callable[[int, Dict], str],
+                     max_tokens: int = LLM_CONTEXT_MAX_TOKENS,
+                     count_tokens: Optional[Callable[[str], int]] = None) -> str:
+    """
+    Промпт в пределах max_tokens: header, фрагменты по порядку релевантности
+    (render(номер, фрагмент) → текст), footer. Фрагмент, не влезающий
+    целиком, обрезается по строкам; после него остальные отбрасываются.
+    """
+    count_tokens = count_tokens or get_token_counter()
+    parts = [header]
+    used = count_tokens(header + "\n") + count_tokens("\n" + footer)
+    for snippet in snippets:
+        text = render(len(parts), snippet)
+        cost = count_tokens(text + "\n")
+        if used + cost <= max_tokens:
+            parts.append(text)
+            used += cost
+            continue
+        overhead = count_tokens(render(len(parts), {**snippet, "code": ""}) + "\n")
+        code = _truncate(snippet["code"], max_tokens - used - overhead, count_tokens)
+        if code is not None:
+            parts.append(render(len(parts), {**snippet, "code": code}))
+        break
+    parts.append(footer)
+    return "\n".join(parts)
@@ -0,0 +1,121 @@
+import queue, threading, multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """Группируем поток элементов в пачки фиксированного размера"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def staged(source: Iterable, *stages: Callable, maxsize: int = 4) -> Iterator:
+    """
+    Конвейер: источник и каждая стадия работают в своём потоке и связаны
+    очередями ограниченного размера. Быстрая стадия упирается в полную очередь
+    и ждёт медленную (backpressure), поэтому в памяти одновременно находится
+    не больше maxsize элементов на стадию. Стадия может вернуть None, чтобы
+    отбросить элемент. Исключение любой стадии пробрасывается потребителю.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=maxsize) for _ in range(len(stages) + 1)]
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def produce():
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+        except BaseException as e:
+            put(queues[0], _StageError(e))
+            return
+        put(queues[0], _DONE)
+
+    def work(func: Callable, inbox: queue.Queue, outbox: queue.Queue):
+        while True:
+            item = get(inbox)
+            if item is _DONE or isinstance(item, _StageError):
+                put(outbox, item)
+                return
+            try:
+                result = func(item)
+            except BaseException as e:
+                put(outbox, _StageError(e))
+                return
+            if result is not None and not put(outbox, result):
+                return
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    for idx, func in enumerate(stages):
+        threads.append(threading.Thread(
+            target=work, args=(func, queues[idx], queues[idx + 1]), daemon=True
+        ))
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+def iter_processes(func: Callable, items: Iterable, *args, workers: int = 1) -> Iterator:
+    """
+    func(item, *args) в пуле процессов с результатами в порядке items. В работе
+    одновременно не больше 2 * workers элементов, чтобы медленный потребитель
+    не копил готовые результаты в памяти. При workers <= 1 — в текущем процессе.
+    Воркеры запускаются через spawn: fork процесса, где уже работают потоки
+    энкодера и torch, может унаследовать захваченную блокировку и зависнуть.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
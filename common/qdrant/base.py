@@ -1,13 +1,26 @@
 import os
 
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 
 
 QDRANT_URL = os.getenv('QDRANT_URL')
+# gRPC (порт 6334) быстрее REST на массовой загрузке точек
+QDRANT_PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', '0') == '1'
 
 
-client = QdrantClient(QDRANT_URL)
+client = QdrantClient(QDRANT_URL, prefer_grpc=QDRANT_PREFER_GRPC)
 
 
 def get_qdrant_connection():
-    return client
\ No newline at end of file
+    return client
+
+
+_async_client = None
+
+
+def get_async_qdrant_connection():
+    """Асинхронный клиент для обработчиков на asyncio (создаётся при первом обращении)"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncQdrantClient(QDRANT_URL, prefer_grpc=QDRANT_PREFER_GRPC)
+    return _async_client
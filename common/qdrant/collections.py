@@ -1,20 +1,133 @@
-import logging
+import os, logging
 
-from qdrant_client.models import VectorParams, Distance
+from qdrant_client.models import (
+    VectorParams, VectorParamsDiff, Distance, HnswConfigDiff, SearchParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, QuantizationSearchParams, Disabled,
+    PayloadSchemaType, KeywordIndexParams, KeywordIndexType,
+)
 
 from .base import get_qdrant_connection
 
 
-def ensure_collection_exists(collection_name: str):
-    """Проверяем, существует ли коллекция, и baseсоздаем её, если не существует."""
+VECTOR_SIZE = 384
+
+# Настройки хранения коллекций на уровне развёртывания
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")  # none | scalar | binary
+QDRANT_QUANTIZATION_ALWAYS_RAM = os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "1") == "1"
+QDRANT_ON_DISK_VECTORS = os.getenv("QDRANT_ON_DISK_VECTORS", "0") == "1"
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "0"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "0"))
+QDRANT_HNSW_ON_DISK = os.getenv("QDRANT_HNSW_ON_DISK", "0") == "1"
+# Граф HNSW общей коллекции строится по каждому проекту отдельно (payload_m), а не глобально
+QDRANT_TENANT_PAYLOAD_M = int(os.getenv("QDRANT_TENANT_PAYLOAD_M", "16"))
+QDRANT_SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "0"))
+QDRANT_SEARCH_RESCORE = os.getenv("QDRANT_SEARCH_RESCORE", "1") == "1"
+QDRANT_SEARCH_OVERSAMPLING = float(os.getenv("QDRANT_SEARCH_OVERSAMPLING", "2.0"))
+
+# Индексы payload для фильтрованного поиска (см. common/qdrant/filters.py)
+PAYLOAD_INDEXES = {
+    "path": PayloadSchemaType.KEYWORD,
+    "dirs": PayloadSchemaType.KEYWORD,
+    "module": PayloadSchemaType.KEYWORD,
+    "kind": PayloadSchemaType.KEYWORD,
+    "name": PayloadSchemaType.KEYWORD,
+}
+
+
+def vectors_config(size: int = VECTOR_SIZE) -> VectorParams:
+    return VectorParams(size=size, distance=Distance.COSINE, on_disk=QDRANT_ON_DISK_VECTORS)
+
+
+def hnsw_config(multitenant: bool = False) -> HnswConfigDiff:
+    """
+    Параметры HNSW; нулевые значения оставляют настройки Qdrant по умолчанию.
+    В общей коллекции проектов глобальный граф отключён (m=0): поиск всегда
+    идёт с фильтром по project_id и использует графы отдельных проектов.
+    """
+    if multitenant:
+        return HnswConfigDiff(
+            m=0,
+            payload_m=QDRANT_TENANT_PAYLOAD_M,
+            ef_construct=QDRANT_HNSW_EF_CONSTRUCT or None,
+            on_disk=QDRANT_HNSW_ON_DISK,
+        )
+    return HnswConfigDiff(
+        m=QDRANT_HNSW_M or None,
+        ef_construct=QDRANT_HNSW_EF_CONSTRUCT or None,
+        on_disk=QDRANT_HNSW_ON_DISK,
+    )
+
+
+def quantization_config():
+    """Скалярное (int8, ~4x) или бинарное (~32x) квантование; исходные векторы остаются для rescoring"""
+    if QDRANT_QUANTIZATION == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(
+            type=ScalarType.INT8,
+            quantile=0.99,
+            always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM,
+        ))
+    if QDRANT_QUANTIZATION == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(
+            always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM,
+        ))
+    if QDRANT_QUANTIZATION != "none":
+        raise ValueError(f"Unknown QDRANT_QUANTIZATION: {QDRANT_QUANTIZATION}")
+    return None
+
+
+def search_params() -> SearchParams:
+    """Параметры поиска: при квантовании кандидаты пересчитываются по исходным векторам"""
+    quantization = None
+    if QDRANT_QUANTIZATION != "none":
+        quantization = QuantizationSearchParams(
+            rescore=QDRANT_SEARCH_RESCORE,
+            oversampling=QDRANT_SEARCH_OVERSAMPLING,
+        )
+    return SearchParams(hnsw_ef=QDRANT_SEARCH_HNSW_EF or None, quantization=quantization)
+
+
+def ensure_payload_indexes(collection_name: str, multitenant: bool = False):
+    """Создаём недостающие индексы payload (в том числе у коллекций, созданных до их появления)"""
+    qdrant_client = get_qdrant_connection()
+    indexes = dict(PAYLOAD_INDEXES)
+    if multitenant:
+        # is_tenant: Qdrant хранит точки проекта рядом и ищет только по ним
+        indexes["project_id"] = KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True)
+    existing = qdrant_client.get_collection(collection_name).payload_schema or {}
+    for field_name, schema in indexes.items():
+        if field_name not in existing:
+            qdrant_client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=schema,
+            )
+
+
+def ensure_collection_exists(collection_name: str, multitenant: bool = False, size: int = VECTOR_SIZE):
+    """Проверяем, существует ли коллекция, и создаем её, если не существует."""
     qdrant_client = get_qdrant_connection()
     try:
-        collections = qdrant_client.get_collections()
-        if collection_name not in collections:
+        if not qdrant_client.collection_exists(collection_name):
             # Если коллекция не существует, создаем её
             qdrant_client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+                vectors_config=vectors_config(size),
+                hnsw_config=hnsw_config(multitenant),
+                quantization_config=quantization_config(),
             )
+        ensure_payload_indexes(collection_name, multitenant)
     except Exception as e:
-        logging.error(f"Error checking or creating collection: {e}")
\ No newline at end of file
+        logging.error(f"Error checking or creating collection: {e}")
+
+
+def apply_storage_settings(collection_name: str, multitenant: bool = False):
+    """Приводим существующую коллекцию к текущим настройкам хранения"""
+    qdrant_client = get_qdrant_connection()
+    qdrant_client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": VectorParamsDiff(on_disk=QDRANT_ON_DISK_VECTORS)},
+        hnsw_config=hnsw_config(multitenant),
+        # Disabled снимает ранее включённое квантование
+        quantization_config=quantization_config() or Disabled.DISABLED,
+    )
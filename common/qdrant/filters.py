@@ -0,0 +1,65 @@
+from typing import List, Optional
+
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny
+
+from common.ast.identifiers import module_name
+
+
+# Псевдонимы видов определений для фильтра по kind
+KINDS = {
+    "class": ("ClassDef",),
+    "function": ("FunctionDef", "AsyncFunctionDef"),
+    "ClassDef": ("ClassDef",),
+    "FunctionDef": ("FunctionDef",),
+    "AsyncFunctionDef": ("AsyncFunctionDef",),
+}
+
+
+def path_dirs(path: str) -> List[str]:
+    """Каталоги-предки файла: a/b/c.py → [a, a/b] (поле dirs для фильтра по префиксу пути)"""
+    parts = path.split("/")[:-1]
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def scope(path_prefix: Optional[str] = None, kind: Optional[str] = None,
+          modules: Optional[List[str]] = None) -> tuple:
+    """
+    Нормализованная область поиска (path_prefix, kinds, modules) — хешируемая,
+    входит в ключ кэша результатов. Префикс пути задаётся каталогом или файлом,
+    модули — именами через точку или путями к .py файлам.
+    """
+    if kind is not None and kind not in KINDS:
+        raise ValueError(f"Unknown kind: {kind}")
+    prefix = path_prefix.strip("/") if path_prefix else None
+    kinds = KINDS[kind] if kind else None
+    mods = tuple(sorted({module_name(m) if m.endswith(".py") else m for m in modules})) if modules else None
+    return (prefix or None, kinds, mods)
+
+
+def scope_filter(search_scope: tuple) -> Optional[Filter]:
+    """Фильтр Qdrant для области поиска; None — искать по всей коллекции"""
+    prefix, kinds, modules = search_scope
+    must = []
+    if prefix:
+        must.append(Filter(should=[
+            FieldCondition(key="path", match=MatchValue(value=prefix)),
+            FieldCondition(key="dirs", match=MatchValue(value=prefix)),
+        ]))
+    if kinds:
+        must.append(FieldCondition(key="kind", match=MatchAny(any=list(kinds))))
+    if modules:
+        must.append(FieldCondition(key="module", match=MatchAny(any=list(modules))))
+    return Filter(must=must) if must else None
+
+
+def in_scope(meta: dict, search_scope: tuple) -> bool:
+    """Та же проверка области для определений вне Qdrant (индекс идентификаторов)"""
+    prefix, kinds, modules = search_scope
+    path = meta["path"]
+    if prefix and path != prefix and not path.startswith(prefix + "/"):
+        return False
+    if kinds and meta["kind"] not in kinds:
+        return False
+    if modules and module_name(path) not in modules:
+        return False
+    return True
@@ -0,0 +1,13 @@
+from typing import List
+
+
+def fuse(hit_lists: List[list], limit: int, k: int = 60) -> list:
+    """Слияние ранжированных списков попаданий (Reciprocal Rank Fusion) с дедупликацией по фрагменту"""
+    scores, hits = {}, {}
+    for hits_ in hit_lists:
+        for rank, pt in enumerate(hits_):
+            meta = pt.payload or {}
+            key = (meta.get("path"), meta.get("start_line"), meta.get("end_line")) if "path" in meta else pt.id
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(key, pt)
+    return [hits[key] for key in sorted(scores, key=scores.get, reverse=True)[:limit]]
@@ -0,0 +1,59 @@
+import uuid, logging, argparse
+
+from .base import get_qdrant_connection
+from .collections import (
+    apply_storage_settings,
+    QDRANT_QUANTIZATION, QDRANT_ON_DISK_VECTORS, QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_HNSW_ON_DISK,
+)
+from .versions import base_name
+
+
+def is_project_collection(name: str) -> bool:
+    """Коллекции проектов называются по UUID проекта (версии — {UUID}__{модель}__{вариант}__{размерность})"""
+    try:
+        uuid.UUID(base_name(name))
+        return True
+    except ValueError:
+        return False
+
+
+def migrate_collections(names=None, dry_run: bool = False) -> list:
+    """
+    Переводим коллекции проектов на текущие настройки хранения (квантование,
+    векторы на диске, HNSW). Qdrant перестраивает сегменты в фоне, поиск
+    продолжает работать во время миграции.
+    """
+    from .tenancy import QDRANT_COLLECTION
+
+    qdrant_client = get_qdrant_connection()
+    if not names:
+        names = [
+            c.name for c in qdrant_client.get_collections().collections
+            if is_project_collection(c.name) or base_name(c.name) == QDRANT_COLLECTION
+        ]
+
+    migrated = []
+    for name in names:
+        logging.info(f"Миграция коллекции {name}")
+        if not dry_run:
+            # общая коллекция проектов (QDRANT_TENANCY=shared) строит графы по проектам
+            apply_storage_settings(name, multitenant=base_name(name) == QDRANT_COLLECTION)
+        migrated.append(name)
+    return migrated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Применить настройки хранения Qdrant к существующим коллекциям проектов")
+    parser.add_argument("collections", nargs="*", help="Имена коллекций (по умолчанию — все коллекции проектов)")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, какие коллекции будут изменены")
+    args = parser.parse_args()
+
+    logging.info(
+        f"quantization={QDRANT_QUANTIZATION} on_disk={QDRANT_ON_DISK_VECTORS} "
+        f"hnsw_m={QDRANT_HNSW_M or 'default'} ef_construct={QDRANT_HNSW_EF_CONSTRUCT or 'default'} "
+        f"hnsw_on_disk={QDRANT_HNSW_ON_DISK}"
+    )
+    migrated = migrate_collections(args.collections, dry_run=args.dry_run)
+    logging.info(f"Готово: {len(migrated)} коллекций")
@@ -0,0 +1,196 @@
+import os, uuid, logging, argparse
+from typing import Dict, List, Optional
+
+from qdrant_client.models import Filter, FieldCondition, MatchValue, FilterSelector, PointStruct
+
+from .base import get_qdrant_connection
+from .collections import VECTOR_SIZE
+from .migrate import is_project_collection
+from .upload import PointUploader
+from .versions import EMBEDDING_MODEL, QDRANT_LEGACY_VARIANT, ensure_version, collection_model, collections_of, delete_versions, base_name, resolve
+
+
+# collection — отдельная коллекция на проект (по UUID проекта);
+# shared — одна коллекция QDRANT_COLLECTION, проекты разделены полем project_id
+QDRANT_TENANCY = os.getenv("QDRANT_TENANCY", "collection")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "documents")
+TENANCY_MODES = ("collection", "shared")
+
+if QDRANT_TENANCY not in TENANCY_MODES:
+    raise ValueError(f"Unknown QDRANT_TENANCY: {QDRANT_TENANCY}")
+
+
+def collection_for(project_id, tenancy: str = QDRANT_TENANCY) -> str:
+    """Имя (алиас текущей версии, см. common/qdrant/versions.py) коллекции с точками проекта"""
+    return QDRANT_COLLECTION if tenancy == "shared" else str(project_id)
+
+
+def tenant_point_id(project_id, point_id: Optional[str], tenancy: str = QDRANT_TENANCY) -> Optional[str]:
+    """
+    id точки в коллекции: в общей коллекции одинаковые фрагменты разных
+    проектов не должны совпадать, поэтому id выводится из id проекта
+    """
+    if point_id is None or tenancy != "shared":
+        return point_id
+    return str(uuid.uuid5(uuid.UUID(str(project_id)), point_id))
+
+
+def tenant_payload(project_id, point_id: str, tenancy: str = QDRANT_TENANCY) -> dict:
+    """Поля проекта в payload общей коллекции; local_id — id точки вне общей коллекции"""
+    if tenancy != "shared":
+        return {}
+    return {"project_id": str(project_id), "local_id": point_id}
+
+
+def tenant_filter(project_id, search_filter: Optional[Filter] = None,
+                  tenancy: str = QDRANT_TENANCY) -> Optional[Filter]:
+    """Фильтр поиска, ограниченный точками проекта (в общей коллекции)"""
+    if tenancy != "shared":
+        return search_filter
+    condition = FieldCondition(key="project_id", match=MatchValue(value=str(project_id)))
+    return Filter(must=[condition] + ([search_filter] if search_filter else []))
+
+
+def ensure_project_collection(project_id, tenancy: str = QDRANT_TENANCY, model: str = EMBEDDING_MODEL,
+                              variant: str = QDRANT_LEGACY_VARIANT, dim: int = VECTOR_SIZE) -> str:
+    """
+    Текущая версия коллекции для точек проекта; если коллекции ещё нет,
+    создаётся версия для model (вариант бэкенда variant) размерности dim
+    """
+    return ensure_version(collection_for(project_id, tenancy), model, variant, dim, multitenant=tenancy == "shared")
+
+
+def delete_project_points(project_id, tenancy: str = QDRANT_TENANCY):
+    """Удаляем все точки проекта: коллекции проекта или его часть общей коллекции (во всех версиях)"""
+    qdrant_client = get_qdrant_connection()
+    name = collection_for(project_id, tenancy)
+    if tenancy != "shared":
+        delete_versions(name)
+        return
+    for collection in collections_of(name):
+        qdrant_client.delete(
+            collection_name=collection,
+            points_selector=FilterSelector(filter=tenant_filter(project_id, tenancy=tenancy)),
+        )
+
+
+def _count(project_id, tenancy: str) -> int:
+    qdrant_client = get_qdrant_connection()
+    return qdrant_client.count(
+        collection_name=collection_for(project_id, tenancy),
+        count_filter=tenant_filter(project_id, tenancy=tenancy),
+        exact=True,
+    ).count
+
+
+def migrate_project(project_id, source: str, target: str, keep_source: bool = False,
+                    batch_size: int = 256) -> int:
+    """
+    Переносим точки проекта между раскладками: векторы копируются без
+    пересчёта, id и parent_id пересчитываются, id в манифесте проекта
+    заменяются на новые. Источник удаляется после сверки числа точек.
+    Ингест проекта во время миграции должен быть остановлен.
+    """
+    qdrant_client = get_qdrant_connection()
+    # векторы переносятся как есть, поэтому модель целевой коллекции должна совпадать
+    model, variant, dim = collection_model(resolve(collection_for(project_id, source), refresh=True))
+    target_name = ensure_project_collection(project_id, target, model, variant, dim)
+    if collection_model(target_name) != (model, variant, dim):
+        raise RuntimeError(f"Коллекция {target_name} построена другой моделью, чем {model} ({variant}, {dim}): "
+                           f"сначала перекодируйте проекты (common/embeddings/reembed.py)")
+    ids: Dict[str, str] = {}
+
+    def convert(point) -> PointStruct:
+        payload = dict(point.payload or {})
+        local_id = payload.pop("local_id", None) or str(point.id)
+        payload.pop("project_id", None)
+        if payload.get("parent_id"):
+            # parent_id в общей коллекции — тоже id проекта; локальный id родителя тот же, что до переноса
+            parent = payload["parent_id"]
+            payload["parent_id"] = tenant_point_id(project_id, parents.get(parent, parent), target)
+        payload.update(tenant_payload(project_id, local_id, target))
+        new_id = tenant_point_id(project_id, local_id, target)
+        ids[str(point.id)] = new_id
+        return PointStruct(id=new_id, vector=point.vector, payload=payload)
+
+    # local_id родителей известен только после чтения всех точек, поэтому сначала собираем соответствие
+    parents: Dict[str, str] = {}
+    if source == "shared":
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=collection_for(project_id, source),
+                scroll_filter=tenant_filter(project_id, tenancy=source),
+                limit=batch_size, offset=offset, with_payload=["local_id"], with_vectors=False,
+            )
+            parents.update((str(p.id), p.payload["local_id"]) for p in points if p.payload.get("local_id"))
+            if offset is None:
+                break
+
+    with PointUploader(qdrant_client, target_name, batch_size=batch_size) as uploader:
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=collection_for(project_id, source),
+                scroll_filter=tenant_filter(project_id, tenancy=source),
+                limit=batch_size, offset=offset, with_payload=True, with_vectors=True,
+            )
+            uploader.add([convert(point) for point in points])
+            if offset is None:
+                break
+        uploader.flush()
+
+    moved = _count(project_id, target)
+    if moved != len(ids):
+        raise RuntimeError(f"Проект {project_id}: перенесено {moved} точек из {len(ids)}")
+
+    # Minio нужен только миграции, остальным пользователям модуля (user_service) — нет
+    from common.s3.manifest import load_manifest, save_manifest
+    manifest = load_manifest(str(project_id))
+    if manifest:
+        for info in manifest.get("files", {}).values():
+            info["points"] = [ids.get(pid, tenant_point_id(project_id, pid, target)) for pid in info.get("points", [])]
+        manifest["tenancy"] = target
+        save_manifest(str(project_id), manifest)
+
+    if not keep_source:
+        delete_project_points(project_id, source)
+    return moved
+
+
+def list_projects(tenancy: str) -> List[str]:
+    """Проекты, у которых есть точки в раскладке tenancy"""
+    qdrant_client = get_qdrant_connection()
+    if tenancy == "shared":
+        if not qdrant_client.collection_exists(QDRANT_COLLECTION):
+            return []
+        projects = set()
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=QDRANT_COLLECTION, limit=1024, offset=offset,
+                with_payload=["project_id"], with_vectors=False,
+            )
+            projects.update(p.payload["project_id"] for p in points if p.payload.get("project_id"))
+            if offset is None:
+                break
+        return sorted(projects)
+    names = {base_name(c.name) for c in qdrant_client.get_collections().collections if is_project_collection(c.name)}
+    return sorted(names)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Перенести точки проектов между раскладками Qdrant")
+    parser.add_argument("--to", choices=TENANCY_MODES, required=True, help="Целевая раскладка")
+    parser.add_argument("projects", nargs="*", help="UUID проектов (по умолчанию — все проекты исходной раскладки)")
+    parser.add_argument("--keep-source", action="store_true", help="Не удалять точки в исходной раскладке")
+    args = parser.parse_args()
+
+    source = "collection" if args.to == "shared" else "shared"
+    projects = args.projects or list_projects(source)
+    for project_id in projects:
+        moved = migrate_project(project_id, source, args.to, keep_source=args.keep_source)
+        logging.info(f"Проект {project_id}: {moved} точек → {args.to}")
+    logging.info(f"Готово: {len(projects)} проектов. Установите QDRANT_TENANCY={args.to} в сервисах")
@@ -0,0 +1,92 @@
+import os, time, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+
+QDRANT_UPLOAD_BATCH_SIZE = int(os.getenv("QDRANT_UPLOAD_BATCH_SIZE", "256"))
+QDRANT_UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", "4"))
+QDRANT_UPLOAD_RETRIES = int(os.getenv("QDRANT_UPLOAD_RETRIES", "3"))
+QDRANT_UPLOAD_BACKOFF = float(os.getenv("QDRANT_UPLOAD_BACKOFF", "0.5"))
+
+
+class PointUploader:
+    """
+    Загрузка точек в коллекцию пачками по batch_size в parallel потоков.
+    Пачки отправляются с wait=False, flush() дожидается отправки всех пачек
+    и ставит барьер: повторный upsert последней пачки с wait=True применяется
+    после всех предыдущих операций коллекции. id точек детерминированы,
+    поэтому повтор пачки после ошибки идемпотентен.
+    """
+    def __init__(self, client: QdrantClient, collection_name: str,
+                 batch_size: int = QDRANT_UPLOAD_BATCH_SIZE,
+                 parallel: int = QDRANT_UPLOAD_PARALLEL,
+                 retries: int = QDRANT_UPLOAD_RETRIES):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.retries = retries
+        self.executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="qdrant-upload")
+        # не больше 2 * parallel пачек в работе: загрузчик сдерживает источник точек
+        self.slots = threading.BoundedSemaphore(2 * parallel)
+        self.buffer: List[PointStruct] = []
+        self.futures = []
+        self.last_batch: List[PointStruct] = []
+
+    def _send(self, points: List[PointStruct], wait: bool = False):
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = QDRANT_UPLOAD_BACKOFF * 2 ** attempt
+                logging.warning(f"Повтор пачки из {len(points)} точек в {self.collection_name} через {delay:.1f}с: {e}")
+                time.sleep(delay)
+
+    def _upload(self, points: List[PointStruct]):
+        try:
+            self._send(points)
+        finally:
+            self.slots.release()
+
+    def _submit(self, points: List[PointStruct]):
+        # ошибку уже завершённой пачки поднимаем сразу, не дожидаясь flush
+        for future in [f for f in self.futures if f.done()]:
+            future.result()
+            self.futures.remove(future)
+        self.slots.acquire()
+        self.futures.append(self.executor.submit(self._upload, points))
+        self.last_batch = points
+
+    def add(self, points: List[PointStruct]):
+        """Добавляем точки; полные пачки сразу уходят в Qdrant"""
+        self.buffer.extend(points)
+        while len(self.buffer) >= self.batch_size:
+            batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+            self._submit(batch)
+
+    def flush(self):
+        """Отправляем остаток, ждём все пачки и ставим барьер согласованности"""
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            self._submit(batch)
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+        if self.last_batch:
+            self._send(self.last_batch, wait=True)
+            self.last_batch = []
+
+    def close(self):
+        """Останавливаем потоки; неотправленные пачки отменяются"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
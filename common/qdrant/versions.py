@@ -0,0 +1,120 @@
+import os, time, logging, threading
+from typing import Dict, List, Optional, Tuple
+
+from qdrant_client.models import CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+
+from .base import get_qdrant_connection
+from .collections import ensure_collection_exists, VECTOR_SIZE
+
+
+# Коллекции версионируются по модели эмбеддингов: {имя}__{модель}__{вариант}__{размерность},
+# где вариант — бэкенд вычисления (torch, onnx-int8, см. common/embeddings/backends.py).
+# Сервисы обращаются по имени (UUID проекта или QDRANT_COLLECTION) — это алиас
+# текущей версии, и переключение модели сводится к атомической смене алиаса.
+VERSION_SEPARATOR = "__"
+# Список алиасов кэшируется в процессе на N секунд
+QDRANT_ALIAS_TTL = float(os.getenv("QDRANT_ALIAS_TTL", "10"))
+# Модель коллекций без версии в имени (созданных до версионирования) и новых коллекций;
+# читаем переменную напрямую — модуль используется и там, где нет common.embeddings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Вариант бэкенда коллекций без версии в имени
+QDRANT_LEGACY_VARIANT = os.getenv("QDRANT_LEGACY_VARIANT", "torch")
+
+_aliases: Dict[str, str] = {}
+_aliases_loaded = None
+_aliases_lock = threading.Lock()
+
+
+def version_name(base: str, model: str, variant: str, dim: int) -> str:
+    """documents, sentence-transformers/all-MiniLM-L6-v2, torch, 384 → documents__sentence-transformers--all-MiniLM-L6-v2__torch__384"""
+    return VERSION_SEPARATOR.join([base, model.replace("/", "--"), variant, str(dim)])
+
+
+def parse_version(name: str) -> Optional[Tuple[str, str, str, int]]:
+    """(имя, модель, вариант, размерность) версии коллекции; None для коллекции без версии"""
+    parts = name.split(VERSION_SEPARATOR)
+    if len(parts) != 4 or not parts[3].isdigit():
+        return None
+    return parts[0], parts[1].replace("--", "/"), parts[2], int(parts[3])
+
+
+def base_name(name: str) -> str:
+    parsed = parse_version(name)
+    return parsed[0] if parsed else name
+
+
+def collection_model(collection: str) -> Tuple[str, str, int]:
+    """Модель, вариант бэкенда и размерность векторов коллекции"""
+    parsed = parse_version(collection)
+    return parsed[1:] if parsed else (EMBEDDING_MODEL, QDRANT_LEGACY_VARIANT, VECTOR_SIZE)
+
+
+def aliases(refresh: bool = False) -> Dict[str, str]:
+    """Алиас → коллекция; список перечитывается не чаще раза в QDRANT_ALIAS_TTL секунд"""
+    global _aliases, _aliases_loaded
+    with _aliases_lock:
+        if refresh or _aliases_loaded is None or time.monotonic() - _aliases_loaded > QDRANT_ALIAS_TTL:
+            response = get_qdrant_connection().get_aliases()
+            _aliases = {alias.alias_name: alias.collection_name for alias in response.aliases}
+            _aliases_loaded = time.monotonic()
+        return _aliases
+
+
+def resolve(name: str, refresh: bool = False) -> str:
+    """Коллекция, на которую указывает алиас name; имя без алиаса возвращается как есть"""
+    return aliases(refresh).get(name, name)
+
+
+def collections_of(base: str) -> List[str]:
+    """Все коллекции имени: версии (в том числе незавершённые) и коллекция без версии"""
+    qdrant_client = get_qdrant_connection()
+    return [c.name for c in qdrant_client.get_collections().collections if base_name(c.name) == base]
+
+
+def ensure_version(base: str, model: str = EMBEDDING_MODEL, variant: str = QDRANT_LEGACY_VARIANT,
+                   dim: int = VECTOR_SIZE, multitenant: bool = False) -> str:
+    """
+    Текущая коллекция имени base. Если её нет, создаём версию для model и
+    направляем на неё алиас. Коллекция без версии используется как есть до
+    первой перекодировки (см. common/embeddings/reembed.py).
+    """
+    qdrant_client = get_qdrant_connection()
+    collection = resolve(base, refresh=True)
+    if collection == base and not qdrant_client.collection_exists(base):
+        collection = version_name(base, model, variant, dim)
+        ensure_collection_exists(collection, multitenant, size=dim)
+        switch_alias(base, collection)
+    else:
+        ensure_collection_exists(collection, multitenant, size=collection_model(collection)[2])
+    return collection
+
+
+def switch_alias(base: str, collection: str) -> Optional[str]:
+    """
+    Атомически переключаем алиас base на collection; возвращает прежнюю
+    коллекцию. Коллекция без версии занимает имя алиаса, поэтому её
+    приходится удалить перед созданием алиаса — только это переключение
+    не атомарно.
+    """
+    qdrant_client = get_qdrant_connection()
+    previous = resolve(base, refresh=True)
+    operations = []
+    if previous != base:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=base)))
+    elif qdrant_client.collection_exists(base):
+        logging.warning(f"Коллекция {base} без версии удаляется перед созданием алиаса")
+        qdrant_client.delete_collection(base)
+    else:
+        previous = None
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection, alias_name=base)))
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+    aliases(refresh=True)
+    return None if previous in (None, base, collection) else previous
+
+
+def delete_versions(base: str):
+    """Удаляем все коллекции имени; алиасы Qdrant удаляет вместе с коллекцией"""
+    qdrant_client = get_qdrant_connection()
+    for name in collections_of(base):
+        qdrant_client.delete_collection(name)
+    aliases(refresh=True)
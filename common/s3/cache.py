@@ -0,0 +1,196 @@
+import os, time, hashlib, logging, tempfile, threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from minio import Minio
+from minio.error import ServerError
+
+
+S3_CACHE_MAX_MB = int(os.getenv("S3_CACHE_MAX_MB", "256"))
+# Изменяемые объекты перепроверяются условным GET не чаще раза в N секунд
+S3_CACHE_REVALIDATE_SECONDS = float(os.getenv("S3_CACHE_REVALIDATE_SECONDS", "5"))
+# Каталог дискового уровня для неизменяемых объектов; пусто — кэш только в памяти
+S3_CACHE_DIR = os.getenv("S3_CACHE_DIR", "")
+S3_CACHE_DISK_MB = int(os.getenv("S3_CACHE_DISK_MB", "2048"))
+
+
+class ObjectCache:
+    """
+    LRU-кэш объектов Minio в памяти с ограничением по размеру. Ключ —
+    (bucket, key, offset, length), то есть кэшируются и range GET.
+    Неизменяемые объекты (коммит в ключе) не перепроверяются и могут
+    храниться на диске; изменяемые по истечении revalidate_after
+    перепроверяются условным GET с If-None-Match по сохранённому ETag.
+    """
+    def __init__(self, max_bytes: int = S3_CACHE_MAX_MB * 1024 * 1024,
+                 revalidate_after: float = S3_CACHE_REVALIDATE_SECONDS,
+                 disk_dir: str = S3_CACHE_DIR, disk_max_bytes: int = S3_CACHE_DISK_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.refreshed = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # ключ → (данные, ETag, время последней проверки)
+        self._entries = OrderedDict()
+        self._size = 0
+
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            files = []
+            for name in os.listdir(disk_dir):
+                if name.endswith(".bin"):
+                    stat = os.stat(os.path.join(disk_dir, name))
+                    files.append((stat.st_mtime, name, stat.st_size))
+            for _, name, size in sorted(files):
+                self._disk[name] = size
+                self._disk_size += size
+
+    @staticmethod
+    def _fetch(minio_client: Minio, bucket: str, key: str, offset: int, length: int,
+               etag: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+        headers = {"If-None-Match": etag} if etag else None
+        response = minio_client.get_object(bucket, key, offset=offset, length=length, request_headers=headers)
+        try:
+            return response.read(), response.headers.get("ETag")
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _put(self, cache_key: tuple, data: bytes, etag: Optional[str]):
+        # объект крупнее четверти кэша вытеснил бы всё остальное
+        if len(data) > self.max_bytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[cache_key] = (data, etag, time.monotonic())
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (old, _, _) = self._entries.popitem(last=False)
+                self._size -= len(old)
+                self.evictions += 1
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _disk_name(self, cache_key: tuple) -> str:
+        return hashlib.sha256(repr(cache_key).encode("utf-8")).hexdigest() + ".bin"
+
+    def _disk_get(self, cache_key: tuple) -> Optional[bytes]:
+        name = self._disk_name(cache_key)
+        path = os.path.join(self.disk_dir, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if name in self._disk:
+                self._disk.move_to_end(name)
+        return data
+
+    def _disk_put(self, cache_key: tuple, data: bytes):
+        name = self._disk_name(cache_key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.disk_dir, name))
+        except OSError as e:
+            logging.warning(f"Не удалось записать объект в дисковый кэш: {e}")
+            return
+        evicted = []
+        with self._lock:
+            self._disk_size += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            while self._disk_size > self.disk_max_bytes and len(self._disk) > 1:
+                old, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(os.path.join(self.disk_dir, old))
+            except FileNotFoundError:
+                pass
+
+    def get(self, minio_client: Minio, bucket: str, key: str, offset: int = 0, length: int = 0,
+            immutable: bool = False) -> bytes:
+        """Содержимое объекта (или диапазона) из кэша, с перепроверкой или из Minio"""
+        cache_key = (bucket, key, offset, length)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+
+        if entry is not None:
+            data, etag, checked = entry
+            if immutable or time.monotonic() - checked < self.revalidate_after:
+                self._count("hits")
+                return data
+            try:
+                fresh, fresh_etag = self._fetch(minio_client, bucket, key, offset, length, etag)
+            except ServerError as e:
+                if e.status_code != 304:
+                    raise
+                # 304 Not Modified: данные актуальны, обновляем только время проверки
+                self._count("revalidated")
+                self._put(cache_key, data, etag)
+                return data
+            except Exception:
+                # объект удалён или недоступен: устаревшую копию не отдаём
+                self.invalidate(bucket, key)
+                raise
+            self._count("refreshed")
+            self._put(cache_key, fresh, fresh_etag)
+            return fresh
+
+        if immutable and self.disk_dir:
+            data = self._disk_get(cache_key)
+            if data is not None:
+                self._count("disk_hits")
+                self._put(cache_key, data, None)
+                return data
+
+        self._count("misses")
+        data, etag = self._fetch(minio_client, bucket, key, offset, length)
+        self._put(cache_key, data, etag)
+        if immutable and self.disk_dir:
+            self._disk_put(cache_key, data)
+        return data
+
+    def invalidate(self, bucket: str, key: str):
+        """Забываем все диапазоны объекта (после его перезаписи или удаления)"""
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == bucket and k[1] == key]:
+                self._size -= len(self._entries.pop(cache_key)[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.revalidated + self.refreshed + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "refreshed": self.refreshed,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.revalidated + self.disk_hits) / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_size_bytes": self._disk_size,
+            }
+
+
+object_cache = ObjectCache()
@@ -1,17 +1,51 @@
 import os, logging
+from typing import List, Tuple
 
 from .base import get_s3_connection, MINIO_BUCKET
+from .pack import read_file, read_lines, read_spans
+from .cache import object_cache
 
 
-def get_file(subfolder: str, file_path: str) -> str:
-    """Получаем код из Minio по пути файла"""
+def get_file(project_id: str, file_path: str) -> str:
+    """Получаем код из Minio по пути файла: range GET из архива проекта или отдельный объект"""
     minio_client = get_s3_connection()
 
     try:
-        key = f"{subfolder}/{file_path}"
-        response = minio_client.get_object(MINIO_BUCKET, key)
-        code = response.read().decode('utf-8')
-        return code
+        data = read_file(project_id, file_path)
+        if data is None:
+            # проекты, проиндексированные до появления архивов
+            key = f"{project_id}/repository_code/{file_path}"
+            data = object_cache.get(minio_client, MINIO_BUCKET, key)
+        return data.decode('utf-8')
     except Exception as e:
         logging.error(f"Ошибка при загрузке файла из Minio: {e}")
-        return ""
\ No newline at end of file
+        return ""
+
+
+def get_snippet(project_id: str, file_path: str, start_line: int, end_line: int) -> str:
+    """
+    Строки start_line..end_line (включительно) файла без завершающего перевода
+    строки. Из архива читается только нужный диапазон байт по таблице строк.
+    """
+    try:
+        data = read_lines(project_id, file_path, start_line, end_line)
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке фрагмента из Minio: {e}")
+        data = None
+    if data is None:
+        lines = get_file(project_id, file_path).splitlines()
+        return "\n".join(lines[start_line-1:end_line])
+    return "\n".join(data.decode('utf-8', errors='replace').splitlines())
+
+
+def get_snippets(project_id: str, file_path: str, spans: List[Tuple[int, int]]) -> List[str]:
+    """Несколько фрагментов [(start_line, end_line)] одного файла за одно обращение к файлу"""
+    try:
+        chunks = read_spans(project_id, file_path, spans)
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке фрагментов из Minio: {e}")
+        chunks = None
+    if chunks is None:
+        lines = get_file(project_id, file_path).splitlines()
+        return ["\n".join(lines[start-1:end]) for start, end in spans]
+    return ["\n".join(chunk.decode('utf-8', errors='replace').splitlines()) for chunk in chunks]
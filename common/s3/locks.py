@@ -0,0 +1,91 @@
+import io, os, json, time, logging
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from minio.error import S3Error
+
+from .base import get_s3_connection, MINIO_BUCKET
+
+
+# Ингест сохраняет манифест проекта, перекодировка (common/embeddings/reembed.py)
+# переключает алиас коллекции — эти шаги не должны идти одновременно. Каждая
+# сторона ставит маркер проекта и ждёт, пока маркера другой стороны нет; при
+# встрече уступает ингест, поэтому взаимной блокировки не бывает.
+# Маркер старше PROJECT_LOCK_TTL секунд считается брошенным (процесс упал)
+PROJECT_LOCK_TTL = float(os.getenv("PROJECT_LOCK_TTL", "3600"))
+# Сколько ингест ждёт снятия маркера перекодировки
+PROJECT_LOCK_WAIT = float(os.getenv("PROJECT_LOCK_WAIT", "600"))
+PROJECT_LOCK_POLL = 1.0
+
+
+def _lock_key(project_id: str, holder: str) -> str:
+    return f"{project_id}/locks/{holder}.json"
+
+
+def _put_marker(project_id: str, holder: str):
+    data = json.dumps({"created_at": time.time()}).encode("utf-8")
+    get_s3_connection().put_object(MINIO_BUCKET, _lock_key(project_id, holder), io.BytesIO(data), len(data),
+                                   content_type="application/json")
+
+
+def _remove_marker(project_id: str, holder: str):
+    get_s3_connection().remove_object(MINIO_BUCKET, _lock_key(project_id, holder))
+
+
+def _marker_age(project_id: str, holder: str) -> Optional[float]:
+    """Возраст маркера в секундах; None, если маркера нет"""
+    minio_client = get_s3_connection()
+    try:
+        response = minio_client.get_object(MINIO_BUCKET, _lock_key(project_id, holder))
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return None
+        raise
+    try:
+        return time.time() - json.loads(response.read().decode("utf-8"))["created_at"]
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def _held(project_id: str, holder: str) -> bool:
+    age = _marker_age(project_id, holder)
+    if age is not None and age > PROJECT_LOCK_TTL:
+        logging.warning(f"Маркер {holder} проекта {project_id} брошен {age:.0f} с назад, игнорируем")
+        return False
+    return age is not None
+
+
+@contextmanager
+def ingest_lock(project_id: str, wait: float = PROJECT_LOCK_WAIT):
+    """Ингест фиксирует состояние проекта; пока идёт перекодировка, ждём до wait секунд"""
+    project_id = str(project_id)
+    deadline = time.monotonic() + wait
+    while True:
+        _put_marker(project_id, "ingest")
+        if not _held(project_id, "reembed"):
+            break
+        _remove_marker(project_id, "ingest")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Проект {project_id} перекодируется дольше {wait:.0f} с")
+        time.sleep(PROJECT_LOCK_POLL)
+    try:
+        yield
+    finally:
+        _remove_marker(project_id, "ingest")
+
+
+@contextmanager
+def reembed_lock(project_ids: Iterable[str]):
+    """Перекодировка фиксирует проекты: новые ингесты ждут, начатые — дожидаемся"""
+    project_ids = [str(project_id) for project_id in project_ids]
+    try:
+        for project_id in project_ids:
+            _put_marker(project_id, "reembed")
+        for project_id in project_ids:
+            while _held(project_id, "ingest"):
+                time.sleep(PROJECT_LOCK_POLL)
+        yield
+    finally:
+        for project_id in project_ids:
+            _remove_marker(project_id, "reembed")
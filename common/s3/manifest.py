@@ -0,0 +1,88 @@
+import json, io, time, logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from .base import get_s3_connection, MINIO_BUCKET
+from .cache import object_cache
+
+
+def _manifest_key(project_id: str) -> str:
+    return f"{project_id}/manifest.json"
+
+
+def load_manifest(project_id: str) -> dict:
+    """Загружаем манифест проекта (git blob-хеши файлов и id точек Qdrant)"""
+    minio_client = get_s3_connection()
+
+    try:
+        response = minio_client.get_object(MINIO_BUCKET, _manifest_key(project_id))
+        return json.loads(response.read().decode('utf-8'))
+    except Exception as e:
+        logging.info(f"Манифест проекта {project_id} не найден: {e}")
+        return {}
+
+
+def diff_manifest(manifest: dict, hashes: Dict[str, str], full: bool = False,
+                  tenancy: str = "collection") -> Tuple[dict, Set[str], List[str]]:
+    """
+    Сравниваем git blob-хеши файлов с манифестом прошлого ингеста. Возвращает
+    файлы манифеста, изменённые пути (full — все) и удалённые пути. Если
+    манифест записан в другой раскладке точек (common/qdrant/tenancy.py),
+    изменены все файлы, а их прежние точки в текущей раскладке не ищутся.
+    """
+    old_files = manifest.get("files", {})
+    if manifest and manifest.get("tenancy", "collection") != tenancy:
+        logging.warning(f"Манифест записан в раскладке {manifest.get('tenancy', 'collection')}, "
+                        f"текущая — {tenancy}; полная переиндексация")
+        full = True
+        old_files = {path: {**info, "points": []} for path, info in old_files.items()}
+    changed = {
+        path for path, sha in hashes.items()
+        if full or old_files.get(path, {}).get("sha") != sha
+    }
+    removed = [path for path in old_files if path not in hashes]
+    return old_files, changed, removed
+
+
+def save_manifest(project_id: str, manifest: dict):
+    """Сохраняем манифест проекта в Minio"""
+    minio_client = get_s3_connection()
+
+    data = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+    minio_client.put_object(
+        MINIO_BUCKET,
+        _manifest_key(project_id),
+        io.BytesIO(data),
+        len(data),
+        content_type="application/json"
+    )
+
+
+def _version_key(project_id: str) -> str:
+    return f"{project_id}/index_version.json"
+
+
+def save_index_version(project_id: str, commit: str) -> str:
+    """Отмечаем завершённую индексацию проекта; версия меняется при каждом успешном ингесте"""
+    minio_client = get_s3_connection()
+
+    version = f"{commit}:{time.time_ns()}"
+    data = json.dumps({"version": version}).encode('utf-8')
+    minio_client.put_object(
+        MINIO_BUCKET,
+        _version_key(project_id),
+        io.BytesIO(data),
+        len(data),
+        content_type="application/json"
+    )
+    object_cache.invalidate(MINIO_BUCKET, _version_key(project_id))
+    return version
+
+
+def load_index_version(project_id: str) -> Optional[str]:
+    """Версия индекса проекта (через кэш с перепроверкой по ETag); None, если её нет"""
+    try:
+        data = object_cache.get(get_s3_connection(), MINIO_BUCKET, _version_key(project_id))
+        return json.loads(data.decode('utf-8'))["version"]
+    except Exception as e:
+        logging.info(f"Версия индекса проекта {project_id} не найдена: {e}")
+        return None
@@ -0,0 +1,271 @@
+import os, io, gzip, json, zlib, hashlib, logging, tempfile, threading
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Dict, List, Optional, Set, Tuple
+
+from common.ast.fragments import line_offsets
+from common.ast.snapshot import plan_shards
+from minio.error import S3Error
+
+from .base import get_s3_connection, MINIO_BUCKET
+from .upload import upload_bytes, remove_keys
+from .cache import object_cache
+
+
+PACK_FORMAT = 2
+# Каждый файл сжимается отдельно, чтобы его можно было прочитать одним range GET
+S3_PACK_COMPRESS = os.getenv("S3_PACK_COMPRESS", "1") == "1"
+# Файлы крупнее порога хранятся несжатыми: из них фрагмент читается range GET по строкам
+S3_PACK_RAW_ABOVE = int(os.getenv("S3_PACK_RAW_ABOVE", str(64 * 1024)))
+# Индексы неизменяемы (ключ содержит коммит), поэтому держим в памяти несколько последних
+S3_PACK_INDEX_CACHE = int(os.getenv("S3_PACK_INDEX_CACHE", "8"))
+# Архив делится на сегменты в среднем по N файлов (границы — как у шардов снимка,
+# см. common/ast/snapshot.py): новый коммит переписывает только сегменты с изменёнными файлами
+S3_PACK_SEGMENT_FILES = int(os.getenv("S3_PACK_SEGMENT_FILES", "256"))
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def segment_key(project_id: str, digest: str) -> str:
+    return f"{project_id}/packs/segments/{digest}.pack"
+
+
+def index_key(project_id: str, commit: str) -> str:
+    return f"{project_id}/packs/{commit}.index.json.gz"
+
+
+def _pointer_key(project_id: str) -> str:
+    return f"{project_id}/packs/current.json"
+
+
+def _read_object(key: str, offset: int = 0, length: int = 0) -> bytes:
+    minio_client = get_s3_connection()
+    response = minio_client.get_object(MINIO_BUCKET, key, offset=offset, length=length)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def _read_cached(key: str, offset: int = 0, length: int = 0, immutable: bool = True) -> bytes:
+    return object_cache.get(get_s3_connection(), MINIO_BUCKET, key, offset, length, immutable=immutable)
+
+
+def _segment_digest(paths: List[str], hashes: Dict[str, str], compress: bool) -> str:
+    """Адрес сегмента: пути и blob-хеши его файлов и параметры упаковки"""
+    content = json.dumps([PACK_FORMAT, compress, S3_PACK_RAW_ABOVE, [[path, hashes[path]] for path in paths]])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _previous_entries(previous: Optional[dict]) -> Dict[str, dict]:
+    """Сегмент → записи индекса предыдущего архива (только формата с сегментами)"""
+    if not previous:
+        return {}
+    try:
+        index = load_index(previous)
+    except Exception as e:
+        logging.info(f"Индекс архива {previous.get('index')} недоступен, архив собирается целиком: {e}")
+        return {}
+    if index.get("format") != PACK_FORMAT:
+        return {}
+    segments = {}
+    for path, entry in index["files"].items():
+        segments.setdefault(entry["pack"], {})[path] = entry
+    return segments
+
+
+def write_pack(project_id: str, commit: str, root: str, hashes: Dict[str, str],
+               previous: Optional[dict] = None, compress: bool = S3_PACK_COMPRESS,
+               segment_files: int = S3_PACK_SEGMENT_FILES) -> dict:
+    """
+    Собираем архив исходников снимка: файлы root с blob-хешами hashes лежат
+    подряд в сегментах .pack, индекс хранит path → (сегмент, offset, length,
+    size, encoding, длины строк). Сегменты адресуются содержимым: сегмент
+    предыдущего архива previous с теми же файлами переиспользуется без чтения
+    и загрузки, поэтому коммит с правкой одного файла переписывает один
+    сегмент. Возвращает указатель на индекс и сегменты архива.
+    """
+    reused = _previous_entries(previous)
+    index = {"format": PACK_FORMAT, "commit": commit, "files": {}}
+    segments = []
+    written = 0
+    for paths in plan_shards(list(hashes), segment_files):
+        key = segment_key(project_id, _segment_digest(paths, hashes, compress))
+        segments.append(key)
+        if key in reused:
+            index["files"].update(reused[key])
+            continue
+        with tempfile.TemporaryFile() as pack:
+            for path in paths:
+                with open(os.path.join(root, path), "rb") as f:
+                    data = f.read()
+                packed = compress and len(data) <= S3_PACK_RAW_ABOVE
+                body = zlib.compress(data, 6) if packed else data
+                offsets = line_offsets(data)
+                index["files"][path] = {
+                    "pack": key,
+                    "offset": pack.tell(),
+                    "length": len(body),
+                    "size": len(data),
+                    "encoding": "zlib" if packed else "raw",
+                    # длины строк вместо смещений: индекс сжимается в ~2.5 раза лучше
+                    "lines": [end - start for start, end in zip(offsets, offsets[1:])],
+                }
+                pack.write(body)
+
+            size = pack.tell()
+            pack.seek(0)
+            minio_client = get_s3_connection()
+            minio_client.put_object(MINIO_BUCKET, key, pack, size, part_size=64 * 1024 * 1024)
+            written += 1
+
+    logging.info(f"Архив {project_id}@{commit}: сегментов {len(segments)}, записано {written}")
+    data = gzip.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"), mtime=0)
+    upload_bytes(get_s3_connection(), MINIO_BUCKET, index_key(project_id, commit), data,
+                 content_type="application/gzip")
+    return {"commit": commit, "index": index_key(project_id, commit), "segments": segments}
+
+
+def _pointer_keys(pointer: Optional[dict]) -> Set[str]:
+    """Объекты архива: индекс и сегменты (или единый .pack архива первого формата)"""
+    if not pointer:
+        return set()
+    keys = set(pointer.get("segments", []))
+    if "pack" in pointer:
+        keys.add(pointer["pack"])
+    return keys | {pointer["index"]}
+
+
+def publish_pack(project_id: str, pointer: dict):
+    """Переключаем читателей на новый архив; объекты прежнего, не вошедшие в новый, удаляются"""
+    previous = load_pointer(project_id)
+    data = json.dumps(pointer).encode("utf-8")
+    minio_client = get_s3_connection()
+    minio_client.put_object(MINIO_BUCKET, _pointer_key(project_id), io.BytesIO(data), len(data),
+                            content_type="application/json")
+    object_cache.invalidate(MINIO_BUCKET, _pointer_key(project_id))
+    stale = _pointer_keys(previous) - _pointer_keys(pointer)
+    if stale:
+        remove_keys(minio_client, MINIO_BUCKET, sorted(stale))
+
+
+def discard_pack(project_id: str, pointer: dict):
+    """Удаляем неопубликованный архив, не трогая объекты текущего"""
+    stale = _pointer_keys(pointer) - _pointer_keys(load_pointer(project_id))
+    if stale:
+        remove_keys(get_s3_connection(), MINIO_BUCKET, sorted(stale))
+
+
+def load_pointer(project_id: str) -> Optional[dict]:
+    """Текущий архив проекта или None, если проект ещё хранится пофайлово"""
+    try:
+        # указатель перезаписывается при каждой индексации: перепроверяем по ETag
+        data = _read_cached(_pointer_key(project_id), immutable=False)
+        return json.loads(data.decode("utf-8"))
+    except Exception as e:
+        logging.info(f"Архив исходников проекта {project_id} не найден: {e}")
+        return None
+
+
+def load_index(pointer: dict) -> dict:
+    key = pointer["index"]
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+    index = json.loads(gzip.decompress(_read_object(key)).decode("utf-8"))
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > S3_PACK_INDEX_CACHE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def entry_line_offsets(entry: dict) -> List[int]:
+    """Байтовые смещения начала строк файла (offsets[i] — строка i + 1)"""
+    return [0] + list(accumulate(entry["lines"]))
+
+
+def read_entry(pointer: dict, entry: dict) -> bytes:
+    """Содержимое одного файла архива — один range GET"""
+    if not entry["length"]:
+        return b""
+    body = _read_cached(entry.get("pack", pointer.get("pack")), offset=entry["offset"], length=entry["length"])
+    return zlib.decompress(body) if entry["encoding"] == "zlib" else body
+
+
+def read_range(pointer: dict, entry: dict, start_line: int, end_line: int) -> bytes:
+    """
+    Байты строк start_line..end_line файла по таблице строк индекса. Несжатый
+    файл читается range GET ровно по фрагменту, сжатый — целиком (он небольшой).
+    """
+    offsets = entry_line_offsets(entry)
+    start_line = max(start_line, 1)
+    if start_line > len(offsets):
+        return b""
+    begin = offsets[start_line - 1]
+    # у последней строки без перевода строки конец — размер файла
+    end = offsets[end_line] if end_line < len(offsets) else entry["size"]
+    if begin >= end:
+        return b""
+    if entry["encoding"] == "raw":
+        return _read_cached(entry.get("pack", pointer.get("pack")), offset=entry["offset"] + begin, length=end - begin)
+    return read_entry(pointer, entry)[begin:end]
+
+
+def read_ranges(pointer: dict, entry: dict, spans: List[Tuple[int, int]]) -> List[bytes]:
+    """
+    Несколько диапазонов строк одного файла: сжатый файл читается и
+    распаковывается один раз, из несжатого каждый фрагмент — свой range GET.
+    """
+    if entry["encoding"] == "raw":
+        return [read_range(pointer, entry, start, end) for start, end in spans]
+    data = read_entry(pointer, entry)
+    offsets = entry_line_offsets(entry)
+    result = []
+    for start, end in spans:
+        start = max(start, 1)
+        if start > len(offsets):
+            result.append(b"")
+            continue
+        result.append(data[offsets[start - 1]:offsets[end] if end < len(offsets) else len(data)])
+    return result
+
+
+def _from_pack(project_id: str, path: str, read):
+    """
+    read(pointer, entry) по текущему архиву проекта; None, если архива или
+    файла в нём нет. Если архив уже заменён новой индексацией, а кэш держит
+    старый указатель, перечитываем указатель и повторяем один раз.
+    """
+    for attempt in range(2):
+        pointer = load_pointer(project_id)
+        if not pointer:
+            return None
+        try:
+            # индекс старого архива тоже мог быть уже удалён
+            entry = load_index(pointer)["files"].get(path)
+            if entry is None:
+                return None
+            return read(pointer, entry)
+        except S3Error as e:
+            if attempt or e.code not in ("NoSuchKey", "NoSuchObject"):
+                raise
+            object_cache.invalidate(MINIO_BUCKET, _pointer_key(project_id))
+
+
+def read_file(project_id: str, path: str) -> Optional[bytes]:
+    """Файл из текущего архива проекта; None, если архива или файла в нём нет"""
+    return _from_pack(project_id, path, read_entry)
+
+
+def read_lines(project_id: str, path: str, start_line: int, end_line: int) -> Optional[bytes]:
+    """Строки start_line..end_line (включительно) файла из текущего архива проекта"""
+    return _from_pack(project_id, path, lambda pointer, entry: read_range(pointer, entry, start_line, end_line))
+
+
+def read_spans(project_id: str, path: str, spans: List[Tuple[int, int]]) -> Optional[List[bytes]]:
+    """Диапазоны строк [(start_line, end_line)] одного файла из текущего архива проекта"""
+    return _from_pack(project_id, path, lambda pointer, entry: read_ranges(pointer, entry, spans))
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from common.vcs.clone import repo_name
+
+from .base import get_s3_connection, MINIO_BUCKET
+from .upload import remove_keys
+
+
+# Снимки AST (common/ast/snapshot.py) общие для проектов с одним URL репозитория
+SNAPSHOT_PREFIX = "snapshots"
+
+
+def snapshot_prefix(url: str) -> str:
+    return f"{SNAPSHOT_PREFIX}/{repo_name(url)}/"
+
+
+def remove_prefix(prefix: str) -> int:
+    """Удаляем все объекты с префиксом ключа"""
+    minio_client = get_s3_connection()
+    objects = minio_client.list_objects(MINIO_BUCKET, prefix=prefix, recursive=True)
+    return remove_keys(minio_client, MINIO_BUCKET, [obj.object_name for obj in objects])
+
+
+def delete_project_objects(project_id: str, repo_url: Optional[str] = None) -> int:
+    """
+    Удаляем объекты проекта: архив исходников, манифест, идентификаторы,
+    маркеры. С repo_url удаляются и снимки репозитория — вызывающий передаёт
+    его, только если других проектов с этим репозиторием нет.
+    """
+    removed = remove_prefix(f"{project_id}/")
+    if repo_url:
+        removed += remove_prefix(snapshot_prefix(repo_url))
+    return removed
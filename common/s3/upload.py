@@ -0,0 +1,40 @@
+import io, hashlib, logging
+from typing import Iterable
+
+from minio import Minio
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+
+
+def _unchanged(minio_client: Minio, bucket: str, key: str, sha256: str, md5: str) -> bool:
+    """Объект уже лежит с тем же содержимым: совпал sha256 из метаданных или ETag (md5 тела)"""
+    try:
+        stat = minio_client.stat_object(bucket, key)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return False
+        raise
+    if stat.metadata and stat.metadata.get("x-amz-meta-sha256") == sha256:
+        return True
+    return (stat.etag or "").strip('"') == md5
+
+
+def upload_bytes(minio_client: Minio, bucket: str, key: str, data: bytes,
+                 content_type: str = "application/octet-stream") -> bool:
+    """Загружаем объект, если он изменился. Возвращает False, если загрузка пропущена"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    if _unchanged(minio_client, bucket, key, sha256, hashlib.md5(data).hexdigest()):
+        return False
+
+    minio_client.put_object(bucket, key, io.BytesIO(data), len(data),
+                            content_type=content_type, metadata={"sha256": sha256})
+    return True
+
+
+def remove_keys(minio_client: Minio, bucket: str, keys: Iterable[str]) -> int:
+    """Пакетное удаление объектов (до 1000 ключей на запрос)"""
+    keys = list(keys)
+    errors = list(minio_client.remove_objects(bucket, (DeleteObject(key) for key in keys)))
+    for error in errors:
+        logging.error(f"Не удалось удалить {error.name}: {error.message}")
+    return len(keys) - len(errors)
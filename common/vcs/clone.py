@@ -0,0 +1,99 @@
+import os, re, fcntl, shutil, hashlib, logging, subprocess
+from contextlib import contextmanager
+from typing import List, Optional
+
+
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "/var/cache/git-mirrors")
+# Частичный клон (--filter=blob:none): содержимое файлов докачивается только при checkout.
+# История коммитов с патчами (vsc_parser.ingest_vcs) при этом будет докачивать блобы по одному.
+GIT_PARTIAL_CLONE = os.getenv("GIT_PARTIAL_CLONE", "0") == "1"
+
+
+def _git(*args: str, cwd: str = None) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stdout.decode("utf-8").strip()
+
+
+def extension_patterns(extensions: List[str]) -> List[str]:
+    """Шаблоны sparse-checkout для файлов с указанными расширениями"""
+    return [f"*{ext}" for ext in extensions]
+
+
+def repo_name(url: str) -> str:
+    """Имя репозитория, уникальное для URL: имя из URL и хеш URL"""
+    name = re.sub(r"[^\w.-]", "_", url.rstrip("/").split("/")[-1])[:64]
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return f"{name}-{digest}"
+
+
+def mirror_path(url: str) -> str:
+    """Один bare-зеркальный клон на URL репозитория"""
+    return os.path.join(GIT_MIRROR_DIR, f"{repo_name(url)}.git")
+
+
+@contextmanager
+def _mirror_lock(mirror: str):
+    """Файловая блокировка зеркала: общая для потоков, процессов и контейнеров на одном томе"""
+    os.makedirs(GIT_MIRROR_DIR, exist_ok=True)
+    with open(mirror + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def ensure_mirror(url: str) -> str:
+    """Создаём зеркало при первом обращении, дальше только докачиваем новые объекты через fetch"""
+    mirror = mirror_path(url)
+    with _mirror_lock(mirror):
+        if os.path.exists(os.path.join(mirror, "HEAD")):
+            _git("fetch", "--prune", "origin", cwd=mirror)
+        else:
+            shutil.rmtree(mirror, ignore_errors=True)
+            args = ["clone", "--mirror"]
+            if GIT_PARTIAL_CLONE:
+                args.append("--filter=blob:none")
+            _git(*args, url, mirror)
+    return mirror
+
+
+def resolve_ref(url: str, ref: str = "HEAD") -> str:
+    """SHA коммита ref в свежем зеркале, без создания worktree"""
+    mirror = ensure_mirror(url)
+    return _git("rev-parse", f"{ref}^{{commit}}", cwd=mirror)
+
+
+def checkout(url: str, target_dir: str, patterns: Optional[List[str]] = None, ref: str = "HEAD") -> str:
+    """
+    Отдаём задаче собственный worktree зеркала в target_dir (папка должна
+    отсутствовать или быть пустой). patterns ограничивает checkout
+    нужными файлами (sparse-checkout в режиме no-cone).
+    """
+    mirror = ensure_mirror(url)
+    with _mirror_lock(mirror):
+        _git("worktree", "prune", cwd=mirror)
+        _git("worktree", "add", "--detach", "--no-checkout", target_dir, ref, cwd=mirror)
+    if patterns:
+        _git("sparse-checkout", "set", "--no-cone", *patterns, cwd=target_dir)
+    _git("checkout", "--detach", cwd=target_dir)
+    return target_dir
+
+
+def release(url: str, target_dir: str):
+    """Удаляем worktree задачи и его регистрацию в зеркале"""
+    mirror = mirror_path(url)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    try:
+        with _mirror_lock(mirror):
+            _git("worktree", "prune", cwd=mirror)
+    except Exception as e:
+        logging.warning(f"Не удалось очистить worktree {target_dir} в {mirror}: {e}")
+
+
+@contextmanager
+def worktree(url: str, target_dir: str, patterns: Optional[List[str]] = None, ref: str = "HEAD"):
+    try:
+        yield checkout(url, target_dir, patterns, ref)
+    finally:
+        release(url, target_dir)
@@ -0,0 +1,45 @@
+import asyncio, logging
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from common.embeddings.base import EMBEDDING_MODEL, EMBEDDING_MAX_BATCH, EMBEDDING_MAX_WAIT_MS
+from common.embeddings.engine import BatchingEncoder
+
+app = FastAPI(title="Embedding Service")
+
+logging.basicConfig(level=logging.INFO)
+
+# Одна копия модели на узел; запросы всех клиентов батчатся вместе
+encoder = BatchingEncoder(
+    EMBEDDING_MODEL,
+    max_batch=EMBEDDING_MAX_BATCH,
+    max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+)
+
+
+class EncodeRequest(BaseModel):
+    texts: List[str]
+
+
+@app.post("/encode")
+async def encode(req: EncodeRequest):
+    if not req.texts:
+        return {"model": EMBEDDING_MODEL, "variant": encoder.variant, "embeddings": []}
+    try:
+        embeddings = await asyncio.wrap_future(encoder.submit(req.texts))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"model": EMBEDDING_MODEL, "variant": encoder.variant, "embeddings": embeddings.tolist()}
+
+
+@app.get("/info")
+async def info():
+    """Модель и вариант бэкенда: клиенты включают их в ключ кэша эмбеддингов"""
+    return {"model": EMBEDDING_MODEL, "variant": encoder.variant}
+
+
+@app.get("/stats")
+async def stats():
+    return encoder.stats()
@@ -1,18 +1,17 @@
-import os, io, ast, uuid, logging
-from pathlib import Path
+import os, time, uuid, logging, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
 
 import numpy as np
 from git import Repo
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from minio import Minio
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
-
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import PointStruct, PointIdsList
 
 from common.schemas.user import User
 from common.schemas.project import Project
@@ -21,7 +20,22 @@ from common.auth.dependency import get_current_user
 from common.s3.dependency import get_s3
 from common.database.dependency import get_db
 from common.qdrant.dependency import get_qdrant
-from common.qdrant.collections import ensure_collection_exists
+from common.qdrant.tenancy import QDRANT_TENANCY, collection_for, ensure_project_collection, tenant_point_id, tenant_payload
+from common.qdrant.versions import collection_model, resolve
+from common.qdrant.upload import PointUploader
+from common.s3.manifest import load_manifest, diff_manifest, save_manifest, save_index_version
+from common.s3.locks import ingest_lock
+from common.s3.upload import remove_keys
+from common.s3.pack import load_pointer, write_pack, publish_pack, discard_pack
+from common.pipeline.stages import staged, iter_batches
+from common.ast.fragments import extract_fragments
+from common.ast.symbols import read_source
+from common.ast.snapshot import get_snapshot
+from common.ast.identifiers import build_identifiers, save_identifiers, identifiers_key, module_name
+from common.qdrant.filters import path_dirs
+from common.vcs.clone import checkout, release, extension_patterns
+from common.embeddings.base import EMBEDDING_MODEL, get_encoder, embedding_dim
+from common.embeddings.cache import get_embedding_cache, cached_encode
 from common.ast.pipeline import CacheManager, CodeParser, Indexer
 
 # Инициализация приложения
@@ -45,21 +59,48 @@ QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "documents")
 # Подключение к Qdrant
 qdrant_client = QdrantClient(os.getenv('QDRANT_URL'))
 
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Или другая модель по вашему выбору
+# Общий сервис эмбеддингов (EMBEDDING_URL) или локальная модель с батчингом
+encoder = get_encoder()
+
+# Общий для всех проектов кэш эмбеддингов (форки и повторные ингесты не кодируются заново)
+embedding_cache = get_embedding_cache()
 
 # Создание бакета в Minio, если его нет
 MINIO_BUCKET = os.getenv('AWS_S3_BUCKET')
 if not minio_client.bucket_exists(MINIO_BUCKET):
     minio_client.make_bucket(MINIO_BUCKET)
 
+# Размер пачки фрагментов и глубина очередей между стадиями конвейера
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+# Версия набора полей payload точек: 2 — добавлены dirs и module для фильтров
+PAYLOAD_FORMAT = 2
+
+# Сколько ингестов выполняется одновременно; остальные ждут в очереди
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+executor = ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY)
+
+# Хранилище состояния задач: job_id -> {status, phase, счётчики, error?}
+jobs: Dict[str, Dict[str, Any]] = {}
+cancel_events: Dict[str, threading.Event] = {}
+ACTIVE_STATUSES = ("pending", "running")
+# Завершённые задачи хранятся для опроса статуса N секунд, затем удаляются
+INGEST_JOB_TTL = float(os.getenv("INGEST_JOB_TTL", "3600"))
 
-@app.post("/ingest/{project_id}")
+
+class IngestCancelled(Exception):
+    pass
+
+
+@app.post("/ingest/{project_id}", status_code=202)
 async def ingest_repository(
     project_id: uuid.UUID,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
     minio_client: Minio = Depends(get_s3),
-    qdrant_client: QdrantClient = Depends(get_qdrant)
+    qdrant_client: QdrantClient = Depends(get_qdrant),
+    full: bool = Query(False, description="Переиндексировать все файлы, игнорируя манифест")
 ):
     project = db.query(Project).filter(Project.id == str(project_id)).first()
     if not project or project.owner_id != user.id:
@@ -67,105 +108,276 @@ async def ingest_repository(
     if project.owner_id != user.id:
         raise HTTPException(status_code=403, detail="Not allowed to ingest this project")
 
+    prune_jobs()
+
+    # Два ингеста одного проекта одновременно испортили бы манифест
+    for job_id, job in jobs.items():
+        if job["project_id"] == str(project_id) and job["status"] in ACTIVE_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Project is already being ingested by job {job_id}")
+
+    job_id = str(uuid.uuid4())
+    jobs[job_id] = {
+        "job_id": job_id,
+        "project_id": str(project_id),
+        "owner_id": user.id,
+        "status": "pending",
+        "phase": "queued",
+        "files_total": 0,
+        "files_done": 0,
+        "files_removed": 0,
+        "points_upserted": 0,
+        "points_deleted": 0,
+        "points_per_second": 0.0,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "error": None,
+    }
+    cancel_events[job_id] = threading.Event()
+    executor.submit(run_ingest, job_id, project_id, project.name, full, minio_client, qdrant_client)
+    return {"job_id": job_id, "status": "pending"}
+
+
+def prune_jobs():
+    """Удаляем завершённые задачи старше INGEST_JOB_TTL"""
+    now = time.time()
+    for job_id, job in list(jobs.items()):
+        if job["status"] not in ACTIVE_STATUSES and job["finished_at"] and now - job["finished_at"] > INGEST_JOB_TTL:
+            jobs.pop(job_id, None)
+
+
+def get_user_job(job_id: str, user: User) -> dict:
+    prune_jobs()
+    job = jobs.get(job_id)
+    if not job or job["owner_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str, user: User = Depends(get_current_user)):
+    """Статус задачи: фаза, счётчики файлов и точек, скорость"""
+    job = get_user_job(job_id, user)
+    return {k: v for k, v in job.items() if k != "owner_id"}
+
+
+@app.delete("/ingest/jobs/{job_id}", status_code=202)
+async def cancel_ingest_job(job_id: str, user: User = Depends(get_current_user)):
+    """Отмена задачи: останавливается на ближайшей границе файла или пачки"""
+    job = get_user_job(job_id, user)
+    if job["status"] not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    cancel_events[job_id].set()
+    return {"job_id": job_id, "status": "cancelling"}
+
+
+def run_ingest(job_id: str, project_id: uuid.UUID, repo_url: str, full: bool,
+               minio_client: Minio, qdrant_client: QdrantClient):
+    """Фоновая задача: клонирование → сравнение с манифестом → загрузка кода → эмбеддинги и upsert"""
+    job = jobs[job_id]
+    cancel = cancel_events[job_id]
+
+    def set_phase(phase: str):
+        if cancel.is_set():
+            raise IngestCancelled()
+        job["phase"] = phase
+
+    def on_file(_):
+        job["files_done"] += 1
+
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    repo_dir = tempfile.mkdtemp(prefix="ingest-")
+    pending_pack = None
+    pending_identifiers = None
     try:
-        repo_data = download_repository(project.name)
-        ast_data, files_info = split_repository(repo_data)
-
-        # ... загрузка метаданных и Qdrant как было ...
-
-        # Сохраняем .py файлы, сохраняя папки внутри ключа
-        for file_info in files_info:
-            with open(file_info["file_path"], 'rb') as f:
-                data = f.read()
-            # ключ будет вида "repository_code/path/to/file.py"
-            key = f"{project_id}/repository_code/{file_info['relative_path']}"
-            minio_client.put_object(
-                MINIO_BUCKET,
-                key,
-                io.BytesIO(data),
-                len(data)
+        set_phase("cloning")
+        repo_data = download_repository(repo_url, repo_dir)
+
+        # Общий снимок разбора коммита: если его уже собрал другой сервис, AST не строим
+        set_phase("parsing")
+        snapshot = get_snapshot(repo_url, repo_data)
+        blob_hashes = snapshot["files"].shas()
+
+        set_phase("diffing")
+
+        # Сравниваем git blob-хеши с манифестом прошлого ингеста
+        manifest = load_manifest(project_id)
+        old_files, changed, removed = diff_manifest(manifest, blob_hashes, full, tenancy=QDRANT_TENANCY)
+
+        files_info = split_repository(repo_data, sorted(changed))
+        job["files_total"] = len(files_info)
+        job["files_removed"] = len(removed)
+
+        # Архив исходников снимка: один объект с индексом смещений вместо объекта на файл
+        set_phase("uploading")
+        previous_pack = load_pointer(project_id)
+        pack = previous_pack
+        if full or not previous_pack or previous_pack.get("commit") != snapshot["commit"]:
+            # сегменты прежнего архива с неизменёнными файлами переиспользуются
+            pack = pending_pack = write_pack(
+                project_id,
+                snapshot["commit"],
+                repo_data,
+                blob_hashes,
+                previous=None if full else previous_pack,
+            )
+        set_phase("indexing")
+        # текущая версия коллекции (common/qdrant/versions.py) задаёт модель эмбеддингов:
+        # после перекодировки ингест пишет новой моделью без перезапуска сервиса
+        collection_name = ensure_project_collection(project_id, model=EMBEDDING_MODEL, variant=encoder.variant,
+                                                    dim=embedding_dim())
+        model, variant, _ = collection_model(collection_name)
+        if get_encoder(model).variant != variant:
+            # векторы той же модели, но другого бэкенда близки не до совпадения: в одной коллекции
+            # они исказили бы сходство, поэтому ингест ждёт перекодировки версии
+            raise RuntimeError(f"Коллекция {collection_name} построена бэкендом {variant}, а энкодер — "
+                               f"{get_encoder(model).variant}: сначала выполните "
+                               f"python -m common.embeddings.reembed --model {model}")
+
+        # Новый манифест: точки изменённых файлов пересчитаны, остальные переносятся как есть
+        files = {path: old_files[path] for path in blob_hashes if path not in changed and path in old_files}
+        for path in changed:
+            files[path] = {"sha": blob_hashes[path], "points": []}
+
+        # Конвейер парсинг → эмбеддинги → upsert: стадии работают параллельно,
+        # в памяти держится лишь несколько пачек фрагментов. Загрузка в Qdrant
+        # идёт пачками в несколько потоков, flush() дожидается всех пачек.
+        with PointUploader(qdrant_client, collection_name) as uploader:
+            def upsert_batch(points: list) -> list:
+                uploader.add(points)
+                return [(point.payload["path"], point.id) for point in points]
+
+            indexing_started = time.time()
+            for written in staged(
+                iter_batches(iter_fragments(files_info, snapshot, on_file=on_file), INGEST_BATCH_SIZE),
+                lambda batch: extract_vectors(batch, project_id, model),
+                upsert_batch,
+                maxsize=INGEST_QUEUE_SIZE,
+            ):
+                # выход из цикла останавливает все стадии конвейера
+                if cancel.is_set():
+                    raise IngestCancelled()
+                for path, pid in written:
+                    files[path]["points"].append(pid)
+                job["points_upserted"] += len(written)
+                job["points_per_second"] = job["points_upserted"] / max(time.time() - indexing_started, 1e-6)
+            uploader.flush()
+
+        if manifest.get("payload_format", 1) < PAYLOAD_FORMAT:
+            # точки, проиндексированные до появления dirs/module, дополняем без пересчёта эмбеддингов
+            for path, info in files.items():
+                if path not in changed and info.get("points"):
+                    qdrant_client.set_payload(
+                        collection_name=collection_name,
+                        payload={"dirs": path_dirs(path), "module": module_name(path)},
+                        points=info["points"],
+                        wait=False,
+                    )
+
+        # Удаляем точки исчезнувших фрагментов и удалённых файлов
+        set_phase("cleanup")
+        stale = []
+        for path, info in old_files.items():
+            current = set(files.get(path, {}).get("points", []))
+            stale.extend(pid for pid in info.get("points", []) if pid not in current)
+        if stale:
+            qdrant_client.delete(
+                collection_name=collection_name,
+                points_selector=PointIdsList(points=stale)
             )
 
-        ensure_collection_exists(project_id)
-        qdrant_client.upsert(
-            collection_name=project_id,
-            points=extract_vectors(ast_data)
-        )
-
-        return {"status": "success", "message": "Repository ingested successfully"}
+        job["points_deleted"] = len(stale)
+
+        # перекодировка не переключит алиас между проверкой версии и сохранением манифеста
+        with ingest_lock(project_id):
+            if resolve(collection_for(project_id), refresh=True) != collection_name:
+                # алиас переключили на новую версию во время ингеста: изменения остались в старой,
+                # манифест не сохраняем — повторный ингест дозапишет их в новую версию
+                raise RuntimeError(f"Версия коллекции {collection_name} сменилась во время ингеста, повторите ингест")
+
+            # Индекс идентификаторов для точного поиска по именам в RAG
+            save_identifiers(project_id, build_identifiers(snapshot))
+            if manifest.get("commit") != snapshot["commit"]:
+                pending_identifiers = identifiers_key(project_id, snapshot["commit"])
+            save_manifest(project_id, {
+                "commit": snapshot["commit"],
+                "payload_format": PAYLOAD_FORMAT,
+                "tenancy": QDRANT_TENANCY,
+                "files": files,
+            })
+            pending_identifiers = None
+        # Читатели переключаются на новый архив только вместе с манифестом
+        publish_pack(project_id, pack)
+        pending_pack = None
+        # новая версия индекса сбрасывает кэш результатов RAG по проекту
+        save_index_version(project_id, snapshot["commit"])
+        if manifest.get("commit") and manifest["commit"] != snapshot["commit"]:
+            remove_keys(minio_client, MINIO_BUCKET, [identifiers_key(project_id, manifest["commit"])])
+        if previous_pack is None and old_files:
+            # проект хранился пофайлово — удаляем старые объекты repository_code
+            remove_keys(minio_client, MINIO_BUCKET, (f"{project_id}/repository_code/{path}" for path in old_files))
+        job["status"] = "done"
+    except IngestCancelled:
+        job["status"] = "cancelled"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logging.exception(f"Ошибка в задаче ингеста {job_id}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["phase"] = None
+        job["finished_at"] = time.time()
+        cancel_events.pop(job_id, None)
+        if pending_pack:
+            # архив так и не опубликован — не оставляем его в бакете
+            try:
+                discard_pack(str(project_id), pending_pack)
+            except Exception as e:
+                logging.warning(f"Не удалось удалить неопубликованный архив {pending_pack['index']}: {e}")
+        if pending_identifiers:
+            # манифест не сохранён: идентификаторы нового коммита никто не прочитает
+            try:
+                remove_keys(minio_client, MINIO_BUCKET, [pending_identifiers])
+            except Exception as e:
+                logging.warning(f"Не удалось удалить идентификаторы {pending_identifiers}: {e}")
+        release(repo_url, repo_dir)
+
+
+@app.get("/embedding-cache/stats")
+async def embedding_cache_stats():
+    """Статистика попаданий в кэш эмбеддингов"""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
 
 
 # Вспомогательные функции
 
-def download_repository(url: str) -> str:
-    """Скачиваем репозиторий с использованием Git"""
-    repo_dir = "/tmp/repository"
-    if os.path.exists(repo_dir):
-        os.system(f"rm -rf {repo_dir}")
-    os.system(f"git clone {url} {repo_dir}")
-    return repo_dir
-
-
-def split_repository(repo_dir: str) -> dict:
-    """Разбиение репозитория на AST и байткод"""
-    ast_data = []
-    files_info = []
-
-    for root, dirs, files in os.walk(repo_dir):
-        for file in files:
-            if file.endswith('.py'):
-                file_path = os.path.join(root, file)
-                # относительный путь от корня репозитория, с Unix-разделителями
-                rel_path = Path(file_path).relative_to(repo_dir).as_posix()
-
-                fragments = extract_defs_from_file(file_path, repo_dir)
-                ast_data.extend(fragments)
-
-                files_info.append({
-                    "file_path": file_path,
-                    "relative_path": rel_path,
-                })
-
-    return ast_data, files_info
-
-def extract_defs_from_file(file_path: str, repo_path: str) -> list:
-    """Извлечение функций и классов из исходного файла Python"""
-    with open(file_path, "r", encoding="utf-8") as f:
-        source = f.read()  # Читаем весь исходный код
-
-    tree = ast.parse(source)  # Парсим исходный код в AST
-    fragments = []  # Список для хранения фрагментов
-
-    for node in ast.walk(tree):
-        # Ищем только функции и классы
-        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
-            start = node.lineno
-            end = getattr(node, 'end_lineno', node.lineno)
-            
-            # Извлекаем фрагмент исходного кода для функции или класса
-            code_seg = ast.get_source_segment(source, node)
-            
-            if code_seg is None:
-                logging.error(f"Не удалось извлечь исходный код для {node.name} в {file_path}")
-                continue  # Если код не найден, пропускаем этот фрагмент
-
-            # Получаем относительный путь к файлу в репозитории
-            context = os.path.relpath(file_path, repo_path)
-            kind = type(node).__name__  # Получаем тип узла (например, FunctionDef или ClassDef)
-            
-            # Добавляем фрагмент в список
-            fragments.append({
-                "name": node.name,
-                "kind": kind,
-                "path": context,
-                "start_line": start,
-                "end_line": end,
-                "code": code_seg  # Добавляем сам код
-            })
+def download_repository(url: str, repo_dir: str) -> str:
+    """Worktree общего зеркала репозитория в папке задачи, только с .py файлами"""
+    return checkout(url, repo_dir, extension_patterns(['.py']))
+
+
+def split_repository(repo_dir: str, paths: list) -> list:
+    """Файлы репозитория по относительным путям из снимка"""
+    return [
+        {"file_path": os.path.join(repo_dir, path), "relative_path": path}
+        for path in paths
+    ]
+
+
+def iter_fragments(files_info: list, snapshot: dict, on_file=None):
+    """Поток фрагментов кода: чанки нарезаются по таблицам символов снимка, без повторного разбора"""
+    for file_info in files_info:
+        symbols = snapshot["files"][file_info["relative_path"]].get("symbols", [])
+        fragments = []
+        if symbols:
+            data = read_source(file_info["file_path"])
+            fragments = extract_fragments(data, symbols, file_info["relative_path"])
+        if on_file:
+            on_file(fragments)
+        yield from fragments
 
-    return fragments
 
 def parse_bytecode(bytecode, file_path: str) -> dict:
     """Парсинг байткода для извлечения инструкций"""
@@ -177,33 +389,50 @@ def parse_bytecode(bytecode, file_path: str) -> dict:
         'start_line': 1
     }
 
-def extract_vectors(ast_data: list) -> list:
+def extract_vectors(ast_data: list, project_id: uuid.UUID = None, model: str = EMBEDDING_MODEL) -> list:
     # Собираем фрагменты кода
     texts = [item['code'] for item in ast_data]
     
+    if not texts:
+        return []
+
     # Получаем эмбеддинги для каждого фрагмента
-    embeddings = embed_texts(texts)
+    embeddings = embed_texts(texts, model)
 
     # Формируем точки для вставки в Qdrant
     points = []
     for idx, item in enumerate(ast_data):
         points.append(PointStruct(
-            id=str(uuid.uuid4()),
+            # в общей коллекции (QDRANT_TENANCY=shared) id и parent_id выводятся из id проекта
+            id=tenant_point_id(project_id, item["id"]),
             vector=embeddings[idx].tolist(),
             payload={
                 "path":       item["path"],
                 "name":       item["name"],
+                "qualname":   item["qualname"],
                 "kind":       item["kind"],
                 "start_line": item["start_line"],
                 "end_line":   item["end_line"],
+                "parent":     item["parent"],
+                "parent_id":  tenant_point_id(project_id, item["parent_id"]),
+                "chunk":      item["chunk"],
+                "chunks":     item["chunks"],
+                # поля для фильтров по префиксу пути и модулю (common/qdrant/filters.py)
+                "dirs":       path_dirs(item["path"]),
+                "module":     module_name(item["path"]),
+                **tenant_payload(project_id, item["id"]),
             },
         ))
     return points
 
-def embed_texts(texts, batch_size=50):
+def embed_texts(texts, model=EMBEDDING_MODEL, batch_size=50):
+    model_encoder = encoder if model == EMBEDDING_MODEL else get_encoder(model)
     embeddings = []
     for i in range(0, len(texts), batch_size):
         batch = texts[i:i + batch_size]
-        embs = model.encode(batch, convert_to_numpy=True)
+        embs = cached_encode(
+            embedding_cache, model, batch,
+            model_encoder
+        )
         embeddings.append(embs)
     return np.vstack(embeddings).astype('float32')
\ No newline at end of file
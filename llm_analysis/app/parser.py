@@ -1,10 +1,11 @@
 import os
-import shutil
-import ast
 import tempfile
-from git import Repo
+import posixpath
 import networkx as nx
 from networkx.algorithms import community
+from common.vcs.clone import checkout, release, extension_patterns
+from common.ast.snapshot import get_snapshot, import_targets, call_edges
+from common.ast.symbols import is_toplevel
 from app.yandex_gpt import YandexGPTClient
 
 
@@ -18,25 +19,24 @@ class RepoParser:
         self.clone_dir = clone_dir or tempfile.mkdtemp()
         self.graph = nx.DiGraph()
         self.client = YandexGPTClient()
+        self.snapshot = None
 
     def clone_repo(self):
-        """Клонируем репозиторий в temp-директорию"""
-        Repo.clone_from(self.repo_url, self.clone_dir)
+        """Worktree общего зеркала (только .py) для кода узлов и снимок разбора этого коммита"""
+        checkout(self.repo_url, self.clone_dir, extension_patterns(['.py']))
+        self.snapshot = get_snapshot(self.repo_url, self.clone_dir)
 
     def cleanup(self):
-        """Удаляем временную папку"""
-        shutil.rmtree(self.clone_dir, ignore_errors=True)
+        """Удаляем временную папку и worktree"""
+        release(self.repo_url, self.clone_dir)
 
     def _collect_py_files(self):
         """Ищем релевантные Python-файлы (без тестов и доков)"""
-        for root, _, files in os.walk(self.clone_dir):
-            rel_root = os.path.relpath(root, self.clone_dir)
+        for rel in self.snapshot["files"]:
+            rel_root = posixpath.dirname(rel) or "."
             if rel_root.startswith(("tests", "docs")):
                 continue
-            for fname in files:
-                if not fname.endswith('.py'):
-                    continue
-                yield os.path.join(root, fname)
+            yield rel
 
     def build_graph(self):
         """
@@ -46,9 +46,8 @@ class RepoParser:
         py_files = list(self._collect_py_files())
 
         # Добавляем узлы-пакеты и узлы-модулей
-        for path in py_files:
-            rel = os.path.relpath(path, self.clone_dir)
-            parts = rel.split(os.sep)
+        for rel in py_files:
+            parts = rel.split('/')
             pkg = parts[0] if parts else ''
             pkg_id = f"pkg:{pkg}" if pkg else "pkg:root"
             if not self.graph.has_node(pkg_id):
@@ -58,25 +57,26 @@ class RepoParser:
             self.graph.add_node(mod_id, type='module', name=rel, package=pkg_id)
             self.graph.add_edge(pkg_id, mod_id, type='contains')
 
-        # Парсим AST каждого модуля
-        for path in py_files:
-            rel = os.path.relpath(path, self.clone_dir)
+        # Классы, функции, импорты и вызовы каждого модуля из снимка
+        for rel in py_files:
             mod_id = f"m:{rel}"
-            src = open(path, encoding='utf-8').read()
-            tree = ast.parse(src)
+            file = self.snapshot["files"][rel]
+            lines = None
 
             # классы и функции
-            for node in tree.body:
-                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
-                    name = node.name
+            for sym in file.get("symbols", []):
+                if is_toplevel(sym):
+                    name = sym["name"]
                     if name.startswith('_'):
                         continue
-                    ntype = 'class' if isinstance(node, ast.ClassDef) else 'function'
+                    ntype = 'class' if sym["kind"] == "ClassDef" else 'function'
                     prefix = 'c' if ntype == 'class' else 'f'
                     comp_id = f"{prefix}:{rel}:{name}"
                     pkg_id = self.graph.nodes[mod_id]['package']
-                    # извлекаем код узла
-                    code = self._extract_source(node, path)
+                    # извлекаем код узла (файл читаем один раз)
+                    if lines is None:
+                        lines = self._read_lines(os.path.join(self.clone_dir, rel))
+                    code = self._extract_source(sym, lines)
                     self.graph.add_node(comp_id,
                                         type=ntype,
                                         name=name,
@@ -86,47 +86,25 @@ class RepoParser:
                     self.graph.add_edge(comp_id, mod_id, type='contains')
 
             # импорты
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Import):
-                    for alias in node.names:
-                        tgt = alias.name.replace('.', os.sep) + '.py'
-                        tgt_path = os.path.normpath(os.path.join(self.clone_dir, tgt))
-                        if os.path.exists(tgt_path):
-                            tgt_rel = os.path.relpath(tgt_path, self.clone_dir)
-                            self.graph.add_edge(mod_id, f"m:{tgt_rel}", type='import')
-                elif isinstance(node, ast.ImportFrom) and node.module:
-                    base = node.module.replace('.', os.sep) + '.py'
-                    tgt_path = os.path.normpath(os.path.join(self.clone_dir, base))
-                    if os.path.exists(tgt_path):
-                        tgt_rel = os.path.relpath(tgt_path, self.clone_dir)
-                        self.graph.add_edge(mod_id, f"m:{tgt_rel}", type='import')
+            for tgt_rel in import_targets(self.snapshot, rel):
+                self.graph.add_edge(mod_id, f"m:{tgt_rel}", type='import')
 
             # вызовы функций
-            class CallVisitor(ast.NodeVisitor):
-                def __init__(self, graph, current):
-                    self.graph = graph
-                    self.current = current
-                def visit_Call(self, call):
-                    if isinstance(call.func, ast.Name):
-                        tgt = f"f:{rel}:{call.func.id}"
-                        if self.graph.has_node(tgt):
-                            self.graph.add_edge(self.current, tgt, type='call')
-                    self.generic_visit(call)
-
-            for node in tree.body:
-                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                    CallVisitor(self.graph, f"f:{rel}:{node.name}").visit(node)
-                elif isinstance(node, ast.ClassDef):
-                    for child in node.body:
-                        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                            CallVisitor(self.graph, f"f:{rel}:{child.name}").visit(child)
+            for caller, callee in call_edges(file):
+                tgt = f"f:{rel}:{callee}"
+                if self.graph.has_node(tgt):
+                    self.graph.add_edge(f"f:{rel}:{caller}", tgt, type='call')
 
         return self.graph
 
-    def _extract_source(self, node, filepath):
-        """Извлекаем исходный код узла AST по номерам строк"""
-        lines = open(filepath, encoding='utf-8').read().splitlines()
-        return '\n'.join(lines[node.lineno-1: node.end_lineno])
+    @staticmethod
+    def _read_lines(filepath):
+        with open(filepath, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def _extract_source(self, sym, lines):
+        """Извлекаем исходный код определения по номерам строк"""
+        return '\n'.join(lines[sym["lineno"]-1: sym["end_lineno"]])
 
     def summarize_functions(self):
         self.function_summaries = {}
@@ -1,9 +1,9 @@
-import os
 import shutil
 import tempfile
-import ast
-from git import Repo
+import posixpath
 import networkx as nx
+from common.ast.snapshot import get_snapshot, import_targets, call_edges
+from common.ast.symbols import is_toplevel
 
 class StaticRepoParser:
     """
@@ -15,10 +15,11 @@ class StaticRepoParser:
         self.repo_url = repo_url
         self.clone_dir = clone_dir or tempfile.mkdtemp()
         self.graph = nx.DiGraph()
+        self.snapshot = None
 
     def clone_repo(self):
-        """Клонируем репозиторий в временную папку"""
-        Repo.clone_from(self.repo_url, self.clone_dir)
+        """Снимок разбора текущего коммита: исходники не нужны, worktree не создаётся"""
+        self.snapshot = get_snapshot(self.repo_url)
 
     def cleanup(self):
         """Удаляем временную папку"""
@@ -26,14 +27,12 @@ class StaticRepoParser:
 
     def _collect_py_files(self):
         """Находит все .py файлы, исключая tests, docs и .git"""
-        for root, _, files in os.walk(self.clone_dir):
+        for rel in self.snapshot["files"]:
             # пропускаем тесты, документацию и папку .git
+            root = "/" + posixpath.dirname(rel)
             if any(skip in root for skip in ('/tests', '/docs', '/.git')):
                 continue
-            for fname in files:
-                if not fname.endswith('.py'):
-                    continue
-                yield os.path.join(root, fname)
+            yield rel
 
     def build_graph(self):
         """
@@ -45,9 +44,8 @@ class StaticRepoParser:
         py_files = list(self._collect_py_files())
 
         # 1) Узлы-пакеты и модули
-        for path in py_files:
-            rel = os.path.relpath(path, self.clone_dir)
-            parts = rel.split(os.sep)
+        for rel in py_files:
+            parts = rel.split('/')
             pkg = parts[0] if len(parts) > 1 else 'root'
             pkg_id = f"pkg:{pkg}"
             if not self.graph.has_node(pkg_id):
@@ -60,20 +58,18 @@ class StaticRepoParser:
                                 package=pkg_id)
             self.graph.add_edge(pkg_id, mod_id, type='contains')
 
-        # 2) Парсинг AST: классы, функции, импорты и вызовы
-        for path in py_files:
-            rel = os.path.relpath(path, self.clone_dir)
+        # 2) Классы, функции, импорты и вызовы из снимка
+        for rel in py_files:
             mod_id = f"m:{rel}"
-            src = open(path, encoding='utf-8').read()
-            tree = ast.parse(src)
+            file = self.snapshot["files"][rel]
 
             # a) классы и функции
-            for node in tree.body:
-                if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
-                    name = node.name
+            for sym in file.get("symbols", []):
+                if is_toplevel(sym):
+                    name = sym["name"]
                     if name.startswith('_'):
                         continue
-                    ntype = 'class' if isinstance(node, ast.ClassDef) else 'function'
+                    ntype = 'class' if sym["kind"] == "ClassDef" else 'function'
                     prefix = 'c' if ntype == 'class' else 'f'
                     comp_id = f"{prefix}:{rel}:{name}"
                     pkg_id = self.graph.nodes[mod_id]['package']
@@ -85,40 +81,14 @@ class StaticRepoParser:
                     self.graph.add_edge(comp_id, mod_id, type='contains')
 
             # b) импорты
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Import):
-                    for alias in node.names:
-                        tgt = alias.name.replace('.', os.sep) + '.py'
-                        tgt_path = os.path.normpath(os.path.join(self.clone_dir, tgt))
-                        if os.path.exists(tgt_path):
-                            tgt_rel = os.path.relpath(tgt_path, self.clone_dir)
-                            self.graph.add_edge(mod_id, f"m:{tgt_rel}", type='import')
-                elif isinstance(node, ast.ImportFrom) and node.module:
-                    base = node.module.replace('.', os.sep) + '.py'
-                    tgt_path = os.path.normpath(os.path.join(self.clone_dir, base))
-                    if os.path.exists(tgt_path):
-                        tgt_rel = os.path.relpath(tgt_path, self.clone_dir)
-                        self.graph.add_edge(mod_id, f"m:{tgt_rel}", type='import')
+            for tgt_rel in import_targets(self.snapshot, rel):
+                self.graph.add_edge(mod_id, f"m:{tgt_rel}", type='import')
 
             # c) вызовы функций
-            class CallVisitor(ast.NodeVisitor):
-                def __init__(self, graph, current):
-                    self.graph = graph
-                    self.current = current
-                def visit_Call(self, call):
-                    if isinstance(call.func, ast.Name):
-                        tgt = f"f:{rel}:{call.func.id}"
-                        if self.graph.has_node(tgt):
-                            self.graph.add_edge(self.current, tgt, type='call')
-                    self.generic_visit(call)
-
-            for node in tree.body:
-                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                    CallVisitor(self.graph, f"f:{rel}:{node.name}").visit(node)
-                elif isinstance(node, ast.ClassDef):
-                    for child in node.body:
-                        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                            CallVisitor(self.graph, f"f:{rel}:{child.name}").visit(child)
+            for caller, callee in call_edges(file):
+                tgt = f"f:{rel}:{callee}"
+                if self.graph.has_node(tgt):
+                    self.graph.add_edge(f"f:{rel}:{caller}", tgt, type='call')
 
         return self.graph
 
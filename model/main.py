@@ -10,17 +10,9 @@ from pydantic import BaseModel
 # === OpenAI v1 SDK setup ===
 from openai import OpenAI
 
-# Minio client setup (assumed imported and configured elsewhere)
-from minio import Minio
-
-# Minio configuration
-MINIO_BUCKET = os.getenv("MINIO_BUCKET", "mybucket")
-minio_client = Minio(
-    os.getenv("MINIO_ENDPOINT", "minio:9000"),
-    access_key=os.getenv("MINIO_ROOT_USER", ""),
-    secret_key=os.getenv("MINIO_ROOT_PASSWORD", ""),
-    secure=False
-)
+# Исходники проектов в Minio: архив с индексом смещений (см. common/s3/pack.py)
+from common.s3.download import get_file
+from common.s3.cache import object_cache
 
 # Загрузка API-ключа из окружения
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -41,23 +33,19 @@ class ChatRequest(BaseModel):
     seed_prompt: str
     temperature: float = 0.7
     max_tokens: int = 512
+    project_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     thoughts: List[Dict[str, Any]]
     answer: str
 
 # === Функция для получения кода из Minio ===
-def get_code_from_minio(file_path: str) -> str:
-    """Получаем код из Minio по пути файла"""
-    try:
-        key = f"repository_code/{file_path}"
-        response = minio_client.get_object(MINIO_BUCKET, key)
-        code = response.read().decode('utf-8')
-        print(code)
-        return code
-    except Exception as e:
-        logging.error(f"Ошибка при загрузке файла из Minio: {e}")
+def get_code_from_minio(project_id: str, file_path: str) -> str:
+    """Получаем код из Minio по пути файла: один range GET из архива проекта"""
+    if not project_id:
+        logging.error(f"Не указан проект для файла {file_path}")
         return ""
+    return get_file(project_id, file_path)
 
 # === Описание функций для LLM ===
 functions = [
@@ -72,7 +60,8 @@ functions = [
         "parameters": {
             "type": "object",
             "properties": {
-                "file_path": {"type": "string", "description": "Путь к файлу внутри bucket 'repository_code'"}
+                "file_path": {"type": "string", "description": "Путь к файлу относительно корня репозитория"},
+                "project_id": {"type": "string", "description": "UUID проекта (суффикс метки Context_<uuid> у узлов графа)"}
             },
             "required": ["file_path"]
         }
@@ -97,7 +86,8 @@ def call_execute_cypher(query: str, params: Dict[str, Any]) -> Dict[str, Any]:
     return {"records": data.get("records", []), "logs": logs}
 
 # === Основная self-chat логика ===
-def openai_self_chat_with_db(seed_prompt: str, temperature: float, max_tokens: int) -> ChatResponse:
+def openai_self_chat_with_db(seed_prompt: str, temperature: float, max_tokens: int,
+                             project_id: Optional[str] = None) -> ChatResponse:
     history = [
         {
             "role": "system",
@@ -281,7 +271,7 @@ def openai_self_chat_with_db(seed_prompt: str, temperature: float, max_tokens: i
             elif fn == "execute_cypher":
                 result = call_execute_cypher(args["query"], args.get("params", {}))
             elif fn == "get_code_from_minio":
-                code = get_code_from_minio(args.get("file_path", ""))
+                code = get_code_from_minio(args.get("project_id") or project_id, args.get("file_path", ""))
                 result = {"code": code}
             else:
                 result = {"error": f"Unknown function {fn}"}
@@ -300,4 +290,10 @@ def openai_self_chat_with_db(seed_prompt: str, temperature: float, max_tokens: i
 async def self_chat(req: ChatRequest) -> ChatResponse:
     if not req.seed_prompt:
         raise HTTPException(status_code=400, detail="Empty seed_prompt")
-    return openai_self_chat_with_db(req.seed_prompt, req.temperature, req.max_tokens)
+    return openai_self_chat_with_db(req.seed_prompt, req.temperature, req.max_tokens, req.project_id)
+
+
+@app.get("/file-cache/stats")
+async def file_cache_stats():
+    """Статистика кэша исходников Minio"""
+    return object_cache.stats()
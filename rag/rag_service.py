@@ -1,86 +1,321 @@
-import os, logging, uuid
-from typing import List, Dict
+import os, asyncio, logging, uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import List, Dict, Optional
 
 from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-
-from sentence_transformers import SentenceTransformer
+from qdrant_client import models
 
 from common.auth.dependency import get_current_user
 from common.schemas.user import User
 from common.schemas.project import Project
 from common.s3.base import get_s3_connection, MINIO_URL
-from common.s3.download import get_file
+from common.s3.download import get_snippets
+from common.s3.cache import object_cache
+from common.s3.manifest import load_index_version
+from common.cache.lru import LRUCache
+from common.ast.identifiers import IdentifierIndex, load_identifiers
 from common.database.dependency import get_db
-from common.qdrant.base import get_qdrant_connection
+from common.qdrant.base import get_async_qdrant_connection
+from common.qdrant.collections import search_params
+from common.qdrant.filters import scope, scope_filter, in_scope
+from common.qdrant.fusion import fuse
+from common.qdrant.tenancy import collection_for, tenant_filter
+from common.qdrant.versions import collection_model, resolve
+from common.embeddings.base import EMBEDDING_MODEL, get_encoder
+from common.llm.context import LLM_CONTEXT_MAX_TOKENS, assemble_context, merge_snippets, get_token_counter
 
 app = FastAPI()
 
-# Инициализация модели для эмбеддингов
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Энкодер для эмбеддингов: общий сервис (EMBEDDING_URL) или локальная модель с батчингом
+encoder = get_encoder()
 
 # Подключение к Minio
 logging.basicConfig(level=logging.DEBUG)
 logging.debug(f"Connecting to Minio at {MINIO_URL}")
 
+# Токенизатор LLM для бюджета промпта загружается при старте, а не в первом запросе
+get_token_counter()
+
 minio_client = get_s3_connection()
-qdrant_client = get_qdrant_connection()
+qdrant_client = get_async_qdrant_connection()
 
 # Константы для хранения в Minio и Qdrant
 MINIO_BUCKET = os.getenv('AWS_S3_BUCKET')
 QDRANT_COLLECTION = 'documents'
 
+# Обращения к Minio (клиент синхронный) выполняются в пуле потоков, а не в цикле событий;
+# фрагменты разных файлов загружаются параллельно, по истечении срока отдаём то, что успели
+RAG_HYDRATE_WORKERS = int(os.getenv("RAG_HYDRATE_WORKERS", "16"))
+RAG_HYDRATE_TIMEOUT = float(os.getenv("RAG_HYDRATE_TIMEOUT", "3"))
+s3_pool = ThreadPoolExecutor(max_workers=RAG_HYDRATE_WORKERS, thread_name_prefix="rag-s3")
+
+# Кодирование запросов блокирующее (локальная модель или HTTP) — отдельный пул,
+# чтобы долгий проход энкодера не занимал потоки загрузки кода
+RAG_ENCODE_WORKERS = int(os.getenv("RAG_ENCODE_WORKERS", "4"))
+encode_pool = ThreadPoolExecutor(max_workers=RAG_ENCODE_WORKERS, thread_name_prefix="rag-encode")
+
+
+# Ограничение размера пакетного запроса
+RAG_BATCH_MAX_QUERIES = int(os.getenv("RAG_BATCH_MAX_QUERIES", "256"))
+RAG_MAX_TOP_K = int(os.getenv("RAG_MAX_TOP_K", "50"))
+
+PAYLOAD_FIELDS = ["path", "name", "kind", "start_line", "end_line"]
+NO_SCOPE = scope()
+
+# Кэш эмбеддингов запросов и кэш результатов по версии индекса проекта:
+# повторная индексация меняет версию, и старые результаты больше не находятся
+RAG_QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "4096"))
+RAG_RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+query_cache = LRUCache(RAG_QUERY_CACHE_SIZE)
+result_cache = LRUCache(RAG_RESULT_CACHE_SIZE)
+
+# Индексы идентификаторов последних версий проектов (см. common/ast/identifiers.py)
+RAG_IDENTIFIER_CACHE_SIZE = int(os.getenv("RAG_IDENTIFIER_CACHE_SIZE", "32"))
+identifier_indexes = LRUCache(RAG_IDENTIFIER_CACHE_SIZE)
+
+
+class SearchScope(BaseModel):
+    path_prefix: Optional[str] = None  # Каталог или файл, например "common/s3"
+    kind: Optional[str] = None  # "class" или "function"
+    modules: Optional[List[str]] = None  # Модули ("common.s3.pack") или пути к .py файлам
 
-class QueryRequest(BaseModel):
+    def to_scope(self) -> tuple:
+        try:
+            return scope(self.path_prefix, self.kind, self.modules)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+class QueryRequest(SearchScope):
     query: str  # Запрос для поиска схожих фрагментов кода
 
 
-def retrieve_similar_code(project: str, query: str, top_k: int = 5) -> List[Dict]:
-    # Генерируем эмбеддинг
-    query_emb = model.encode([query], convert_to_numpy=True)[0]
+class BatchQueryRequest(SearchScope):
+    queries: List[str]  # Запросы, обрабатываемые одним пакетом
+    top_k: int = Field(5, ge=1, le=RAG_MAX_TOP_K)
+
+
+async def hydrate_batch(project: str, hit_lists: List[list], timeout: float = RAG_HYDRATE_TIMEOUT) -> List[List[Dict]]:
+    """
+    Код для найденных точек нескольких запросов: попадания всех запросов
+    группируются по файлу, каждый файл читается один раз, файлы — параллельно,
+    одинаковые фрагменты не дублируются. Фрагменты файлов, не успевших
+    загрузиться за timeout секунд, пропускаются; порядок попаданий сохраняется.
+    """
+    by_path: Dict[str, Dict[tuple, list]] = {}
+    for q, hits in enumerate(hit_lists):
+        for i, pt in enumerate(hits):
+            meta = pt.payload or {}
+            if not all(k in meta for k in PAYLOAD_FIELDS):
+                logging.warning(f"Неполные метаданные у точки {pt.id}")
+                continue
+            span = (meta["start_line"], meta["end_line"])
+            by_path.setdefault(meta["path"], {}).setdefault(span, []).append((q, i, meta))
+
+    if not by_path:
+        return [[] for _ in hit_lists]
+
+    futures = {
+        asyncio.wrap_future(s3_pool.submit(get_snippets, project, path, list(spans))): path
+        for path, spans in by_path.items()
+    }
+    done, not_done = await asyncio.wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+        logging.warning(f"Файл {futures[future]} не загружен за {timeout}с, фрагменты пропущены")
+
+    structures = [{} for _ in hit_lists]
+    for future in done:
+        spans = by_path[futures[future]]
+        for refs, snippet in zip(spans.values(), future.result()):
+            for q, i, meta in refs:
+                structures[q][i] = {
+                    "name": meta["name"],
+                    "type": meta["kind"],
+                    "path": meta["path"],
+                    "start_line": meta["start_line"],
+                    "end_line": meta["end_line"],
+                    "code": snippet
+                }
+    return [[found[i] for i in sorted(found)] for found in structures]
+
+
+async def hydrate(project: str, hits: list, timeout: float = RAG_HYDRATE_TIMEOUT) -> List[Dict]:
+    """Код для найденных точек одного запроса (см. hydrate_batch)"""
+    return (await hydrate_batch(project, [hits], timeout))[0]
+
+
+def encode_with(model: str, texts: List[str]):
+    # энкодер другой модели загружается при первом обращении — тоже в encode_pool
+    return (encoder if model == EMBEDDING_MODEL else get_encoder(model)).encode(texts)
+
+
+async def encode_queries(queries: List[str], model: str = EMBEDDING_MODEL) -> list:
+    """Эмбеддинги запросов: из кэша, недостающие — одним проходом энкодера в encode_pool"""
+    vectors = [query_cache.get((model, query)) for query in queries]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(encode_pool, encode_with, model, [queries[i] for i in missing])
+        for i, vector in zip(missing, encoded):
+            vectors[i] = vector
+            query_cache.put((model, queries[i]), vector)
+    return vectors
+
+
+async def active_collection(project: str, refresh: bool = False) -> str:
+    """Текущая версия коллекции проекта (алиас разрешается здесь, чтобы запрос кодировался её моделью)"""
+    return await asyncio.get_running_loop().run_in_executor(s3_pool, resolve, collection_for(project), refresh)
+
+
+async def search_vectors(project: str, collection: str, queries: List[str], top_k: int,
+                         search_filter: Optional[models.Filter]) -> list:
+    """
+    Пакетный векторный поиск в версии коллекции collection. Если версию уже
+    заменили и удалили (кэш алиасов устарел), перечитываем алиас и повторяем
+    с моделью новой версии.
+    """
+    for attempt in range(2):
+        query_embs = await encode_queries(queries, collection_model(collection)[0])
+        try:
+            return await qdrant_client.query_batch_points(
+                collection_name=collection,
+                requests=[
+                    models.QueryRequest(
+                        query=[float(x) for x in emb],
+                        limit=top_k,
+                        filter=tenant_filter(project, search_filter),
+                        params=search_params(),
+                        with_payload=PAYLOAD_FIELDS,
+                    )
+                    for emb in query_embs
+                ],
+            )
+        except Exception:
+            fresh = await active_collection(project, refresh=True)
+            if attempt or fresh == collection:
+                raise
+            collection = fresh
+
+
+async def index_version(project: str):
+    return await asyncio.get_running_loop().run_in_executor(s3_pool, load_index_version, project)
+
+
+def cache_results(key: tuple, hits: list, structures: List[Dict]):
+    # неполный результат (файл не успел загрузиться) не кэшируем
+    if key[1] is not None and len(structures) == len(hits):
+        result_cache.put(key, structures)
+
+
+def _load_identifier_index(project: str, version: str) -> Optional[IdentifierIndex]:
+    identifiers = load_identifiers(project, version.split(":")[0])
+    return IdentifierIndex(identifiers) if identifiers else None
+
+
+async def identifier_index(project: str, version: Optional[str]) -> Optional[IdentifierIndex]:
+    """Индекс идентификаторов версии проекта; отсутствие индекса тоже кэшируется (False)"""
+    if version is None:
+        return None
+    index = identifier_indexes.get((project, version))
+    if index is None:
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(s3_pool, _load_identifier_index, project, version) or False
+        identifier_indexes.put((project, version), index)
+    return index or None
+
+
+def identifier_hits(entries: List[dict]) -> list:
+    """Определения из индекса идентификаторов в виде точек, как у Qdrant"""
+    return [SimpleNamespace(id=f"{e['path']}:{e['start_line']}", payload=e) for e in entries]
 
-    # Ищем в Qdrant с payload
-    results = qdrant_client.search(
-        collection_name=project,
-        query_vector=query_emb,
-        limit=top_k,
-        with_payload=["path", "name", "kind", "start_line", "end_line"]
-    )
 
-    structures: List[Dict] = []
-    for pt in results:
-        meta = pt.payload or {}
-        if not all(k in meta for k in ("path", "name", "kind", "start_line", "end_line")):
-            logging.warning(f"Неполные метаданные у точки {pt.id}")
-            continue
-
-        full_code = get_file(f"{project}/repository_code", meta["path"])
-        lines = full_code.splitlines()
-        start, end = meta["start_line"], meta["end_line"]
-        snippet = "\n".join(lines[start-1:end])
-
-        structures.append({
-            "name": meta["name"],
-            "type": meta["kind"],
-            "code": snippet
-        })
-
-    return structures
-
-
-def build_llm_input(query: str, structures: List[Dict]) -> str:
-    prompt = [f"Запрос: {query}", "Используя следующие фрагменты кода, ответьте на запрос:\n"]
-    for idx, s in enumerate(structures, 1):
-        prompt.append(f"Фрагмент {idx}:")
-        prompt.append(f"  Name: {s['name']}")
-        prompt.append(f"  Type: {s['type']}")
-        prompt.append("  Code:")
-        prompt.append(f"```\n{s['code']}\n```")
-    prompt.append("\nПожалуйста, сформируйте развёрнутый ответ, ссылаясь на эти фрагменты.")
+async def retrieve_similar_code(project: str, query: str, top_k: int = 5,
+                                search_scope: tuple = NO_SCOPE) -> List[Dict]:
+    return (await retrieve_similar_code_batch(project, [query], top_k, search_scope))[0]
+
+
+async def retrieve_similar_code_batch(project: str, queries: List[str], top_k: int = 5,
+                                      search_scope: tuple = NO_SCOPE) -> List[List[Dict]]:
+    """
+    Поиск для пакета запросов. Запросы, все имена которых (в `кавычках`, с
+    точкой, подчёркиванием или CamelCase) найдены точно, отвечаются из индекса
+    идентификаторов без энкодера и Qdrant; остальные — один проход энкодера и
+    один пакетный запрос в Qdrant, с префиксными и нечёткими совпадениями
+    имён, слитыми с векторной выдачей. search_scope
+    (см. common/qdrant/filters.py) ограничивает оба вида поиска.
+    """
+    version = await index_version(str(project))
+    collection = await active_collection(str(project))
+    keys = [(str(project), version, query, top_k, search_scope, collection) for query in queries]
+    batch = [result_cache.get(key) if version is not None else None for key in keys]
+    missing = [i for i, structures in enumerate(batch) if structures is None]
+    if not missing:
+        return batch
+
+    identifiers = await identifier_index(str(project), version)
+    search_filter = scope_filter(search_scope)
+    accept = (lambda entry: in_scope(entry, search_scope)) if search_filter else None
+    hit_lists = {}
+    candidates = {}
+    for i in missing:
+        matches, exact = identifiers.search(queries[i], top_k, accept) if identifiers else ([], False)
+        if exact:
+            hit_lists[i] = identifier_hits(matches)
+        elif matches:
+            candidates[i] = identifier_hits(matches)
+
+    vector = [i for i in missing if i not in hit_lists]
+    if vector:
+        responses = await search_vectors(str(project), collection, [queries[i] for i in vector], top_k, search_filter)
+        for i, response in zip(vector, responses):
+            hit_lists[i] = response.points
+            if i in candidates:
+                hit_lists[i] = fuse([response.points, candidates[i]], top_k)
+
+    hits = [hit_lists[i] for i in missing]
+    for i, hits_, structures in zip(missing, hits, await hydrate_batch(str(project), hits)):
+        batch[i] = structures
+        cache_results(keys[i], hits_, structures)
+    return batch
+
+
+def render_snippet(idx: int, s: Dict) -> str:
+    prompt = [f"Фрагмент {idx}:", f"  Name: {s['name']}", f"  Type: {s['type']}"]
+    if s.get("path"):
+        prompt.append(f"  Path: {s['path']}:{s['start_line']}-{s['end_line']}")
+    prompt.append("  Code:")
+    prompt.append(f"```\n{s['code']}\n```")
     return "\n".join(prompt)
 
 
+def build_llm_input(query: str, structures: List[Dict], max_tokens: int = LLM_CONTEXT_MAX_TOKENS) -> str:
+    """
+    Промпт для LLM: пересекающиеся и соседние фрагменты одного файла
+    склеиваются, повторы убираются, фрагменты идут по релевантности и
+    обрезаются по бюджету max_tokens (см. common/llm/context.py)
+    """
+    return assemble_context(
+        f"Запрос: {query}\nИспользуя следующие фрагменты кода, ответьте на запрос:\n",
+        "\nПожалуйста, сформируйте развёрнутый ответ, ссылаясь на эти фрагменты.",
+        merge_snippets(structures),
+        render_snippet,
+        max_tokens,
+    )
+
+
+def check_project(project_id: uuid.UUID, user: User, db: Session):
+    project = db.query(Project).filter(Project.id == str(project_id)).first()
+    if not project or project.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if project.owner_id != user.id:
+        raise HTTPException(status_code=403, detail="Not allowed to ingest this project")
+
+
 @app.post("/rag-query/{project_id}")
 async def rag_query(
     project_id: uuid.UUID,
@@ -88,14 +323,12 @@ async def rag_query(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    project = db.query(Project).filter(Project.id == str(project_id)).first()
-    if not project or project.owner_id != user.id:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=403, detail="Not allowed to ingest this project")
+    # запрос к базе синхронный — выполняем вне цикла событий
+    await run_in_threadpool(check_project, project_id, user, db)
+    search_scope = req.to_scope()
 
     try:
-        structures = retrieve_similar_code(project_id, req.query)
+        structures = await retrieve_similar_code(project_id, req.query, search_scope=search_scope)
         llm_input = build_llm_input(req.query, structures)
         return {
             "query": req.query,
@@ -103,4 +336,45 @@ async def rag_query(
             "llm_input": llm_input
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/rag-query-batch/{project_id}")
+async def rag_query_batch(
+    project_id: uuid.UUID,
+    req: BatchQueryRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # запрос к базе синхронный — выполняем вне цикла событий
+    await run_in_threadpool(check_project, project_id, user, db)
+    if len(req.queries) > RAG_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many queries (max {RAG_BATCH_MAX_QUERIES})")
+    search_scope = req.to_scope()
+
+    try:
+        batch = await retrieve_similar_code_batch(project_id, req.queries, req.top_k, search_scope)
+        return {
+            "results": [
+                {
+                    "query": query,
+                    "structures": structures,
+                    "llm_input": build_llm_input(query, structures)
+                }
+                for query, structures in zip(req.queries, batch)
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/query-cache/stats")
+async def query_cache_stats():
+    """Статистика кэшей эмбеддингов запросов и результатов поиска"""
+    return {"embeddings": query_cache.stats(), "results": result_cache.stats()}
+
+
+@app.get("/file-cache/stats")
+async def file_cache_stats():
+    """Статистика кэша исходников Minio"""
+    return object_cache.stats()
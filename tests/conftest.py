@@ -0,0 +1,98 @@
+import io, os, sys, hashlib, datetime
+from types import SimpleNamespace
+
+import pytest
+
+# Модули common создают клиентов MinIO и Qdrant при импорте; соединение не открывается
+os.environ.setdefault("QDRANT_URL", ":memory:")
+os.environ.setdefault("AWS_S3_BUCKET", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minio.error import S3Error, ServerError  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, data: bytes, etag: str):
+        self.data = data
+        self.headers = {"ETag": etag}
+
+    def read(self) -> bytes:
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """Бакет MinIO в памяти: те вызовы клиента, которыми пользуются модули common"""
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self._clock = 0
+
+    def _now(self) -> datetime.datetime:
+        self._clock += 1
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(microseconds=self._clock)
+
+    def _missing(self, key: str):
+        return S3Error(None, "NoSuchKey", "not found", key, "req", "host")
+
+    def put_object(self, bucket, key, data, length, content_type=None, metadata=None, part_size=0):
+        body = data.read(length) if length >= 0 else data.read()
+        self.calls.append(("put", key))
+        self.objects[key] = SimpleNamespace(
+            data=body, etag=f'"{hashlib.md5(body).hexdigest()}"', last_modified=self._now(),
+            metadata={f"x-amz-meta-{k}": v for k, v in (metadata or {}).items()},
+        )
+
+    def get_object(self, bucket, key, offset=0, length=0, request_headers=None):
+        self.calls.append(("get", key, offset, length))
+        if key not in self.objects:
+            raise self._missing(key)
+        obj = self.objects[key]
+        if request_headers and request_headers.get("If-None-Match") == obj.etag:
+            raise ServerError("not modified", 304)
+        data = obj.data[offset:offset + length] if length else obj.data[offset:]
+        return FakeResponse(data, obj.etag)
+
+    def stat_object(self, bucket, key):
+        if key not in self.objects:
+            raise self._missing(key)
+        obj = self.objects[key]
+        return SimpleNamespace(etag=obj.etag, metadata=obj.metadata, last_modified=obj.last_modified,
+                               size=len(obj.data))
+
+    def remove_object(self, bucket, key):
+        self.calls.append(("remove", key))
+        self.objects.pop(key, None)
+
+    def remove_objects(self, bucket, delete_objects):
+        for obj in delete_objects:
+            self.remove_object(bucket, obj.name)
+        return iter([])
+
+    def list_objects(self, bucket, prefix="", recursive=False):
+        seen_dirs = set()
+        for key in sorted(self.objects):
+            if not key.startswith(prefix):
+                continue
+            rest = key[len(prefix):]
+            if not recursive and "/" in rest:
+                name = prefix + rest.split("/", 1)[0] + "/"
+                if name not in seen_dirs:
+                    seen_dirs.add(name)
+                    yield SimpleNamespace(object_name=name, is_dir=True, last_modified=None)
+                continue
+            yield SimpleNamespace(object_name=key, is_dir=False, last_modified=self.objects[key].last_modified)
+
+
+@pytest.fixture
+def fake_minio(monkeypatch):
+    import common.s3.base
+    client = FakeMinio()
+    monkeypatch.setattr(common.s3.base, "minio_client", client)
+    return client
@@ -0,0 +1,66 @@
+import pytest
+
+from common.ast import chunking
+from common.ast.chunking import estimate_tokens, split_windows
+from common.ast.fragments import extract_fragments
+from common.ast.symbols import parse_source
+
+
+def test_estimate_splits_identifiers_like_wordpiece():
+    # BERT делит по «_» и знакам: snake, _, case, _, identifier — не меньше 5 токенов
+    assert estimate_tokens("snake_case_identifier") >= 5
+    assert estimate_tokens("self.session.get(User, user_id)") >= 11
+    # кириллицы нет в словаре MiniLM: токен на букву
+    assert estimate_tokens("Где") == 3
+
+
+def test_estimate_is_upper_bound_of_model_tokenizer():
+    tokenizers = pytest.importorskip("tokenizers")
+    try:
+        tokenizer = tokenizers.Tokenizer.from_pretrained(chunking.CHUNK_TOKENIZER)
+    except Exception as e:
+        pytest.skip(f"токенизатор недоступен: {e}")
+    with open(chunking.__file__) as f:
+        source = f.read()
+    for line in source.split("\n"):
+        assert estimate_tokens(line) >= len(tokenizer.encode(line, add_special_tokens=False).ids), line
+
+
+def lines_of(count):
+    return [f"line {chr(97 + i % 26)} x y z" for i in range(count)]
+
+
+def test_split_windows_respects_budget_and_covers_lines():
+    lines = lines_of(40)
+    windows = split_windows(lines, 10, max_tokens=50, overlap=12)
+    assert windows[0][0] == 10 and windows[-1][1] == 49
+    for (start, end, text), (next_start, _, _) in zip(windows, windows[1:]):
+        assert text == "\n".join(lines[start - 10:end - 10 + 1])
+        assert sum(estimate_tokens(line) + 1 for line in text.split("\n")) <= 50
+        # окна перекрываются, но каждое продвигается вперёд
+        assert start < next_start <= end
+    assert windows[-1][2].split("\n")[-1] == lines[-1]
+
+
+def test_split_windows_without_overlap():
+    windows = split_windows(lines_of(20), 1, max_tokens=50, overlap=0)
+    assert all(prev[1] + 1 == cur[0] for prev, cur in zip(windows, windows[1:]))
+
+
+def test_split_windows_single_long_line_is_its_own_window():
+    lines = ["short", " ".join(["word"] * 100), "short"]
+    windows = split_windows(lines, 1, max_tokens=20, overlap=0)
+    assert [(s, e) for s, e, _ in windows] == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_long_class_header_is_split(monkeypatch):
+    monkeypatch.setattr(chunking, "_tokenizer", estimate_tokens)
+    attributes = "\n".join(f"    field_{i}: int = {i}" for i in range(120))
+    source = f"class Config:\n{attributes}\n\n    def method(self):\n        return 1\n".encode()
+    fragments = extract_fragments(source, parse_source(source)["symbols"], "config.py")
+    headers = [f for f in fragments if f["kind"] == "ClassDef"]
+    method = next(f for f in fragments if f["kind"] == "FunctionDef")
+    assert len(headers) > 1
+    assert headers[0]["start_line"] == 1 and headers[-1]["end_line"] <= 122
+    assert all(estimate_tokens(f["code"]) <= chunking.CHUNK_MAX_TOKENS + len(f["code"].split("\n")) for f in headers)
+    assert method["parent_id"] == headers[0]["id"]
@@ -0,0 +1,54 @@
+from common.ast.chunking import estimate_tokens
+from common.llm.context import merge_snippets, assemble_context
+
+
+def snippet(name, path, start, end, rank_code=None):
+    code = rank_code or "\n".join(f"line {i}" for i in range(start, end + 1))
+    return {"name": name, "type": "FunctionDef", "path": path, "start_line": start, "end_line": end, "code": code}
+
+
+def test_merge_overlapping_and_adjacent():
+    merged = merge_snippets([snippet("b", "a.py", 5, 8), snippet("a", "a.py", 1, 4), snippet("c", "a.py", 7, 10)])
+    assert len(merged) == 1
+    # имена склеенного блока идут по строкам файла
+    assert merged[0]["name"] == "a, b, c"
+    assert (merged[0]["start_line"], merged[0]["end_line"]) == (1, 10)
+    assert merged[0]["code"].split("\n") == [f"line {i}" for i in range(1, 11)]
+
+
+def test_merge_keeps_gaps_and_rank_order():
+    merged = merge_snippets([snippet("far", "a.py", 20, 22), snippet("near", "a.py", 1, 2), snippet("x", "b.py", 1, 1)])
+    assert [s["name"] for s in merged] == ["far", "near", "x"]
+
+
+def test_merge_drops_duplicates_and_mismatched_ranges():
+    same = snippet("a", "a.py", 1, 2)
+    odd = snippet("odd", "a.py", 2, 5, rank_code="only one line")
+    merged = merge_snippets([same, dict(same, name="dup"), odd])
+    assert [s["name"] for s in merged] == ["a", "odd"]
+    assert merged[1]["code"] == "only one line"
+
+
+def render(idx, s):
+    return f"#{idx} {s['name']}\n{s['code']}"
+
+
+def test_assemble_fits_everything():
+    snippets = [snippet("a", "a.py", 1, 3), snippet("b", "b.py", 1, 3)]
+    prompt = assemble_context("HEAD", "FOOT", snippets, render, max_tokens=1000, count_tokens=estimate_tokens)
+    assert prompt == "\n".join(["HEAD", render(1, snippets[0]), render(2, snippets[1]), "FOOT"])
+
+
+def test_assemble_truncates_and_stops():
+    big = snippet("big", "a.py", 1, 200)
+    prompt = assemble_context("HEAD", "FOOT", [big, snippet("next", "b.py", 1, 2)], render,
+                              max_tokens=150, count_tokens=estimate_tokens)
+    assert estimate_tokens(prompt) <= 150
+    assert prompt.startswith("HEAD\n#1 big\nline 1\n")
+    assert "...\nFOOT" in prompt and "next" not in prompt
+
+
+def test_assemble_skips_too_short_remainder():
+    prompt = assemble_context("HEAD", "FOOT", [snippet("big", "a.py", 1, 200)], render,
+                              max_tokens=20, count_tokens=estimate_tokens)
+    assert prompt == "HEAD\nFOOT"
@@ -0,0 +1,50 @@
+import numpy as np
+
+from common.embeddings.cache import EmbeddingCache, cache_key, cached_encode, normalize_code
+
+
+class CountingEncoder:
+    variant = "torch"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_key_ignores_line_endings_and_trailing_spaces():
+    assert normalize_code("\ndef f():  \r\n    pass\r\n\n") == "def f():\n    pass"
+    assert cache_key("m", "torch", "x = 1  \r\n") == cache_key("m", "torch", "x = 1")
+    assert cache_key("m", "torch", "x") != cache_key("m", "onnx-int8", "x")
+    assert cache_key("m", "torch", "x") != cache_key("other", "torch", "x")
+
+
+def test_cached_encode_encodes_each_text_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    encoder = CountingEncoder()
+    first = cached_encode(cache, "m", ["a", "bb", "a"], encoder)
+    assert encoder.encoded == ["a", "bb"]
+    second = cached_encode(cache, "m", ["bb", "ccc", "a "], encoder)
+    assert encoder.encoded == ["a", "bb", "ccc"]
+    assert first.tolist() == [[1, 1], [2, 1], [1, 1]]
+    assert second.tolist() == [[2, 1], [3, 1], [1, 1]]
+    assert second.dtype == np.float32
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_cache_persists_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    vector = np.zeros((1, 4), dtype=np.float32)  # 16 байт
+    cache = EmbeddingCache(path, max_bytes=60)
+    for key in ["a", "b", "c"]:
+        cache.put_many([key], vector)
+    cache.get_many(["a"])
+    cache.put_many(["d"], vector)
+    assert cache.evictions == 1
+    assert [v is not None for v in cache.get_many(["a", "b", "c", "d"])] == [True, False, True, True]
+
+    reopened = EmbeddingCache(path, max_bytes=60)
+    assert reopened.stats()["size_bytes"] == 48
+    assert reopened.get_many(["d"])[0].tolist() == [0, 0, 0, 0]
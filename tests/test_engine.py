@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from common.embeddings import engine
+
+
+class StubBackend:
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        if self.fail_on in texts:
+            raise ValueError("сбой модели")
+        return np.array([[float(text)] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = StubBackend()
+    monkeypatch.setattr(engine, "load_backend", lambda model_name, name: backend)
+    return backend
+
+
+def test_concurrent_requests_share_a_batch(backend):
+    encoder = engine.BatchingEncoder("m", max_batch=64, max_wait_ms=200, backend="torch")
+    futures = [encoder.submit([str(i), str(i + 100)]) for i in range(5)]
+    results = [future.result(timeout=5) for future in futures]
+    for i, result in enumerate(results):
+        assert result[:, 0].tolist() == [i, i + 100]
+    assert len(backend.batches) == 1
+    assert encoder.stats()["avg_batch_size"] == 10
+    assert encoder.variant == "torch"
+
+
+def test_batch_is_closed_at_max_batch(backend):
+    encoder = engine.BatchingEncoder("m", max_batch=4, max_wait_ms=1000, backend="torch")
+    futures = [encoder.submit([str(i), str(i)]) for i in range(3)]
+    # пачка закрывается, как только набрала max_batch, не дожидаясь окна
+    futures[1].result(timeout=0.5)
+    futures[2].result(timeout=5)
+    assert [len(batch) for batch in backend.batches] == [4, 2]
+
+
+def test_error_fails_only_its_batch(backend):
+    backend.fail_on = "bad"
+    encoder = engine.BatchingEncoder("m", max_batch=64, max_wait_ms=0, backend="torch")
+    with pytest.raises(ValueError):
+        encoder.encode(["1", "bad"])
+    assert encoder.encode(["2"])[:, 0].tolist() == [2]
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+from common.qdrant.fusion import fuse
+
+
+def hit(path, start, id_=None):
+    return SimpleNamespace(id=id_ or f"{path}:{start}", payload={"path": path, "start_line": start, "end_line": start + 1})
+
+
+def test_fuse_prefers_hits_ranked_in_both_lists():
+    vector = [hit("a.py", 1), hit("b.py", 1), hit("c.py", 1)]
+    names = [hit("c.py", 1, "other-id"), hit("d.py", 1)]
+    fused = fuse([vector, names], limit=4)
+    # при равном счёте порядок — по первому списку
+    assert [(h.payload["path"], h.id) for h in fused] == [
+        ("c.py", "c.py:1"), ("a.py", "a.py:1"), ("b.py", "b.py:1"), ("d.py", "d.py:1")]
+
+
+def test_fuse_without_payload_uses_id():
+    fused = fuse([[SimpleNamespace(id=1, payload=None)], [SimpleNamespace(id=1, payload={})]], limit=5)
+    assert [h.id for h in fused] == [1]
@@ -0,0 +1,77 @@
+from common.ast.identifiers import IdentifierIndex, query_terms, code_like
+
+
+def entry(name, qualname, path, start_line=1, kind="FunctionDef"):
+    return {"name": name, "qualname": qualname, "kind": kind, "path": path,
+            "start_line": start_line, "end_line": start_line + 2}
+
+
+INDEX = IdentifierIndex({"entries": [
+    entry("authenticate", "authenticate", "app/auth.py"),
+    entry("get_user", "UserRepository.get_user", "app/repo.py", 10),
+    entry("UserRepository", "UserRepository", "app/repo.py", 1, "ClassDef"),
+    entry("User", "User", "app/models.py", 1, "ClassDef"),
+    entry("save", "User.save", "app/models.py", 5),
+]})
+
+
+def names(entries):
+    return [e["qualname"] for e in entries]
+
+
+def test_query_terms_backticks():
+    assert query_terms("где вызывается `get_user()` и `load`") == ["get_user", "load"]
+
+
+def test_query_terms_code_like_words():
+    assert query_terms("how does UserRepository.get_user handle auth_token") == [
+        "UserRepository.get_user", "auth_token"]
+
+
+def test_query_terms_single_word_query():
+    assert query_terms("authenticate?") == ["authenticate"]
+    assert query_terms("how does authentication work") == []
+
+
+def test_code_like():
+    assert code_like("a.b") and code_like("get_user") and code_like("getUser")
+    assert not code_like("auth") and not code_like("User") and not code_like("_private")
+
+
+def test_exact_code_like_match_short_circuits():
+    entries, exact = INDEX.search("get_user", 5)
+    assert names(entries) == ["UserRepository.get_user"] and exact
+
+
+def test_qualified_and_module_names():
+    assert names(INDEX.search("UserRepository.get_user", 5)[0]) == ["UserRepository.get_user"]
+    assert names(INDEX.search("models.User.save", 5)[0]) == ["User.save"]
+
+
+def test_backticked_word_is_exact():
+    entries, exact = INDEX.search("`User`", 5)
+    assert names(entries) == ["User"] and exact
+
+
+def test_bare_word_is_only_a_candidate():
+    entries, exact = INDEX.search("User", 5)
+    assert names(entries) == ["User"] and not exact
+
+
+def test_prefix_is_only_a_candidate():
+    entries, exact = INDEX.search("auth", 5)
+    assert names(entries) == ["authenticate"] and not exact
+
+
+def test_fuzzy_candidates():
+    entries, exact = INDEX.search("where is get_usr defined", 5)
+    assert names(entries) == ["UserRepository.get_user"] and not exact
+
+
+def test_fuzzy_threshold_rejects_unrelated():
+    assert INDEX.fuzzy("zzzzzz", 5) == []
+
+
+def test_accept_limits_scope():
+    entries, exact = INDEX.search("`User`", 5, accept=lambda e: e["path"] != "app/models.py")
+    assert "User" not in names(entries) and not exact
@@ -0,0 +1,61 @@
+import json, threading
+
+import pytest
+
+from common.s3 import locks
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(locks, "PROJECT_LOCK_POLL", 0.01)
+
+
+def marker(fake_minio, project_id, holder):
+    return fake_minio.objects.get(f"{project_id}/locks/{holder}.json")
+
+
+def test_ingest_lock_puts_and_removes_marker(fake_minio):
+    with locks.ingest_lock("p"):
+        assert marker(fake_minio, "p", "ingest") is not None
+    assert marker(fake_minio, "p", "ingest") is None
+
+
+def test_ingest_waits_for_reembed(fake_minio):
+    with locks.reembed_lock(["p"]):
+        with pytest.raises(TimeoutError):
+            with locks.ingest_lock("p", wait=0.05):
+                pass
+        # уступая, ингест снимает свой маркер
+        assert marker(fake_minio, "p", "ingest") is None
+    with locks.ingest_lock("p", wait=0):
+        pass
+
+
+def test_reembed_waits_for_running_ingest(fake_minio):
+    order = []
+    entered = threading.Event()
+
+    def ingest():
+        with locks.ingest_lock("p"):
+            entered.set()
+            threading.Event().wait(0.1)
+            order.append("ingest")
+
+    thread = threading.Thread(target=ingest)
+    thread.start()
+    entered.wait()
+    with locks.reembed_lock(["p", "q"]):
+        order.append("reembed")
+        assert marker(fake_minio, "q", "reembed") is not None
+    thread.join()
+    assert order == ["ingest", "reembed"]
+    assert not [key for key in fake_minio.objects if "/locks/" in key]
+
+
+def test_abandoned_marker_is_ignored(fake_minio, monkeypatch):
+    with locks.reembed_lock(["p"]):
+        key = "p/locks/reembed.json"
+        data = json.dumps({"created_at": 0}).encode()
+        fake_minio.objects[key].data = data
+        with locks.ingest_lock("p", wait=0):
+            pass
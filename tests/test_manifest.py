@@ -0,0 +1,42 @@
+from common.s3.manifest import diff_manifest, load_manifest, save_manifest
+
+MANIFEST = {
+    "commit": "c1",
+    "tenancy": "collection",
+    "files": {
+        "a.py": {"sha": "1", "points": ["p1", "p2"]},
+        "b.py": {"sha": "2", "points": ["p3"]},
+        "gone.py": {"sha": "3", "points": ["p4"]},
+    },
+}
+
+
+def test_diff_finds_changed_added_and_removed():
+    old_files, changed, removed = diff_manifest(MANIFEST, {"a.py": "1", "b.py": "22", "new.py": "4"})
+    assert old_files is MANIFEST["files"]
+    assert changed == {"b.py", "new.py"}
+    assert removed == ["gone.py"]
+
+
+def test_full_diff_changes_every_file():
+    _, changed, removed = diff_manifest(MANIFEST, {"a.py": "1", "b.py": "2"}, full=True)
+    assert changed == {"a.py", "b.py"}
+    assert removed == ["gone.py"]
+
+
+def test_first_ingest_without_manifest():
+    assert diff_manifest({}, {"a.py": "1"}) == ({}, {"a.py"}, [])
+
+
+def test_other_tenancy_reindexes_without_old_points():
+    old_files, changed, removed = diff_manifest(MANIFEST, {"a.py": "1", "b.py": "2"}, tenancy="shared")
+    assert changed == {"a.py", "b.py"}
+    assert removed == ["gone.py"]
+    assert all(info["points"] == [] for info in old_files.values())
+    assert MANIFEST["files"]["a.py"]["points"] == ["p1", "p2"]
+
+
+def test_manifest_round_trip(fake_minio):
+    assert load_manifest("p") == {}
+    save_manifest("p", MANIFEST)
+    assert load_manifest("p") == MANIFEST
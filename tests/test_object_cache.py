@@ -0,0 +1,86 @@
+import io
+
+import pytest
+from minio.error import S3Error
+
+from common.s3.cache import ObjectCache
+
+
+@pytest.fixture
+def client(fake_minio):
+    fake_minio.put_object("test", "k", io.BytesIO(b"0123456789"), 10)
+    return fake_minio
+
+
+def put(client, key, data):
+    client.put_object("test", key, io.BytesIO(data), len(data))
+
+
+def gets(client):
+    return [call for call in client.calls if call[0] == "get"]
+
+
+def test_mutable_object_is_revalidated_by_etag(client):
+    cache = ObjectCache(revalidate_after=0)
+    assert cache.get(client, "test", "k") == b"0123456789"
+    # ETag совпал — MinIO отвечает 304, отдаём копию из кэша
+    assert cache.get(client, "test", "k") == b"0123456789"
+    put(client, "k", b"new")
+    assert cache.get(client, "test", "k") == b"new"
+    stats = cache.stats()
+    assert (stats["misses"], stats["revalidated"], stats["refreshed"]) == (1, 1, 1)
+    assert len(gets(client)) == 3
+
+
+def test_recently_checked_object_is_not_revalidated(client):
+    cache = ObjectCache(revalidate_after=60)
+    cache.get(client, "test", "k")
+    put(client, "k", b"new")
+    assert cache.get(client, "test", "k") == b"0123456789"
+    cache.invalidate("test", "k")
+    assert cache.get(client, "test", "k") == b"new"
+
+
+def test_immutable_object_and_ranges(client):
+    cache = ObjectCache(revalidate_after=0)
+    assert cache.get(client, "test", "k", 2, 3, immutable=True) == b"234"
+    assert cache.get(client, "test", "k", 2, 3, immutable=True) == b"234"
+    assert cache.get(client, "test", "k", 5, 2, immutable=True) == b"56"
+    assert len(gets(client)) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_deleted_object_is_not_served(client):
+    cache = ObjectCache(revalidate_after=0)
+    cache.get(client, "test", "k")
+    client.remove_object("test", "k")
+    with pytest.raises(S3Error):
+        cache.get(client, "test", "k")
+    assert cache.stats()["entries"] == 0
+
+
+def test_size_limit_evicts_least_recent(client):
+    cache = ObjectCache(max_bytes=40, revalidate_after=60)
+    for key in "abcd":
+        put(client, key, key.encode() * 10)
+        cache.get(client, "test", key)
+    cache.get(client, "test", "a")
+    put(client, "e", b"e" * 10)
+    cache.get(client, "test", "e")
+    stats = cache.stats()
+    assert (stats["entries"], stats["size_bytes"], stats["evictions"]) == (4, 40, 1)
+    client.calls.clear()
+    cache.get(client, "test", "a")
+    cache.get(client, "test", "b")
+    assert gets(client) == [("get", "b", 0, 0)]
+
+
+def test_disk_tier_survives_restart(client, tmp_path):
+    cache = ObjectCache(disk_dir=str(tmp_path))
+    cache.get(client, "test", "k", immutable=True)
+    restarted = ObjectCache(disk_dir=str(tmp_path))
+    client.calls.clear()
+    assert restarted.get(client, "test", "k", immutable=True) == b"0123456789"
+    assert gets(client) == []
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["disk_size_bytes"] == 10
@@ -0,0 +1,127 @@
+import zlib
+
+import pytest
+
+from common.ast.fragments import line_offsets
+from common.s3 import pack
+
+DATA = b"first\nsecond\r\nthird\n\nlast"
+
+
+def make_entry(data, encoding):
+    offsets = line_offsets(data)
+    body = zlib.compress(data) if encoding == "zlib" else data
+    entry = {"offset": 100, "length": len(body), "size": len(data), "encoding": encoding,
+             "lines": [end - start for start, end in zip(offsets, offsets[1:])]}
+    return entry, b"x" * 100 + body
+
+
+@pytest.fixture(params=["raw", "zlib"])
+def packed(request, monkeypatch):
+    entry, blob = make_entry(DATA, request.param)
+    reads = []
+
+    def read_cached(key, offset=0, length=0, immutable=True):
+        reads.append((offset, length))
+        return blob[offset:offset + length]
+
+    monkeypatch.setattr(pack, "_read_cached", read_cached)
+    return {"pack": "p"}, entry, reads
+
+
+def test_entry_line_offsets():
+    entry, _ = make_entry(DATA, "raw")
+    assert pack.entry_line_offsets(entry) == line_offsets(DATA)
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (1, 1, b"first\n"),
+    (2, 3, b"second\r\nthird\n"),
+    (4, 5, b"\nlast"),
+    (5, 9, b"last"),
+    (0, 1, b"first\n"),
+    (7, 9, b""),
+])
+def test_read_range(packed, start, end, expected):
+    pointer, entry, _ = packed
+    assert pack.read_range(pointer, entry, start, end) == expected
+
+
+def test_read_range_raw_reads_only_the_span(monkeypatch):
+    entry, blob = make_entry(DATA, "raw")
+    reads = []
+    monkeypatch.setattr(pack, "_read_cached", lambda key, offset=0, length=0, immutable=True:
+                        reads.append((offset, length)) or blob[offset:offset + length])
+    pack.read_range({"pack": "p"}, entry, 3, 3)
+    assert reads == [(100 + DATA.index(b"third"), len(b"third\n"))]
+
+
+def test_read_ranges(packed):
+    pointer, entry, reads = packed
+    spans = [(1, 2), (3, 3), (5, 5), (8, 8)]
+    assert pack.read_ranges(pointer, entry, spans) == [b"first\nsecond\r\n", b"third\n", b"last", b""]
+    if entry["encoding"] == "zlib":
+        # сжатый файл читается один раз на все диапазоны
+        assert len(reads) == 1
+
+
+@pytest.fixture
+def project(tmp_path, fake_minio):
+    import uuid
+    files = {f"pkg/mod{i:02}.py": f"def f{i}():\n    return {i}\n".encode() * (i + 1) for i in range(30)}
+    for path, data in files.items():
+        (tmp_path / "pkg").mkdir(exist_ok=True)
+        (tmp_path / path).write_bytes(data)
+    return str(uuid.uuid4()), tmp_path, files
+
+
+def puts(fake_minio):
+    return [call[1] for call in fake_minio.calls if call[0] == "put" and call[1].endswith(".pack")]
+
+
+def hashes_of(files):
+    import hashlib
+    return {path: hashlib.sha1(data).hexdigest() for path, data in files.items()}
+
+
+def test_write_and_read_pack(project, fake_minio):
+    project_id, root, files = project
+    pointer = pack.write_pack(project_id, "c1", str(root), hashes_of(files), segment_files=4)
+    pack.publish_pack(project_id, pointer)
+    assert len(puts(fake_minio)) == len(pointer["segments"]) > 1
+    for path, data in files.items():
+        assert pack.read_file(project_id, path) == data
+    assert pack.read_lines(project_id, "pkg/mod03.py", 3, 4) == b"def f3():\n    return 3\n"
+
+
+def test_incremental_pack_rewrites_only_changed_segments(project, fake_minio):
+    project_id, root, files = project
+    first = pack.write_pack(project_id, "c1", str(root), hashes_of(files), segment_files=4)
+    pack.publish_pack(project_id, first)
+
+    files["pkg/mod07.py"] = b"changed = True\n"
+    (root / "pkg/mod07.py").write_bytes(files["pkg/mod07.py"])
+    fake_minio.calls.clear()
+    second = pack.write_pack(project_id, "c2", str(root), hashes_of(files), previous=first, segment_files=4)
+    assert len(puts(fake_minio)) == 1
+    assert len(set(second["segments"]) - set(first["segments"])) == 1
+
+    pack.publish_pack(project_id, second)
+    # прежний индекс и заменённый сегмент удалены, общие сегменты остались
+    removed = {call[1] for call in fake_minio.calls if call[0] == "remove"}
+    assert removed == (set(first["segments"]) - set(second["segments"])) | {first["index"]}
+    for path, data in files.items():
+        assert pack.read_file(project_id, path) == data
+
+
+def test_discard_keeps_published_objects(project, fake_minio):
+    project_id, root, files = project
+    first = pack.write_pack(project_id, "c1", str(root), hashes_of(files), segment_files=4)
+    pack.publish_pack(project_id, first)
+    (root / "pkg/mod00.py").write_bytes(b"x = 1\n")
+    files["pkg/mod00.py"] = b"x = 1\n"
+    pending = pack.write_pack(project_id, "c2", str(root), hashes_of(files), previous=first, segment_files=4)
+    pack.discard_pack(project_id, pending)
+    assert all(key in fake_minio.objects for key in first["segments"] + [first["index"]])
+    assert not set(pending["segments"]) - set(first["segments"]) & set(fake_minio.objects)
+    assert pending["index"] not in fake_minio.objects
@@ -0,0 +1,25 @@
+import io
+
+from common.s3.projects import delete_project_objects, snapshot_prefix
+
+URL = "https://example.com/org/repo.git"
+
+
+def put(fake_minio, key):
+    fake_minio.put_object("test", key, io.BytesIO(b"x"), 1)
+
+
+def test_delete_project_objects(fake_minio):
+    keys = ["p1/manifest.json", "p1/packs/current.json", "p1/packs/segments/a.pack", "p1/identifiers/c.json.gz"]
+    for key in keys + ["p2/manifest.json", snapshot_prefix(URL) + "c.json.gz"]:
+        put(fake_minio, key)
+    assert delete_project_objects("p1") == len(keys)
+    assert set(fake_minio.objects) == {"p2/manifest.json", snapshot_prefix(URL) + "c.json.gz"}
+
+
+def test_delete_project_objects_with_snapshots(fake_minio):
+    for key in ["p1/manifest.json", snapshot_prefix(URL) + "c.json.gz", snapshot_prefix(URL) + "shards/s.json.gz",
+                snapshot_prefix(URL + "2") + "c.json.gz"]:
+        put(fake_minio, key)
+    assert delete_project_objects("p1", repo_url=URL) == 3
+    assert set(fake_minio.objects) == {snapshot_prefix(URL + "2") + "c.json.gz"}
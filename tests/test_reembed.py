@@ -0,0 +1,86 @@
+import uuid
+
+import numpy as np
+import pytest
+
+pytest.importorskip("requests")
+
+from common.ast import chunking  # noqa: E402
+from common.embeddings import reembed as reembed_module  # noqa: E402
+from common.embeddings.reembed import fragment_texts, reembed  # noqa: E402
+from common.qdrant.base import get_qdrant_connection  # noqa: E402
+from common.qdrant.tenancy import collection_for, ensure_project_collection  # noqa: E402
+from common.qdrant.versions import collection_model, resolve  # noqa: E402
+from common.s3 import pack  # noqa: E402
+from common.s3.manifest import load_manifest, save_manifest  # noqa: E402
+from qdrant_client.models import PointStruct  # noqa: E402
+
+SOURCE = b"def first():\n    return 1\n\n\ndef second():\n    return 2\n"
+
+
+class StubEncoder:
+    model_name = "stub-model"
+    variant = "torch"
+
+    def encode(self, texts):
+        return np.array([[float(len(text)), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def project(tmp_path, fake_minio, monkeypatch):
+    monkeypatch.setattr(reembed_module, "get_embedding_cache", lambda: None)
+    # окна фрагментов по оценке, без загрузки токенизатора
+    monkeypatch.setattr(chunking, "_tokenizer", chunking.estimate_tokens)
+    project_id = str(uuid.uuid4())
+    (tmp_path / "mod.py").write_bytes(SOURCE)
+    pack.publish_pack(project_id, pack.write_pack(project_id, "c1", str(tmp_path), {"mod.py": "sha"}))
+
+    # файлы без точек не перекодируются
+    manifest = {"commit": "c1", "files": {"mod.py": {"sha": "sha", "points": ["?"]}, "empty.py": {"points": []}}}
+    texts = fragment_texts(project_id, manifest)
+    assert len(texts) == 2
+    manifest["files"]["mod.py"]["points"] = list(texts)
+    save_manifest(project_id, manifest)
+
+    collection = ensure_project_collection(project_id, tenancy="collection", model="old-model", variant="torch", dim=2)
+    points = [PointStruct(id=pid, vector=[1.0, 0.0], payload={"path": "mod.py"}) for pid in texts]
+    # точка, фрагмента которой в исходниках уже нет
+    points.append(PointStruct(id=str(uuid.uuid4()), vector=[0.0, 1.0], payload={"path": "old.py"}))
+    get_qdrant_connection().upsert(collection, points=points, wait=True)
+    return project_id, texts
+
+
+def test_reembed_switches_alias_to_new_version(project):
+    project_id, texts = project
+    base = collection_for(project_id, "collection")
+    target = reembed(base, [project_id], "stub-model", "collection", rate=0, encoder=StubEncoder(), keep_old=True)
+
+    assert resolve(base, refresh=True) == target
+    assert collection_model(target) == ("stub-model", "torch", 3)
+    points, _ = get_qdrant_connection().scroll(target, with_vectors=True, with_payload=True)
+    # косинусная коллекция хранит нормированные векторы
+    expected = {pid: len(text) / np.hypot(len(text), 1.0) for pid, text in texts.items()}
+    assert {str(point.id): point.vector[0] for point in points} == pytest.approx(expected)
+    assert all(point.payload == {"path": "mod.py"} for point in points)
+
+
+def test_reembed_repeats_project_reindexed_meanwhile(project, fake_minio, monkeypatch):
+    project_id, _ = project
+    calls = []
+    original = reembed_module.reembed_project
+
+    def reembed_project(*args, **kwargs):
+        # повтор идёт под маркером перекодировки: ингест не сохранит манифест
+        calls.append(f"{project_id}/locks/reembed.json" in fake_minio.objects)
+        stats = original(*args, **kwargs)
+        if len(calls) == 1:
+            manifest = load_manifest(project_id)
+            save_manifest(project_id, {**manifest, "commit": "c2"})
+        return stats
+
+    monkeypatch.setattr(reembed_module, "reembed_project", reembed_project)
+    base = collection_for(project_id, "collection")
+    target = reembed(base, [project_id], "stub-model", "collection", rate=0, encoder=StubEncoder(), keep_old=True)
+    assert calls == [False, True]
+    assert get_qdrant_connection().count(target).count == 2
+    assert f"{project_id}/locks/reembed.json" not in fake_minio.objects
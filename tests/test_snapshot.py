@@ -0,0 +1,113 @@
+import os
+
+import pytest
+from git import Repo
+
+from common.ast import snapshot as snap
+
+URL = "https://example.com/org/repo.git"
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = Repo.init(tmp_path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "test")
+        config.set_value("user", "email", "test@example.com")
+    return repo
+
+
+def commit(repo, files: dict):
+    for path, text in files.items():
+        full = os.path.join(repo.working_tree_dir, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w") as f:
+            f.write(text)
+    repo.index.add(list(files))
+    repo.index.commit("change")
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    calls = []
+    parse_file = snap.parse_file
+
+    def counting(file_path):
+        calls.append(os.path.basename(file_path))
+        return parse_file(file_path)
+
+    monkeypatch.setattr(snap, "parse_file", counting)
+    return calls
+
+
+FILES = {f"pkg/mod{i:02}.py": f"def f{i}():\n    return {i}\n" for i in range(40)}
+
+
+def test_plan_shards_is_stable_under_insertion():
+    paths = [f"pkg/m{i:04}.py" for i in range(2000)]
+    before = snap.plan_shards(paths, 16)
+    after = snap.plan_shards(paths + ["pkg/m0500a.py"], 16)
+    assert [p for shard in before for p in shard] == sorted(paths)
+    assert len({tuple(s) for s in before} - {tuple(s) for s in after}) == 1
+    assert max(len(s) for s in before) <= 4 * 16
+
+
+def test_build_and_read(fake_minio, repo, parsed):
+    commit(repo, FILES)
+    index = snap.build_snapshot(URL, repo.working_tree_dir, workers=1, shard_files=4)
+    snap.save_snapshot(URL, index)
+    loaded = snap.load_snapshot(URL, index["commit"])
+    files = loaded["files"]
+    assert len(parsed) == 40 and len(files) == 40
+    assert list(files) == sorted(FILES)
+    assert files["pkg/mod07.py"]["symbols"][0]["name"] == "f7"
+    assert files.shas()["pkg/mod07.py"] == files["pkg/mod07.py"]["sha"]
+    assert "pkg/nope.py" not in files
+
+
+def test_incremental_build_parses_only_changed_files(fake_minio, repo, parsed):
+    commit(repo, FILES)
+    first = snap.build_snapshot(URL, repo.working_tree_dir, workers=1, shard_files=4)
+    snap.save_snapshot(URL, first)
+    commit(repo, {"pkg/mod07.py": "def changed():\n    pass\n", "pkg/new.py": "class New:\n    pass\n"})
+    parsed.clear()
+    puts = len([c for c in fake_minio.calls if c[0] == "put"])
+
+    previous = snap.latest_snapshot(URL)["files"]
+    second = snap.build_snapshot(URL, repo.working_tree_dir, previous, workers=1, shard_files=4)
+    assert sorted(parsed) == ["mod07.py", "new.py"]
+    # переписаны только шарды с изменёнными файлами
+    assert len([c for c in fake_minio.calls if c[0] == "put"]) - puts <= 2
+    assert len(set(second["shards"]) - set(first["shards"])) <= 2
+
+    files = snap.SnapshotFiles(URL, second)
+    assert files["pkg/mod07.py"]["symbols"][0]["name"] == "changed"
+    assert files["pkg/new.py"]["symbols"][0]["name"] == "New"
+    assert files["pkg/mod08.py"] == previous["pkg/mod08.py"]
+
+
+def test_shard_cache_is_bounded(fake_minio, repo, monkeypatch):
+    commit(repo, FILES)
+    index = snap.build_snapshot(URL, repo.working_tree_dir, workers=1, shard_files=4)
+    monkeypatch.setattr(snap, "SNAPSHOT_SHARD_CACHE", 2)
+    files = snap.SnapshotFiles(URL, index)
+    for _, file in files.items():
+        assert "symbols" in file
+        assert len(files._cache) <= 2
+
+
+def test_prune_keeps_referenced_shards(fake_minio, repo, monkeypatch):
+    monkeypatch.setattr(snap, "SNAPSHOT_SHARD_GRACE", -1)
+    indexes = []
+    for i in range(3):
+        commit(repo, {f"pkg/mod{i:02}.py": f"x = {i}\n" for i in range(40)} if i else FILES)
+        previous = snap.latest_snapshot(URL)
+        indexes.append(snap.build_snapshot(URL, repo.working_tree_dir, previous and previous["files"],
+                                           workers=1, shard_files=4))
+        snap.save_snapshot(URL, indexes[-1])
+    snap.prune_snapshots(URL, keep=1)
+    assert snap.load_snapshot(URL, indexes[0]["commit"]) is None
+    files = snap.load_snapshot(URL, indexes[-1]["commit"])["files"]
+    assert all(file["sha"] for _, file in files.items())
+    shards = [k for k in fake_minio.objects if "/shards/" in k]
+    assert len(shards) == len(set(indexes[-1]["shards"]))
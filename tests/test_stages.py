@@ -0,0 +1,66 @@
+import time, threading
+
+import pytest
+
+from common.pipeline.stages import iter_batches, staged, iter_processes
+
+
+def test_iter_batches():
+    assert list(iter_batches(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(iter_batches([], 3)) == []
+
+
+def test_staged_keeps_order_and_drops_none():
+    result = list(staged(range(10), lambda x: x * 2, lambda x: None if x % 4 else x, maxsize=2))
+    assert result == [0, 4, 8, 12, 16]
+
+
+def test_staged_backpressure_bounds_read_ahead():
+    produced = []
+    lock = threading.Lock()
+
+    def source():
+        for i in range(100):
+            with lock:
+                produced.append(i)
+            yield i
+
+    items = staged(source(), lambda x: x, maxsize=2)
+    assert next(items) == 0
+    time.sleep(0.3)
+    with lock:
+        # источник ждёт на полных очередях: по maxsize элементов на очередь, плюс по одному в руках
+        assert len(produced) <= 2 * 2 + 3
+    items.close()
+
+
+def test_staged_propagates_stage_error():
+    def fail(x):
+        if x == 3:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError, match="boom"):
+        list(staged(range(10), fail))
+
+
+def test_staged_propagates_source_error():
+    def source():
+        yield 1
+        raise RuntimeError("source")
+
+    with pytest.raises(RuntimeError, match="source"):
+        list(staged(source(), lambda x: x))
+
+
+def test_staged_early_exit_stops_threads():
+    before = threading.active_count()
+    for item in staged(iter(range(10 ** 6)), lambda x: x, maxsize=2):
+        if item == 5:
+            break
+    assert threading.active_count() == before
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_processes_keeps_order(workers):
+    assert list(iter_processes(pow, range(10), 2, workers=workers)) == [i * i for i in range(10)]
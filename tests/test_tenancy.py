@@ -0,0 +1,27 @@
+import uuid
+
+from common.qdrant.tenancy import tenant_point_id, tenant_payload, tenant_filter
+
+PROJECT = "8a6e0804-2bd0-4672-b79d-d97027f9071a"
+
+
+def test_tenant_point_id_collection_keeps_id():
+    assert tenant_point_id(PROJECT, "abc", tenancy="collection") == "abc"
+    assert tenant_point_id(PROJECT, None, tenancy="shared") is None
+
+
+def test_tenant_point_id_shared_is_stable_per_project():
+    first = tenant_point_id(PROJECT, "abc", tenancy="shared")
+    assert first == str(uuid.uuid5(uuid.UUID(PROJECT), "abc"))
+    assert first == tenant_point_id(uuid.UUID(PROJECT), "abc", tenancy="shared")
+    assert first != tenant_point_id(str(uuid.uuid4()), "abc", tenancy="shared")
+
+
+def test_tenant_payload_and_filter():
+    assert tenant_payload(PROJECT, "abc", tenancy="collection") == {}
+    assert tenant_payload(PROJECT, "abc", tenancy="shared") == {"project_id": PROJECT, "local_id": "abc"}
+    assert tenant_filter(PROJECT, None, tenancy="collection") is None
+    condition = tenant_filter(PROJECT, None, tenancy="shared").must[0]
+    assert (condition.key, condition.match.value) == ("project_id", PROJECT)
+
+
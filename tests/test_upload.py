@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from common.qdrant import upload
+from common.qdrant.upload import PointUploader
+
+
+class FakeClient:
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def upsert(self, collection_name, points, wait):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("qdrant недоступен")
+            self.calls.append(([point.id for point in points], wait))
+
+
+def points(start, count):
+    return [PointStruct(id=i, vector=[1.0, 0.0], payload={"n": i}) for i in range(start, start + count)]
+
+
+def test_batches_are_sent_without_wait_and_flush_sets_barrier():
+    client = FakeClient()
+    with PointUploader(client, "c", batch_size=4, parallel=2) as uploader:
+        uploader.add(points(0, 6))
+        uploader.add(points(6, 4))
+        uploader.flush()
+
+    *batches, barrier = client.calls
+    assert all(not wait for _, wait in batches)
+    assert sorted(i for ids, _ in batches for i in ids) == list(range(10))
+    assert sorted(len(ids) for ids, _ in batches) == [2, 4, 4]
+    # барьер повторяет последнюю отправленную пачку с wait=True
+    assert barrier[1] is True
+    assert barrier[0] in [ids for ids, _ in batches]
+
+
+def test_flush_without_points_sends_nothing():
+    client = FakeClient()
+    with PointUploader(client, "c") as uploader:
+        uploader.flush()
+    assert client.calls == []
+
+
+def test_failed_batch_is_retried(monkeypatch):
+    monkeypatch.setattr(upload, "QDRANT_UPLOAD_BACKOFF", 0)
+    client = FakeClient(failures=2)
+    with PointUploader(client, "c", batch_size=3, parallel=1, retries=2) as uploader:
+        uploader.add(points(0, 3))
+        uploader.flush()
+    assert client.calls == [([0, 1, 2], False), ([0, 1, 2], True)]
+
+
+def test_exhausted_retries_surface_on_flush(monkeypatch):
+    monkeypatch.setattr(upload, "QDRANT_UPLOAD_BACKOFF", 0)
+    client = FakeClient(failures=5)
+    with PointUploader(client, "c", batch_size=3, parallel=1, retries=1) as uploader:
+        uploader.add(points(0, 3))
+        with pytest.raises(ConnectionError):
+            uploader.flush()
+
+
+def test_points_are_visible_after_flush():
+    client = QdrantClient(":memory:")
+    client.create_collection("c", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+    with PointUploader(client, "c", batch_size=8, parallel=3) as uploader:
+        for start in range(0, 50, 5):
+            uploader.add(points(start, 5))
+        uploader.flush()
+    assert client.count("c").count == 50
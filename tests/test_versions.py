@@ -0,0 +1,16 @@
+from common.qdrant.versions import version_name, parse_version, base_name
+
+PROJECT = "8a6e0804-2bd0-4672-b79d-d97027f9071a"
+
+
+def test_version_name_roundtrip():
+    name = version_name("documents", "sentence-transformers/all-MiniLM-L6-v2", "onnx-int8", 384)
+    assert name == "documents__sentence-transformers--all-MiniLM-L6-v2__onnx-int8__384"
+    assert parse_version(name) == ("documents", "sentence-transformers/all-MiniLM-L6-v2", "onnx-int8", 384)
+    assert base_name(name) == "documents"
+
+
+def test_unversioned_names():
+    assert parse_version(PROJECT) is None
+    assert parse_version("a__b__c__dim") is None
+    assert base_name(PROJECT) == PROJECT
@@ -1,4 +1,4 @@
-import uuid
+import uuid, logging
 from typing import List
 
 from fastapi import FastAPI, Depends, HTTPException, Response
@@ -11,6 +11,8 @@ from common.auth.dependency import security
 from common.database.dependency import get_db
 from common.schemas.user import User
 from common.schemas.project import Project
+from common.qdrant.tenancy import delete_project_points
+from common.s3.projects import delete_project_objects
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -117,6 +119,17 @@ def delete_project(
     )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        # коллекция проекта или его точки в общей коллекции (QDRANT_TENANCY)
+        delete_project_points(project_id)
+    except Exception as e:
+        logging.error(f"Не удалось удалить точки проекта {project_id} из Qdrant: {e}")
+    try:
+        # снимки репозитория удаляем, только если он не подключён другим проектом
+        shared = db.query(Project).filter(Project.name == project.name, Project.id != project.id).first()
+        delete_project_objects(str(project_id), repo_url=None if shared else project.name)
+    except Exception as e:
+        logging.error(f"Не удалось удалить объекты проекта {project_id} из MinIO: {e}")
     db.delete(project)
     db.commit()
     return Response(status_code=204)
@@ -1,6 +1,7 @@
 import ast
 import dis
 import git
+import types
 import yaml
 import dotenv
 from pathlib import Path
@@ -13,6 +14,7 @@ from app.adapters.base import LanguageAdapter
 from app.adapters.python_adapter import PythonAdapter
 from app.adapters.cpp_adapter import CppAdapter
 from common.neo4j.base import get_neo4j_connection
+from common.ast.symbols import is_toplevel, enclosing
 
 driver = get_neo4j_connection()
 G = nx.MultiDiGraph()
@@ -110,52 +112,112 @@ def ingest_code(base_path: Path, adapter: LanguageAdapter, project_uuid: str):
 
                         add_edge(G, owner, vid, "defines_variable", project_uuid)
 
+def ingest_python(base_path: Path, snapshot: dict, project_uuid: str):
+    """То же, что ingest_code с PythonAdapter, но по общему снимку разбора без ast.parse"""
+    adapter = PythonAdapter()
+    for rel_path, file in tqdm(snapshot["files"].items(), desc="Python files", unit="file"):
+        path = base_path / rel_path
+        rel = Path(rel_path)
+        mid = adapter.module_id(rel)
+        add_node(G, "Module", mid, project_uuid, path=str(rel))
+        symbols = file.get("symbols", [])
+
+        # --- 1.1 Ингест классов ---
+        for sym in symbols:
+            if sym["kind"] == "ClassDef":
+                cid = f"class:{sym['name']}@{mid}"
+                add_node(G, "Class", cid, project_uuid, name=sym["name"], lineno=sym["lineno"])
+                add_edge(G, mid, cid, "defines_class", project_uuid)
+
+        # --- 1.2 Ингест функций и методов ---
+        for sym in symbols:
+            if sym["kind"] == "ClassDef":
+                continue
+            fid = f"func:{sym['name']}@{mid}"
+            add_node(G, "Function", fid, project_uuid, name=sym["name"], lineno=sym["lineno"])
+
+            # определяем область: метод класса или свободная функция
+            parent = enclosing(symbols, sym["parent"], ("ClassDef",))
+            if parent is not None:
+                cid = f"class:{symbols[parent]['name']}@{mid}"
+                add_edge(G, cid, fid, "defines_method", project_uuid)
+            else:
+                add_edge(G, mid, fid, "defines", project_uuid)
+
+            # извлечение байткода: extract_metrics нужно только имя функции
+            try:
+                mets = adapter.extract_metrics(path, types.SimpleNamespace(name=sym["name"]), fid)
+                bytecode_sample = mets.get('bytecode_sample')
+                cyclo = mets.get('cyclomatic_complexity')
+                if bytecode_sample is not None:
+                    print(f"[BYTECODE SAMPLE] {fid}: {bytecode_sample}")
+                    neo4j_query(
+                        "MATCH (n {id: $id}) SET n.bytecode_sample = $bc, n.cyclomatic_complexity = $cc",
+                        id=fid, bc=bytecode_sample, cc=cyclo
+                    )
+                    G.nodes[fid]['bytecode_sample'] = bytecode_sample
+                    G.nodes[fid]['cyclomatic_complexity'] = cyclo
+            except Exception as e:
+                print(f"[BYTECODE ERROR] {fid}: {e}")
+
+        # --- 1.3 Ингест переменных ---
+        for var in file.get("variables", []):
+            vid = f"variable:{var['name']}@{mid}:{var['lineno']}"
+            add_node(G, "Variable", vid, project_uuid, name=var["name"], lineno=var["lineno"])
+
+            # определяем область видимости переменной (async-функции, как и раньше, пропускаются)
+            owner = mid
+            scope = enclosing(symbols, var["scope"], ("FunctionDef", "ClassDef"))
+            if scope is not None:
+                kind = symbols[scope]["kind"]
+                owner = f"func:{symbols[scope]['name']}@{mid}" if kind == "FunctionDef" else f"class:{symbols[scope]['name']}@{mid}"
+            add_edge(G, owner, vid, "defines_variable", project_uuid)
+
 # --- 2. Тесты ---
-def ingest_tests(base_path: Path, project_uuid: str):
-    for path in tqdm(base_path.rglob("test_*.py"), desc="Test files", unit="file"):
-        rel = path.relative_to(base_path)
+def ingest_tests(base_path: Path, project_uuid: str, snapshot: dict):
+    test_files = [p for p in snapshot["files"] if Path(p).name.startswith("test_")]
+    for rel_path in tqdm(test_files, desc="Test files", unit="file"):
+        rel = Path(rel_path)
         mod_id = f"module:{rel}"
-        tree = ast.parse(path.read_text(encoding="utf-8"))
+        symbols = snapshot["files"][rel_path].get("symbols", [])
         add_node(G, "Module", mod_id, project_uuid, path=str(rel))
-        for node in tree.body:
-            if isinstance(node, ast.FunctionDef) and node.name.startswith("test_"):
-                tst_id = f"test:{node.name}@{mod_id}"
-                add_node(G, "TestCase", tst_id, project_uuid, name=node.name, lineno=node.lineno)
+        for idx, sym in enumerate(symbols):
+            if not is_toplevel(sym):
+                continue
+            if sym["kind"] == "FunctionDef" and sym["name"].startswith("test_"):
+                tst_id = f"test:{sym['name']}@{mod_id}"
+                add_node(G, "TestCase", tst_id, project_uuid, name=sym["name"], lineno=sym["lineno"])
                 add_edge(G, mod_id, tst_id, "defines", project_uuid)
-                for sub in ast.walk(node):
-                    if isinstance(sub, ast.Assert):
-                        step_id = f"teststep:{node.name}:{sub.lineno}@{mod_id}"
-                        add_node(G, "TestStep", step_id, project_uuid, lineno=sub.lineno)
-                        add_edge(G, tst_id, step_id, "has_step", project_uuid)
-            if isinstance(node, ast.ClassDef):
-                for m in node.body:
-                    if isinstance(m, ast.FunctionDef) and m.name == "setUp":
-                        fix_id = f"fixture:{node.name}.setUp@{mod_id}"
+                for lineno in sym.get("asserts", []):
+                    step_id = f"teststep:{sym['name']}:{lineno}@{mod_id}"
+                    add_node(G, "TestStep", step_id, project_uuid, lineno=lineno)
+                    add_edge(G, tst_id, step_id, "has_step", project_uuid)
+            if sym["kind"] == "ClassDef":
+                for m in symbols:
+                    if m["parent"] == idx and m["kind"] == "FunctionDef" and m["name"] == "setUp":
+                        fix_id = f"fixture:{sym['name']}.setUp@{mod_id}"
                         add_node(G, "Fixture", fix_id, project_uuid)
-                        add_edge(G, fix_id, f"test:{m.name}@{mod_id}", "defines_fixture", project_uuid)
+                        add_edge(G, fix_id, f"test:{m['name']}@{mod_id}", "defines_fixture", project_uuid)
 
 # --- 3. Документация ---
-def ingest_docs(base_path: Path, project_uuid: str):
-    for py in tqdm(base_path.rglob("*.py"), desc="Docstrings", unit="file"):
-        if any(p in ("__pycache__", ".ipynb_checkpoints") for p in py.parts):
-            continue
-        try:
-            tree = ast.parse(py.read_text(encoding="utf-8"), filename=str(py))
-        except Exception:
+def ingest_docs(base_path: Path, project_uuid: str, snapshot: dict):
+    for rel_path, file in tqdm(snapshot["files"].items(), desc="Docstrings", unit="file"):
+        rel = Path(rel_path)
+        if any(p in ("__pycache__", ".ipynb_checkpoints") for p in rel.parts) or "error" in file:
             continue
-        module_id = f"module:{py.relative_to(base_path)}"
-        doc = ast.get_docstring(tree)
+        module_id = f"module:{rel}"
+        doc = file.get("docstring")
         if doc:
-            nid = f"doc:module:{py.relative_to(base_path)}"
+            nid = f"doc:module:{rel}"
             add_node(G, "DocString", nid, project_uuid, text=doc)
             add_edge(G, nid, module_id, "docs", project_uuid)
-        for node in tree.body:
-            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
-                doc = ast.get_docstring(node)
+        for sym in file.get("symbols", []):
+            if is_toplevel(sym):
+                doc = sym.get("docstring")
                 if doc:
-                    kind = "Class" if isinstance(node, ast.ClassDef) else "Function"
-                    nid = f"doc:{kind.lower()}:{node.name}@{py.relative_to(base_path)}"
-                    tgt = f"{kind.lower()}:{node.name}@{module_id}"
+                    kind = "Class" if sym["kind"] == "ClassDef" else "Function"
+                    nid = f"doc:{kind.lower()}:{sym['name']}@{rel}"
+                    tgt = f"{kind.lower()}:{sym['name']}@{module_id}"
                     add_node(G, "DocString", nid, project_uuid, text=doc)
                     add_edge(G, nid, tgt, "docs", project_uuid)
     
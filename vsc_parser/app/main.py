@@ -1,11 +1,10 @@
-import os, tempfile, shutil
+import os, tempfile
 from pathlib import Path
 
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials
 from minio import Minio
 
-from git import Repo
 import networkx as nx
 
 from sqlalchemy.orm import Session
@@ -15,21 +14,25 @@ from common.database.dependency import get_db
 from common.auth.dependency import get_current_user
 from common.schemas.user import User
 from common.schemas.project import Project
+from common.vcs.clone import checkout, release
+from common.ast.snapshot import get_snapshot
 
 from app.code_parser import (
-    ingest_code,
+    ingest_python,
     ingest_tests,
     ingest_docs,
     ingest_config,
     ingest_vcs,
 )
 from app.adapters.cpp_adapter import CppAdapter
-from app.adapters.python_adapter import PythonAdapter
 
 app = FastAPI()
 
 G = nx.MultiDiGraph()
 
+# Файлы, которые читают ingest_code/tests/docs/config; история коммитов берётся из git
+SOURCE_PATTERNS = ["*.py", "*.yaml", "*.yml", "/README.md", "/.env"]
+
 
 @app.post("/parse/{project_id}")
 def parse_project(
@@ -49,13 +52,13 @@ def parse_project(
     tmpdir = tempfile.mkdtemp()
 
     try:
-        BASE = Path(tmpdir)
-        Repo.clone_from(repo_url, BASE)
+        BASE = Path(checkout(repo_url, tmpdir, SOURCE_PATTERNS))
+        # Разбор .py берём из общего снимка коммита (его же используют ingest и llm_analysis)
+        snapshot = get_snapshot(repo_url, tmpdir)
 
-        adapter = PythonAdapter()
-        ingest_code(BASE, adapter, project.id)
-        ingest_tests(BASE, project.id)
-        ingest_docs(BASE, project.id)
+        ingest_python(BASE, snapshot, project.id)
+        ingest_tests(BASE, project.id, snapshot)
+        ingest_docs(BASE, project.id, snapshot)
         ingest_config(BASE, project.id)
         ingest_vcs(BASE, project.id)  # Optionally enable
 
@@ -65,4 +68,4 @@ def parse_project(
         }
 
     finally:
-        shutil.rmtree(tmpdir)
\ No newline at end of file
+        release(repo_url, tmpdir)
\ No newline at end of file